@@ -0,0 +1,199 @@
+'''
+Interfaz de línea de comandos para la extracción de descriptores de paisaje acústico, para correr el procesamiento sin
+interfaz gráfica (por ejemplo en servidores o tareas programadas). Recibe los mismos parámetros de GUI_paisaje.py.
+
+Ejemplo:
+    python CLI_paisaje.py /datos/grabaciones --subcarpetas --salida /datos/resultados --jobs 8
+
+al usar referenciar como:
+C. Isaza, D. Duque, S. Buritica and P. Caicedo. “Automatic identification of Landscape Transformation using acoustic recordings classification”, Ecological Informatics, ISSN: 15749541. SUBMITTED 2019.
+'''
+
+import argparse
+import os
+import sys
+from multiprocessing import freeze_support
+from paisaje import *
+from salida_columnar import columnar_disponible
+from vigilancia import Vigilante, INTERVALO_VIGILANCIA, MARGEN_RECONCILIACION, leer_umbrales_previos
+
+FORMATOS = ["WAV", "8SVX", "AIFF", "AU", "FLAC", "IFF", "MOGG", "OGA", "OGG", "RAW"]
+
+def leer_argumentos(argumentos=None):
+
+    '''
+
+    Lee los argumentos de la línea de comandos
+
+    :param argumentos: recibe una lista de str con los argumentos, valor por defecto None, es decir los de sys.argv
+    :return: un argparse.Namespace con los argumentos
+    '''
+
+    parser = argparse.ArgumentParser(description="Descriptores del Paisaje Acústico")
+    parser.add_argument("carpeta", help="carpeta con las grabaciones")
+    parser.add_argument("--subcarpetas", action="store_true", help="buscar grabaciones en las subcarpetas")
+    parser.add_argument("--formato", default="WAV", type=str.upper, choices=FORMATOS,
+                        help="formato de las grabaciones (por defecto WAV)")
+    parser.add_argument("--canal", default="1", help="canal a analizar, empezando en 1 (por defecto 1)")
+    parser.add_argument("--descriptores", default="indices", choices=["indices", "psd"],
+                        help="tipo de descriptores (por defecto indices)")
+    parser.add_argument("--indices", default="",
+                        help="índices a calcular separados por comas, por ejemplo ACIft,ADI,BNF,ADIm (por defecto todos)")
+    parser.add_argument("--ventana", default="512", help="tamaño de la ventana para la PSD (por defecto 512)")
+    parser.add_argument("--barrido-ventanas", metavar="V1,V2,...",
+                        help="barrido de la PSD: tamaños de ventana separados por comas; cada grabación se lee una sola "
+                             "vez y se escribe una salida <nombre>_v<ventana>_<fmin>-<fmax> por configuración")
+    parser.add_argument("--barrido-bandas", metavar="FMIN-FMAX,...",
+                        help="barrido de la PSD: bandas del filtro separadas por comas, por ejemplo 1000-11250,2000-8000 "
+                             "(por defecto la de --fmin y --fmax)")
+    parser.add_argument("--fmin", default="1000", help="frecuencia mínima del filtro de la PSD en Hz (por defecto 1000)")
+    parser.add_argument("--fmax", default="11250",
+                        help="frecuencia máxima del filtro de la PSD en Hz (por defecto 11250)")
+    parser.add_argument("--grabaciones-diarias", default="144", dest="grabxdia",
+                        help="número de grabaciones diarias esperadas (por defecto 144)")
+    parser.add_argument("--recalcular-std", action="store_true",
+                        help="recalcular los parámetros de estandarización de los índices")
+    parser.add_argument("--salida", required=True, help="carpeta donde se guardan los resultados")
+    parser.add_argument("--nombre", default="Salida", help="nombre de los archivos de salida (por defecto Salida)")
+    parser.add_argument("--jobs", default=str(os.cpu_count() or 1),
+                        help="número de procesos trabajadores; con 1 todo se calcula en este proceso "
+                             "(por defecto el número de núcleos)")
+    parser.add_argument("--lote-stft", type=int, default=1, metavar="K",
+                        help="calcular juntas las transformadas de K grabaciones del mismo tamaño en cada trabajador; "
+                             "conviene con muchas grabaciones cortas (por defecto 1, grabación por grabación)")
+    parser.add_argument("--float32", action="store_const", const="float32", default="float64", dest="precision",
+                        help="calcular en precisión simple: la mitad de la memoria por grabación, con diferencias "
+                             "menores en los índices (ver benchmark_paisaje.py --precision)")
+    parser.add_argument("--cribado", metavar="Km|Ns",
+                        help="cribado rápido de lluvia: estimar la PSD de lluvia con K minutos repartidos en cada "
+                             "grabación (por ejemplo 3m) o con sus primeros N segundos (por ejemplo 20s), y leer "
+                             "completas solo las grabaciones que pasan el umbral (ver benchmark_paisaje.py --cribado)")
+    parser.add_argument("--bloques", action="store_true",
+                        help="leer las grabaciones por bloques de un minuto guardando solo el canal analizado (menos "
+                             "memoria en grabaciones multicanal)")
+    parser.add_argument("--cache", default=RUTA_CACHE, help="ruta del caché de resultados (por defecto " + RUTA_CACHE + ")")
+    parser.add_argument("--sin-cache", action="store_true", help="no usar el caché de resultados")
+    parser.add_argument("--columnar", choices=["feather", "parquet"],
+                        help="escribir también los descriptores por grabación y los promedios diarios en "
+                             "<nombre>_columnar, agregando cada carpeta al terminarla (requiere pyarrow)")
+    parser.add_argument("--estadisticas", metavar="ARCHIVO",
+                        help="agregar las grabaciones nuevas a las estadísticas incrementales del archivo (se crea si "
+                             "no existe, con los nombres de las grabaciones en ARCHIVO.grabaciones) y estandarizar con "
+                             "ellas en lugar de los parámetros fijos")
+    parser.add_argument("--vigilar", action="store_true",
+                        help="quedarse vigilando las carpetas y procesar cada grabación al llegar; cada día se publica "
+                             "en <nombre>_tiempo_real.jsonl al completar las grabaciones diarias (Ctrl+C para "
+                             "terminar)")
+    parser.add_argument("--intervalo", type=float, default=INTERVALO_VIGILANCIA, metavar="SEG",
+                        help="segundos entre revisiones de las carpetas en --vigilar (por defecto " +
+                             str(INTERVALO_VIGILANCIA) + ")")
+    parser.add_argument("--calentamiento", type=int, metavar="N",
+                        help="en --vigilar, grabaciones de una carpeta necesarias para estimar su umbral de lluvia "
+                             "(por defecto las grabaciones diarias)")
+    parser.add_argument("--umbral-previo", metavar="VALOR|ARCHIVO",
+                        help="en --vigilar, umbral de lluvia a usar durante el calentamiento: un número, o el archivo "
+                             "<nombre>_umbrales.json de una ejecución anterior con el umbral de cada carpeta")
+    parser.add_argument("--margen-reconciliacion", type=float, default=MARGEN_RECONCILIACION, metavar="M",
+                        help="en --vigilar, distancia relativa al umbral con la que una grabación se revisa al "
+                             "reconciliar (por defecto " + str(MARGEN_RECONCILIACION) + ")")
+    parser.add_argument("--reanudar", action="store_true",
+                        help="no procesar de nuevo las carpetas con punto de control de una ejecución anterior")
+    parser.add_argument("--perfil", action="store_true",
+                        help="medir el tiempo de la lectura, las transformadas y cada índice por grabación y guardar "
+                             "los percentiles en <nombre>_perfil.json")
+    parser.add_argument("--perfil-memoria", action="store_true",
+                        help="como --perfil, midiendo también la memoria máxima de cada paso (mucho más lento)")
+    parser.add_argument("--cprofile", action="store_true",
+                        help="ejecutar cProfile sobre la primera grabación y guardar las estadísticas en "
+                             "<nombre>_perfil.prof")
+    return parser.parse_args(argumentos)
+
+def main(argumentos=None):
+
+    '''
+
+    Valida los parámetros y ejecuta el procesamiento completo
+
+    :param argumentos: recibe una lista de str con los argumentos, valor por defecto None, es decir los de sys.argv
+    :return: entero con el código de salida del programa (0 si terminó correctamente)
+    '''
+
+    args = leer_argumentos(argumentos)
+    extension = '.' + args.formato.lower()
+    indices = args.descriptores == "indices"
+    barrido = args.barrido_ventanas is not None or args.barrido_bandas is not None
+    ventana = args.ventana
+
+    try:
+        if args.columnar is not None and not columnar_disponible():
+            raise ValueError("La salida columnar requiere pyarrow")
+        if barrido:
+            if indices:
+                raise ValueError("El barrido solo se puede usar con los descriptores psd")
+            ventanas, bandas = validar_barrido(args.barrido_ventanas or args.ventana,
+                                               args.barrido_bandas or args.fmin + "-" + args.fmax)
+            #Con la ventana más grande se valida que ninguna supere la mitad de la frecuencia de muestreo
+            ventana = str(ventanas[-1])
+        if args.vigilar and barrido:
+            raise ValueError("La vigilancia no se puede usar con el barrido")
+        #Opciones del procesamiento por lotes que la vigilancia no usa
+        opciones_lote = {"--columnar": args.columnar is not None, "--lote-stft": args.lote_stft != 1,
+                         "--perfil": args.perfil, "--perfil-memoria": args.perfil_memoria, "--cprofile": args.cprofile,
+                         "--reanudar": args.reanudar, "--recalcular-std": args.recalcular_std}
+        if args.vigilar and any(opciones_lote.values()):
+            raise ValueError("La vigilancia no se puede usar con " +
+                             ", ".join(opcion for opcion, usada in opciones_lote.items() if usada))
+        #La carpeta vigilada puede empezar vacía; las carpetas se buscan en cada revisión
+        carpetas, parametros = validar_parametros(args.subcarpetas, args.carpeta, extension, args.canal, indices,
+                                                  args.fmin, args.fmax, ventana, args.salida, args.grabxdia,
+                                                  args.jobs, args.indices, requiere_grabaciones=not args.vigilar)
+        umbral_previo = None if args.umbral_previo is None else leer_umbrales_previos(args.umbral_previo)
+        cribado = None if args.cribado is None else validar_cribado(args.cribado)
+        if cribado is not None and (barrido or args.vigilar or args.perfil or args.perfil_memoria):
+            raise ValueError("El cribado rápido no se puede usar con el barrido, la vigilancia ni el perfil")
+        if args.estadisticas is not None:
+            if barrido:
+                raise ValueError("Las estadísticas incrementales no se pueden usar con el barrido")
+            abrir_estadisticas(args.estadisticas, parametros, args.precision, cribado)
+    except ValueError as error:
+        print(error, file=sys.stderr)
+        return 2
+
+    ruta_salida = args.salida + '/' + args.nombre
+    ruta_cache = None if args.sin_cache else args.cache
+
+    if args.vigilar:
+        vigilante = Vigilante(args.carpeta, args.subcarpetas, parametros, ruta_salida, int(args.jobs), args.bloques,
+                              ruta_cache, args.precision, args.estadisticas, args.calentamiento, umbral_previo,
+                              args.margen_reconciliacion)
+        print("Vigilando " + args.carpeta + ", los días se publican en " + ruta_salida + "_tiempo_real.jsonl")
+        vigilante.vigilar(args.intervalo)
+        return 0
+
+    if barrido:
+        try:
+            procesar_barrido(carpetas, parametros, ventanas, bandas, ruta_salida, int(args.jobs), args.bloques,
+                             args.precision)
+        except PermissionError:
+            print("No se pudo escribir una salida del barrido, cierre los archivos excel", file=sys.stderr)
+            return 1
+
+        print("Barrido guardado correctamente en " + ruta_salida + "_v*")
+        return 0
+
+    try:
+        procesar_lote(carpetas, parametros, ruta_salida, args.recalcular_std, int(args.jobs), args.bloques, ruta_cache,
+                      args.reanudar, args.perfil, args.cprofile,
+                      args.perfil_memoria, args.lote_stft, args.precision, args.columnar, args.estadisticas, cribado)
+    except PermissionError:
+        print("No se pudo escribir " + ruta_salida + ".xlsx, cierre el archivo excel y use --reanudar",
+              file=sys.stderr)
+        return 1
+
+    print("Descriptores guardados correctamente en " + ruta_salida)
+    return 0
+
+if __name__ == '__main__':
+
+    freeze_support()
+    sys.exit(main())
@@ -12,7 +12,10 @@ from multiprocessing import Process, Queue, Event, freeze_support
 from queue import Empty
 import os
 import glob
-from paisaje import *
+from cache_descriptores import RUTA_CACHE
+from servidor_etapas import servidor_etapas, Etapa
+
+# Las librerías de cálculo (paisaje.py) solo se importan en el servidor de etapas, para que la ventana abra rápido
 
 salida = Queue()
 param = Queue()
@@ -21,6 +24,10 @@ malas = Queue()
 fin_proc = Event()
 leer_excel = Event()
 leer_excel.set()
+etapas = Queue()
+compartidos = {"salida": salida, "param": param, "avance": avance, "malas": malas, "fin_proc": fin_proc,
+               "leer_excel": leer_excel}
+servidor = None
 procesos = []
 mensajes = []
 
@@ -47,12 +54,19 @@ def admin_procesos(avance, param, salida, malas, procesos, mensajes, fin_proc, l
 
         p_actual, valor = avance.get()
 
+        # Si el paso terminó antes de que la barra leyera todos sus mensajes de avance (por ejemplo, cuando las
+        # grabaciones salen del caché o de un punto de control), se descartan hasta llegar al mensaje final
+        while p_actual >= 0 and valor not in (0, None):
+            p_actual, valor = avance.get()
+
         if p_actual == -2:
             mensaje_error("Cierre el archivo excel para continuar")
             fin_proc.clear()
             leer_excel.set()
 
         if p_actual == -1:
+            if valor is not None:
+                mensaje_error(valor)
             prog_cont["text"] = "Progreso"
             prog_bar.stop()
             procesos.clear()
@@ -64,118 +78,21 @@ def admin_procesos(avance, param, salida, malas, procesos, mensajes, fin_proc, l
         p_actual += 1
 
         if p_actual == 1:
-            global carpetas
             carpetas = salida.get(0)
-
-            msj_ad = " 1/1"
-            if len(carpetas) > 1:
-                msj_ad = " 1/" + str(len(carpetas))
-
-            canal, indices, tipo_ventana, tamano_ventana, sobreposicion, nfft, fmin, fmax, grabxdia, extension = param.get(
-                0)
-            param.put(
-                (canal, indices, tipo_ventana, tamano_ventana, sobreposicion, nfft, fmin, fmax, grabxdia, extension, 0))
-            grabaciones = glob.glob(carpetas[0] + '/*' + extension)
-            salida.put(grabaciones)
+            parametros = param.get(0)
+            extension = parametros[-1]
+            ngrabaciones = sum(len(glob.glob(carpeta + '/*' + extension)) for carpeta in carpetas)
+            param.put(parametros)
+            salida.put(carpetas)
             procesos[p_actual].start()
             fin_proc.clear()
             prog_bar.stop()
             prog_bar["mode"] = "determinate"
             prog_bar["value"] = 0
-            prog_bar["maximum"] = len(grabaciones)
-            prog_cont["text"] = mensajes[p_actual] + msj_ad
-
-        elif p_actual == 2:
-            canal, indices, tipo_ventana, tamano_ventana, sobreposicion, nfft, fmin, fmax, grabxdia, extension, \
-            cod_car = param.get(0)
-            param.put((canal, indices, tipo_ventana, tamano_ventana, sobreposicion, nfft, fmin, fmax, grabxdia,
-                       extension, cod_car))
-
-            msj_ad = " " + str(cod_car + 1) + "/" + str(len(carpetas))
-
-            sal = salida.get()
-            salida.put(sal)
-            procesos[p_actual].start()
-            fin_proc.clear()
-            prog_bar.stop()
-            prog_bar["mode"] = "determinate"
-            prog_bar["value"] = 0
-            prog_bar["maximum"] = len(sal)
-            prog_cont["text"] = mensajes[p_actual] + msj_ad
-
-        elif p_actual == 3:
-            canal, indices, tipo_ventana, tamano_ventana, sobreposicion, nfft, fmin, fmax, grabxdia, extension, cod_car = param.get(
-                0)
-            param.put((canal, indices, tipo_ventana, tamano_ventana, sobreposicion, nfft, fmin, fmax, grabxdia,
-                       extension, cod_car))
-
-            msj_ad = " " + str(cod_car + 1) + "/" + str(len(carpetas))
+            prog_bar["maximum"] = ngrabaciones
+            prog_cont["text"] = mensajes[p_actual] + " (" + str(len(carpetas)) + " carpetas)"
 
-            procesos[p_actual].start()
-            fin_proc.clear()
-            prog_bar.stop()
-            prog_bar["value"] = 0
-            prog_bar["maximum"] = 100
-            prog_bar["mode"] = "indeterminate"
-            prog_cont["text"] = mensajes[p_actual] + msj_ad
-            prog_bar.start()
-
-        elif p_actual == 4:
-            canal, indices, tipo_ventana, tamano_ventana, sobreposicion, nfft, fmin, fmax, grabxdia, extension, c_actual = param.get(
-                0)
-
-            sal = salida.get(0)
-            grab_malas = malas.get(0)
-
-            if "df" not in globals():
-                global df
-                df = sal[0]
-
-            else:
-                df = pd.concat([df, sal[0]])
-
-            sal = (df, )
-
-            if "gm_df" not in globals():
-                global gm_df
-                gm_df = grab_malas
-            else:
-                gm_df = pd.concat([gm_df, grab_malas], ignore_index=True)
-
-            if c_actual < len(carpetas) - 1:
-                msj_ad = " " + str(c_actual + 2) + "/" + str(len(carpetas))
-                p_actual = 1
-                param.put((canal, indices, tipo_ventana, tamano_ventana, sobreposicion, nfft, fmin, fmax, grabxdia,
-                           extension, c_actual + 1))
-                grabaciones = glob.glob(carpetas[c_actual + 1] + '/*' + extension)
-                salida.put(grabaciones)
-                procesos[p_actual] = Process(target=algoritmo_lluvia,
-                                             args=(avance, param, salida, malas, p_actual, fin_proc))
-                procesos[p_actual + 1] = Process(target=calcular_descriptores,
-                                                 args=(avance, param, salida, malas, p_actual + 1, fin_proc))
-                procesos[p_actual + 2] = Process(target=promedios_diarios,
-                                                 args=(avance, param, salida, malas, p_actual + 2, fin_proc))
-                procesos[p_actual].start()
-                fin_proc.clear()
-                prog_bar.stop()
-                prog_bar["mode"] = "determinate"
-                prog_bar["value"] = 0
-                prog_bar["maximum"] = len(grabaciones)
-                prog_cont["text"] = mensajes[p_actual] + msj_ad
-
-            else:
-                malas.put(gm_df)
-                salida.put(sal)
-                procesos[p_actual].start()
-                fin_proc.clear()
-                prog_bar.stop()
-                prog_bar["value"] = 0
-                prog_bar["maximum"] = 100
-                prog_bar["mode"] = "indeterminate"
-                prog_cont["text"] = mensajes[p_actual]
-                prog_bar.start()
-
-        elif p_actual in range(5, len(procesos)):
+        elif p_actual in range(2, len(procesos)):
             procesos[p_actual].start()
             fin_proc.clear()
             prog_bar.stop()
@@ -192,7 +109,6 @@ def admin_procesos(avance, param, salida, malas, procesos, mensajes, fin_proc, l
             mensaje_error("Descriptores guardados correctamente")
             procesos.clear()
             mensajes.clear()
-            del df, gm_df
             fin_proc.clear()
             return
 
@@ -219,12 +135,14 @@ def cambio_descriptor(*args):
 
     if ftip_var.get() == "PSD":
         std_check['state'] = "disabled"
+        ind_entry['state'] = "disabled"
         win_entry['state'] = "normal"
         fmin_entry['state'] = "normal"
         fmax_entry['state'] = 'normal'
 
     else:
         std_check['state'] = "normal"
+        ind_entry['state'] = "normal"
         win_entry['state'] = "disabled"
         fmin_entry['state'] = "disabled"
         fmax_entry['state'] = 'disabled'
@@ -265,15 +183,24 @@ def ejecutar_programa(avance, param, salida, malas, fin_proc, read_excel, proces
     carpeta_salida = sal_entry.get()
     nombre_salida = nom_entry.get()
     subcarpetas = bool(sub_var.get())
+    nprocesos_str = nproc_entry.get()
+    indices_str = ind_entry.get()
+
+    reanudar = bool(rean_var.get())
 
     ruta_salida = carpeta_salida + '/' + nombre_salida
+    #Las estadísticas incrementales se guardan junto a las salidas, para que cada ejecución con el mismo nombre las
+    #actualice
+    ruta_estadisticas = ruta_salida + "_estadisticas.json" if est_var.get() else None
 
     param.put((subcarpetas, carpeta_grabaciones, extension, canal_str, indices, fmin_str, fmax_str, tamano_ventana_str,
-               carpeta_salida, grabxdia_str))
+               carpeta_salida, grabxdia_str, nprocesos_str, indices_str))
 
     nproc = 0
 
-    val_proc = Process(target=validar_entradas, args=(avance, param, salida, nproc, fin_proc))
+    iniciar_servidor()
+
+    val_proc = Etapa(etapas, compartidos, "validar_entradas", (avance, param, salida, nproc, fin_proc))
     val_proc.start()
     procesos.append(val_proc)
     prog_cont["text"] = "Verificando entradas"
@@ -281,28 +208,22 @@ def ejecutar_programa(avance, param, salida, malas, fin_proc, read_excel, proces
     prog_bar.start()
     nproc += 1
 
-    lluvia_proc = Process(target=algoritmo_lluvia, args=(avance, param, salida, malas, nproc, fin_proc))
-    procesos.append(lluvia_proc)
-    mensajes.append("Corriendo algoritmo de lluvia...")
-    nproc += 1
-
-    desc_proc = Process(target=calcular_descriptores, args=(avance, param, salida, malas, nproc, fin_proc))
-    procesos.append(desc_proc)
-    mensajes.append("Calculando descriptores...")
-    nproc += 1
-
-    prom_proc = Process(target=promedios_diarios, args=(avance, param, salida, malas, nproc, fin_proc))
-    procesos.append(prom_proc)
-    mensajes.append("Calculando promedios diarios...")
+    lote_proc = Etapa(etapas, compartidos, "lote_descriptores",
+                      (avance, param, salida, malas, nproc, fin_proc, ruta_salida, reanudar),
+                      dict(opciones_procesamiento(), ruta_estadisticas=ruta_estadisticas))
+    procesos.append(lote_proc)
+    mensajes.append("Corriendo algoritmo de lluvia y calculando descriptores...")
     nproc += 1
 
     if indices:
-        rec_proc = Process(target=estandarizar, args=(rec_std, avance, salida, nproc, fin_proc))
+        rec_proc = Etapa(etapas, compartidos, "estandarizar", (rec_std, avance, salida, nproc, fin_proc),
+                         {"ruta_estadisticas": ruta_estadisticas})
         procesos.append(rec_proc)
         mensajes.append("Estandarizando...")
         nproc += 1
 
-    esc_proc = Process(target=escribir_salida, args=(avance, salida, malas, ruta_salida, nproc, fin_proc, read_excel))
+    esc_proc = Etapa(etapas, compartidos, "escribir_salida",
+                     (avance, salida, malas, ruta_salida, nproc, fin_proc, read_excel))
     procesos.append(esc_proc)
     mensajes.append("Escribiendo archivos de salida...")
 
@@ -328,134 +249,108 @@ def escoger_carpeta(boton):
         sal_entry.delete(0, END)
         sal_entry.insert(0, ruta)
 
-def mensaje_error(mensaje):
-
-    '''
-    Esta función es invocada cuando se presenta un error en el programa. Muestra una ventana con el mensaje de error
+def leer_nprocesos():
 
-    :param mensaje: Str con el mensaje de error a mostrar
-    :return: None
     '''
 
-    error_ven = Tk()
-    error_ven.withdraw()
-    messagebox.showinfo("Aviso", mensaje)
-    error_ven.destroy()
-
-def salir(procesos):
+    Esta función lee el número de procesos trabajadores ingresado en la interfaz. Si el valor no es válido retorna 1;
+    validar_entradas (paisaje.py) se encarga de avisar al usuario.
 
+    :return: entero con el número de procesos trabajadores
     '''
 
-    Esta función es invocada cuando el programa es cerrado por el usuario.
+    nprocesos_str = nproc_entry.get()
 
-    :param procesos: recibe una lista con los procesos
-    :return: None
-    '''
+    if nprocesos_str.isnumeric() and int(nprocesos_str) > 0:
+        return int(nprocesos_str)
 
-    for process in procesos:
-        if process.is_alive():
-            process.terminate()
-    ven_pri.destroy()
+    return 1
 
-def validar_entradas(avance, param, salida, cod_proc, fin_proc):
+def opciones_procesamiento():
 
     '''
-    Esta función verifica que los valores ingresados en la interfaz sean correctos
 
-    :param avance: recibe un Queue para indicar a la barra de progreso el avance del procedimiento
-    :param param: recibe un Queue con parámetros necesarios para el siguiente proceso
-    :param salida: recibe un Queue que guarda la salida del proceso
-    :param cod_proc: recibe un entero con el código del proceso
-    :param fin_proc: recibe un Event que indica si el proceso actual terminó
-    :return: retorna None
-    '''
+    Esta función reúne las opciones de procesamiento ingresadas en la interfaz, para pasarlas como argumentos de palabra
+    clave a la etapa que procesa las carpetas
 
-    subcarpetas, carpeta_grabaciones, extension, canal_str, indices, fmin_str, fmax_str, tamano_ventana_str, \
-    carpeta_salida, grabxdia_str = param.get(0)
+    :return: diccionario con el número de procesos trabajadores, si se lee solo el canal analizado, la ruta del
+             caché de resultados (None si no se usa), la precisión del cálculo y el formato de la salida columnar (None
+             si no se escribe)
+    '''
 
-    if not subcarpetas:
+    ruta_cache = RUTA_CACHE if cache_var.get() else None
+    precision = "float32" if simple_var.get() else "float64"
+    formato_columnar = "feather" if col_var.get() else None
+    return {"nprocesos": leer_nprocesos(), "streaming": bool(bloq_var.get()), "ruta_cache": ruta_cache,
+            "precision": precision, "formato_columnar": formato_columnar}
 
-        grabaciones = glob.glob(carpeta_grabaciones + '/*' + extension)
+def limpiar_cache():
 
-        if len(grabaciones) == 0:
-            mensaje_error("No se encontraron grabaciones")
-            fin_proc.set()
-            avance.put((-1, None))
-            return
+    '''
 
-        carpetas = [carpeta_grabaciones]
+    Esta función es invocada por el botón para limpiar el caché. Elimina todos los resultados guardados, de modo que en
+    el siguiente procesamiento se calculan de nuevo todas las grabaciones
 
-    else:
+    :return: None
+    '''
 
-        carpetas = []
+    from paisaje import abrir_cache
 
-        for root, dirs, files in os.walk(carpeta_grabaciones):
-            for file in files:
-                if extension in file:
-                    carpetas.append(root)
-                    break
+    cache = abrir_cache(RUTA_CACHE)
+    cache.limpiar()
+    cache.cerrar()
+    messagebox.showinfo("Caché", "Se eliminaron los resultados guardados")
 
-    if len(carpetas) == 0:
-        mensaje_error("No se encontraron grabaciones")
-        fin_proc.set()
-        avance.put((-1, None))
-        return
+def mensaje_error(mensaje):
 
-    grabaciones = glob.glob(carpetas[0] + '/*' + extension)
+    '''
+    Esta función es invocada cuando se presenta un error en el programa. Muestra una ventana con el mensaje de error
 
+    :param mensaje: Str con el mensaje de error a mostrar
+    :return: None
+    '''
 
-    for grab in grabaciones:
-        try:
-            x, Fs = sf.read(grab)
-            break
-        except:
-            pass
+    error_ven = Tk()
+    error_ven.withdraw()
+    messagebox.showinfo("Aviso", mensaje)
+    error_ven.destroy()
 
-    if not (canal_str+grabxdia_str+fmin_str+fmax_str+tamano_ventana_str).isnumeric():
-        mensaje_error("Ingrese valores numéricos")
-        fin_proc.set()
-        avance.put((-1, None))
-        return
+def salir(procesos):
 
-    canal = int(canal_str) - 1
+    '''
 
-    if len(x.shape) <= canal:
-        mensaje_error("No existe el canal " + str(canal + 1))
-        fin_proc.set()
-        avance.put((-1, None))
-        return
+    Esta función es invocada cuando el programa es cerrado por el usuario.
 
-    tipo_ventana = "hann"
-    sobreposicion = 0
-    tamano_ventana = int(tamano_ventana_str)
-    fmin = int(fmin_str)
-    fmax = int(fmax_str)
+    :param procesos: recibe una lista con los pasos de la ejecución en curso (vacía si no hay ninguna)
+    :return: None
+    '''
 
-    if indices:
-        tamano_ventana = 1024
+    if servidor is not None and servidor.is_alive():
+        if procesos:
+            servidor.terminate()
+        else:
+            etapas.put(None)
+            servidor.join(5)
+            if servidor.is_alive():
+                servidor.terminate()
+    ven_pri.destroy()
 
-    else:
-        if tamano_ventana > Fs // 2:
-            mensaje_error("Ventana demasiado grande")
-            fin_proc.set()
-            avance.put((-1, None))
-            return
+def iniciar_servidor():
 
-    nfft = tamano_ventana
+    '''
 
-    if not os.path.isdir(carpeta_salida):
-        mensaje_error("Ingrese un directorio de salida válido")
-        fin_proc.set()
-        avance.put((-1, None))
+    Esta función inicia el proceso servidor que ejecuta los pasos del procesamiento, si no está corriendo. El servidor
+    se mantiene entre ejecuciones, con las librerías de cálculo ya importadas y el Pool de procesos trabajadores ya
+    creado
 
-        return
+    :return: None
+    '''
 
-    grabxdia = int(grabxdia_str)
+    global servidor
 
-    salida.put(carpetas)
-    param.put((canal, indices, tipo_ventana, tamano_ventana, sobreposicion, nfft, fmin, fmax, grabxdia, extension))
-    fin_proc.set()
-    avance.put((cod_proc, None))
+    if servidor is None or not servidor.is_alive():
+        servidor = Process(target=servidor_etapas, args=(etapas, compartidos, leer_nprocesos()))
+        servidor.start()
 
 #------------------------------------- Fin Funciones de la Interfaz Gráfica -------------------------------------------#
 
@@ -466,7 +361,7 @@ if __name__ == '__main__': #Se utiliza este if para poder usar varios procesos.
     freeze_support() #Para correr el programa sin problemas como ejecutable
 
     ANCHO = 500
-    ALTO = 450
+    ALTO = 565
     PAD = 7
 
     # Ventana principal
@@ -524,6 +419,10 @@ if __name__ == '__main__': #Se utiliza este if para poder usar varios procesos.
     std_check = Checkbutton(ind_cont, text="Recalcular parámetros para\n estandarización", justify=LEFT, \
                                  variable=std_var, state="normal")
     std_check.pack()
+    ind_lab = Label(ind_cont, text="Calcular solo (vacío = todos):")
+    ind_lab.pack()
+    ind_entry = Entry(ind_cont, width=28, justify=CENTER)
+    ind_entry.pack()
 
     # Frame para configuración de PSD
     psd_cont = LabelFrame(conf_cont, text=" PSD ")
@@ -548,6 +447,30 @@ if __name__ == '__main__': #Se utiliza este if para poder usar varios procesos.
 
     cambio_descriptor()
 
+    # Frame para configuración del procesamiento en paralelo
+    proc_cont = LabelFrame(ven_pri, text=" Procesamiento ")
+    proc_cont.pack(fill=X, padx=PAD, pady=PAD)
+    nproc_lab = Label(proc_cont, text="Procesos en paralelo:")
+    nproc_lab.pack(side=LEFT)
+    nproc_entry = Entry(proc_cont, width=5, justify=CENTER)
+    nproc_entry.insert(0, str(os.cpu_count() or 1))
+    nproc_entry.pack(side=LEFT)
+    cache_var = IntVar(value=1)
+    cache_check = Checkbutton(proc_cont, text="Usar caché", variable=cache_var, state="normal")
+    cache_check.pack(side=LEFT, padx=PAD)
+    cache_bot = Button(proc_cont, text="Limpiar caché", command=limpiar_cache)
+    cache_bot.pack(side=LEFT, padx=PAD)
+
+    # Frame para las opciones que reducen la memoria por grabación
+    mem_cont = LabelFrame(ven_pri, text=" Memoria ")
+    mem_cont.pack(fill=X, padx=PAD, pady=PAD)
+    bloq_var = IntVar()
+    bloq_check = Checkbutton(mem_cont, text="Leer solo el canal analizado", variable=bloq_var, state="normal")
+    bloq_check.pack(side=LEFT)
+    simple_var = IntVar()
+    simple_check = Checkbutton(mem_cont, text="Precisión simple (float32)", variable=simple_var, state="normal")
+    simple_check.pack(side=LEFT, padx=PAD)
+
     # Frame para carpeta de salida
     scarp_cont = LabelFrame(ven_pri, text=" Carpeta de Salida ")
     scarp_cont.pack(fill=X, side=TOP, padx=PAD, pady=PAD)
@@ -564,7 +487,16 @@ if __name__ == '__main__': #Se utiliza este if para poder usar varios procesos.
     nom_entry = Entry(sal_cont, justify=CENTER)
     nom_entry.insert(0, "Salida")
     nom_entry.pack(side=LEFT)
-    cor_bot = Button(sal_cont, text="Iniciar", width=30,
+    rean_var = IntVar()
+    rean_check = Checkbutton(sal_cont, text="Reanudar", variable=rean_var, state="normal")
+    rean_check.pack(side=LEFT)
+    col_var = IntVar()
+    col_check = Checkbutton(sal_cont, text="Feather", variable=col_var, state="normal")
+    col_check.pack(side=LEFT)
+    est_var = IntVar()
+    est_check = Checkbutton(sal_cont, text="Estadísticas incrementales", variable=est_var, state="normal")
+    est_check.pack(side=LEFT)
+    cor_bot = Button(sal_cont, text="Iniciar", width=12,
                      command= lambda : ejecutar_programa(avance, param, salida, malas, fin_proc, leer_excel, procesos, mensajes))
     cor_bot.pack(expand=True)
 
@@ -574,6 +506,7 @@ if __name__ == '__main__': #Se utiliza este if para poder usar varios procesos.
     prog_bar = Progressbar(prog_cont, orient="horizontal", mode="indeterminate")
     prog_bar.pack(fill=X, padx=PAD)
     ven_pri.protocol("WM_DELETE_WINDOW", lambda : salir(procesos))
+    ven_pri.after(100, iniciar_servidor)
     ven_pri.mainloop()
 
 #--------------------------------------------- Fin Interfaz Gráfica ---------------------------------------------------#
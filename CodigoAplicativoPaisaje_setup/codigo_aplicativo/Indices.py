@@ -10,7 +10,129 @@ import math
 import numpy as np
 from scipy import signal, stats
 
-def ACItf(audio, Fs, j, s):
+class ContextoEspectral:
+
+    '''
+
+    Guarda los productos espectrales de una grabación para que cada transformada se calcule una sola vez, aunque varios
+    índices la necesiten. Cada producto se calcula la primera vez que se pide:
+
+    -espectrograma: tupla (f, t, s) con el espectrograma de magnitud usado por los índices, con ventanas de
+     nmin * tamano_ventana puntos, siendo nmin el número de minutos de la grabación
+    -welch: tupla (f, pxx) con la PSD de Welch usada por musicality_degree y wiener_entropy
+    -envolvente: envolvente de Hilbert calculada minuto a minuto, usada por temporal_entropy y median_envelope
+    -ruido_fondo: ruido de fondo de cada celda de frecuencia del espectrograma, usado por BNF y ADIm
+    -espectro_medio: tupla (f, mspec) con el espectro medio de la STFT (ver meanspec), usado como descriptor PSD
+
+    Todas las funciones de este módulo reciben el contexto en el argumento ctx. Si se entrega, los datos de la señal
+    que no se pasen se toman del contexto.
+
+    Los contextos de varias grabaciones del mismo tamaño y frecuencia de muestreo se pueden crear con lote, que calcula
+    las transformadas de todas en una sola llamada.
+
+    Los productos conservan la precisión de la señal: con una señal float32 los espectrogramas y las PSD son float32 y
+    las transformadas intermedias complex64, con la mitad de la memoria de float64.
+    '''
+
+    def __init__(self, audio, Fs, tipo_ventana="hann", tamano_ventana=1024, sobreposicion=0, nfft=None):
+
+        '''
+
+        :param audio: señal monoaural temporal (numpy array)
+        :param Fs: frecuencia de muestreo en Hz (int)
+        :param tipo_ventana: tipo de ventana, valor por defecto "hann" (str)
+        :param tamano_ventana: tamaño de la ventana, valor por defecto 1024 (int)
+        :param sobreposicion: puntos de solapamiento entre ventanas, valor por defecto 0 (int)
+        :param nfft: número de puntos de la transformada de Fourier, valor por defecto, None, es decir el mismo de
+                     tamano_ventana (int)
+        '''
+
+        self.audio = audio
+        self.Fs = Fs
+        self.tipo_ventana = tipo_ventana
+        self.tamano_ventana = tamano_ventana
+        self.sobreposicion = sobreposicion
+        self.nfft = tamano_ventana if nfft is None else nfft
+        self.nmin = len(audio) // (60 * Fs)
+        self._espectrograma = None
+        self._welch = None
+        self._envolvente = None
+        self._ruido_fondo = None
+        self._espectro_medio = None
+
+    @classmethod
+    def lote(cls, audios, Fs, tipo_ventana="hann", tamano_ventana=1024, sobreposicion=0, nfft=None,
+             productos=("espectrograma",)):
+
+        '''
+
+        Crea los contextos de varias grabaciones del mismo tamaño. Los productos pedidos se calculan para todas las
+        grabaciones en una sola llamada a scipy, sobre la matriz con una grabación por fila; el resultado de cada fila
+        es el mismo de calcularla por separado.
+
+        :param audios: matriz con una señal monoaural por fila (numpy array de dos dimensiones)
+        :param productos: productos que se calculan en lote: "espectrograma", "welch" y/o "espectro_medio", valor por
+                          defecto solo el espectrograma (tuple)
+        Los demás parámetros son los mismos del constructor
+        :return: lista con el contexto de cada fila
+        '''
+
+        contextos = [cls(audio, Fs, tipo_ventana, tamano_ventana, sobreposicion, nfft) for audio in audios]
+        ctx = contextos[0]
+
+        if "espectrograma" in productos:
+            f, t, s = signal.spectrogram(audios, Fs, window=tipo_ventana, nperseg=ctx.nmin * ctx.tamano_ventana,
+                                         mode="magnitude", noverlap=sobreposicion, nfft=ctx.nmin * ctx.nfft)
+            for k, contexto in enumerate(contextos):
+                contexto._espectrograma = (f, t, s[k])
+
+        if "welch" in productos:
+            f, pxx = signal.welch(audios, Fs, nperseg=ctx.tamano_ventana, nfft=ctx.nfft, window=tipo_ventana,
+                                  noverlap=sobreposicion)
+            for k, contexto in enumerate(contextos):
+                contexto._welch = (f, pxx[k])
+
+        if "espectro_medio" in productos:
+            f, mspec = meanspec(audios, Fs, tipo_ventana, sobreposicion, ctx.tamano_ventana, ctx.nfft)
+            for k, contexto in enumerate(contextos):
+                contexto._espectro_medio = (f, mspec[k])
+
+        return contextos
+
+    @property
+    def espectrograma(self):
+        if self._espectrograma is None:
+            self._espectrograma = signal.spectrogram(self.audio, self.Fs, window=self.tipo_ventana,
+                                                     nperseg=self.nmin * self.tamano_ventana, mode="magnitude",
+                                                     noverlap=self.sobreposicion, nfft=self.nmin * self.nfft)
+        return self._espectrograma
+
+    @property
+    def welch(self):
+        if self._welch is None:
+            self._welch = signal.welch(self.audio, self.Fs, nperseg=self.tamano_ventana, nfft=self.nfft,
+                                       window=self.tipo_ventana, noverlap=self.sobreposicion)
+        return self._welch
+
+    @property
+    def envolvente(self):
+        if self._envolvente is None:
+            self._envolvente = hilbert_envelope(self.audio, self.Fs)
+        return self._envolvente
+
+    @property
+    def ruido_fondo(self):
+        if self._ruido_fondo is None:
+            self._ruido_fondo = background_noise_freq(self.espectrograma[2])
+        return self._ruido_fondo
+
+    @property
+    def espectro_medio(self):
+        if self._espectro_medio is None:
+            self._espectro_medio = meanspec(ctx=self)
+        return self._espectro_medio
+
+def ACItf(audio=None, Fs=None, j=5, s=None, ctx=None):
 
     '''
 
@@ -18,37 +140,39 @@ def ACItf(audio, Fs, j, s):
 
     :param audio: señal monoaural temporal (numpy array)
     :param Fs: frecuencia de muestreo en Hz (int)
-    :param j: tamaño de cada cluster en segundos (int)
+    :param j: tamaño de cada cluster en segundos, valor por defecto 5 (int)
     :param s: espectrograma de la señal (numpy array)
+    :param ctx: contexto espectral de la grabación, opcional (ContextoEspectral)
     :return: valor del ACItf (float)
     '''
 
+    if ctx is not None:
+        audio = ctx.audio if audio is None else audio
+        Fs = ctx.Fs if Fs is None else Fs
+        s = ctx.espectrograma[2] if s is None else s
+
     #Para comparar grabaciones con diferente duración, hacer ACItf/t
     s = s/np.amax(s)
     specrows = s.shape[0]
     speccols = s.shape[1]
 
-    dk = np.absolute(np.diff(s, axis=1)) #length speccols - 1
-
     #duracion de la grabación
     duracion = len(audio)/Fs
     m = math.ceil(duracion/j) #Número de j en total
     n = math.floor(speccols/m) #Número de tk en j
 
-    ACI = np.zeros((specrows, m))
-
-    for t in range(0, m):
-        k1 = range(n*t, n*(t+1)-1)
-        k2 = range(n*t, n*(t+1))
-        D = np.sum(dk[:, k1], axis=1)
-        ACI[:, t] = np.divide(D, np.sum(s[:, k2], axis = 1))
+    #Cada cluster ocupa n columnas consecutivas, así que s se reorganiza como (columnas del cluster, filas, clusters) y
+    #las diferencias y sumas de todos los clusters se calculan a la vez, acumulando en el mismo orden del ciclo original
+    s_clusters = np.ascontiguousarray(s[:, :m*n].reshape(specrows, m, n).transpose(2, 0, 1))
+    D = np.sum(np.absolute(np.diff(s_clusters, axis=0)), axis=0)
+    ACI = np.divide(D, np.sum(s_clusters, axis=0))
 
     ACI_dft = np.sum(ACI, axis=0)
     ACItot = sum(ACI_dft)
 
     return ACItot
 
-def ACIft(s):
+def ACIft(s=None, ctx=None):
 
     '''
 
@@ -56,14 +180,18 @@ def ACIft(s):
     [2]
 
     :param s: Espectrograma de la señal (numpy array)
+    :param ctx: contexto espectral de la grabación, opcional (ContextoEspectral)
     :return: el valor del ACIft (float)
     '''
 
+    if ctx is not None and s is None:
+        s = ctx.espectrograma[2]
+
     s = s / np.amax(s)
     ACI = np.sum(np.divide(np.absolute(np.diff(s, axis=0)), s[1:, :] + s[:-1, :]))
     return ACI
 
-def ADI(s, Fmax = 10000, wband = 1000, bn = -50):
+def ADI(s=None, Fmax = 10000, wband = 1000, bn = -50, ctx=None):
 
     '''
 
@@ -73,9 +201,13 @@ def ADI(s, Fmax = 10000, wband = 1000, bn = -50):
     :param Fmax: Frecuencia máxima para el análisis en Hz, valor por defecto 10000 (int)
     :param wband: tamaño de cada banda de frecuencia en Hz, valor por defecto 1000 (int)
     :param bn: Valor del umbral (ruido de fondo) en dBFS, valor por defecto -50 (int)
+    :param ctx: contexto espectral de la grabación, opcional (ContextoEspectral)
     :return: Valor del ADI (float)
     '''
 
+    if ctx is not None and s is None:
+        s = ctx.espectrograma[2]
+
     s = s/np.amax(s)
     bn = 10**(bn/20)
     s = s / np.amax(s)
@@ -94,7 +226,7 @@ def ADI(s, Fmax = 10000, wband = 1000, bn = -50):
     ADItot = np.sum(ADIv)
     return ADItot
 
-def ADIm(s, Fs, wband=1000):
+def ADIm(s=None, Fs=None, wband=1000, ctx=None):
 
     '''
 
@@ -103,10 +235,18 @@ def ADIm(s, Fs, wband=1000):
     :param s: Espectrograma de la señal (numpy array)
     :param Fs: Frecuencia de muestreo en Hz (int)
     :param wband: tamaño de cada banda de frecuencia en Hz, valor por defecto 1000 (int)
+    :param ctx: contexto espectral de la grabación, opcional (ContextoEspectral). Si se entrega, se reutiliza el ruido de
+                fondo ya calculado para la grabación
     :return: Un vector que contiene los valores del ADIm (numpy array)
     '''
 
-    bn = background_noise_freq(s)
+    if ctx is not None:
+        s = ctx.espectrograma[2] if s is None else s
+        Fs = ctx.Fs if Fs is None else Fs
+        bn = ctx.ruido_fondo
+    else:
+        bn = background_noise_freq(s)
+
     sclean = s - np.tile(bn, (s.shape[1], 1)).T
     sclean[sclean < 0] = 0
     sclean[sclean != 0] = 1
@@ -122,54 +262,59 @@ def ADIm(s, Fs, wband=1000):
     ADIv = -np.multiply(p, np.log(p))
     return ADIv
 
-def background_noise_freq(s):
+def background_noise_freq(s=None, ctx=None):
 
     '''
 
     Calcula el valor del ruido de fondo para cada celda del espectrograma en el eje de las frecuencias [5]
 
     :param s: Espectrograma de la señal (numpy array)
+    :param ctx: contexto espectral de la grabación, opcional (ContextoEspectral). Si se entrega, el ruido de fondo se
+                calcula una sola vez por grabación
     :return: Vector que contiene el valor del ruido de fondo para cada celda de frecuencia (numpy array)
     '''
 
-    nfbins = s.shape[0]
-    bn = np.zeros(nfbins)
-    for i in range(nfbins):
-        f = s[i, :]
-        nbins = int(s.shape[1]/8)
-        H, bin_edges = np.histogram(f, bins=nbins)
-        fwin = 5
-        nbinsn = H.size-fwin
-        sH = np.zeros(nbinsn)
+    if ctx is not None:
+        return ctx.ruido_fondo
+
+    nbins = int(s.shape[1]/8)
+    fwin = 5
+    smin = np.amin(s, axis=1)
+    smax = np.amax(s, axis=1)
+    H = histogram_rows(s, nbins)
 
-        for j in range(nbinsn):
-            sH[j] = H[j:j+fwin].sum()/fwin
+    #Suma móvil de fwin bins (convolución con una ventana rectangular), sin la última ventana como en [5]
+    sH = signal.convolve2d(H, np.ones((1, fwin), dtype=H.dtype), mode="valid")[:, :nbins - fwin] / fwin
 
-        modep = sH.argmax()
-        mode = np.amin(f) + (np.amax(f)-np.amin(f))*(modep/nbins)
+    modep = sH.argmax(axis=1)
+    mode = smin + (smax-smin)*(modep/nbins)
 
-        acum = 0
-        j = 0
-        Hmax = np.amax(sH)
-        while acum < 0.68*Hmax:
-            acum += H[j]
-            j += 1
+    #Primer bin en el que el histograma acumulado alcanza el 68% del máximo suavizado (como searchsorted en cada fila)
+    Hmax = np.amax(sH, axis=1)
+    acum = np.cumsum(H, axis=1)
+    umbral = 0.68*Hmax
+    j = np.sum(acum < umbral[:, np.newaxis], axis=1) + 1
 
-        nsd = np.amin(f) + (np.amax(f)-np.amin(f))*(j/nbins)
-        bn[i] = mode + 0.1*nsd
+    nsd = smin + (smax-smin)*(j/nbins)
+    bn = mode + 0.1*nsd
     return bn
 
-def background_noise_time(SPL, fwin):
+def background_noise_time(SPL=None, fwin=5, ctx=None):
 
     '''
 
     Calcula el valor del ruido de fondo de la señal en el tiempo [5]
 
     :param SPL: Señal con el nivel de presión sonora (SPL) de la señal en dB (numpy array)
-    :param fwin: Tamaño de la ventana temporal para el análisis (int)
+    :param fwin: Tamaño de la ventana temporal para el análisis, valor por defecto 5 (int)
+    :param ctx: contexto espectral de la grabación, opcional (ContextoEspectral). Si no se entrega SPL, se calcula con
+                wav2SPL y los valores por defecto de la grabadora
     :return: el valor de ruido de fondo en dB (float)
     '''
 
+    if ctx is not None and SPL is None:
+        SPL = wav2SPL(ctx=ctx)
+
     SPLmin = min(SPL)
     HdB, bin_edges = np.histogram(SPL, range=(SPLmin, SPLmin + 10))
     sHdB = np.zeros((len(HdB)-fwin, 1))
@@ -181,7 +326,7 @@ def background_noise_time(SPL, fwin):
     bn = SPLmin + 0.1*modep
     return bn
 
-def beta(s, f, bio_band=(2000, 8000)):
+def beta(s=None, f=None, bio_band=(2000, 8000), ctx=None):
 
     '''
 
@@ -190,9 +335,14 @@ def beta(s, f, bio_band=(2000, 8000)):
     :param s: Espectrograma de la señal (numpy array)
     :param f: vector de frecuencias correspondientes al espectrograma s (numpy array)
     :param bio_band: tupla con la frecuencia mínima y máxima de la banda biofónica, valor por defecto: (2000, 8000) (tuple)
+    :param ctx: contexto espectral de la grabación, opcional (ContextoEspectral)
     :return: el valor de β (float)
     '''
 
+    if ctx is not None:
+        s = ctx.espectrograma[2] if s is None else s
+        f = ctx.espectrograma[0] if f is None else f
+
     minf = bio_band[0]
     maxf = bio_band[1]
     s = s/np.amax(s)
@@ -202,7 +352,7 @@ def beta(s, f, bio_band=(2000, 8000)):
     B = np.trapz(bioph_norm, f[np.logical_and(f>=minf, f<= maxf)])
     return B
 
-def crest_factor(audio, rms):
+def crest_factor(audio=None, rms=None, ctx=None):
 
     '''
 
@@ -210,16 +360,23 @@ def crest_factor(audio, rms):
     (RMS). Los valores altos indican muchos picos en la señal de energía. [7]
 
     :param audio: señal monoaural temporal (numpy array)
-    :param rms: valor RMS de la señal (float)
+    :param rms: valor RMS de la señal, si no se entrega se calcula (float)
+    :param ctx: contexto espectral de la grabación, opcional (ContextoEspectral)
     :return: retorna el factor de cresta de la señal (float)
     '''
 
+    if ctx is not None and audio is None:
+        audio = ctx.audio
+
+    if rms is None:
+        rms = math.sqrt(suma_cuadrados(audio)) #mismo cálculo de la función rms
+
     audio2 = audio ** 2
     mint = max(audio2)
     cf = mint/rms
     return cf
 
-def frequency_modulation(s):
+def frequency_modulation(s=None, ctx=None):
 
     '''
 
@@ -227,62 +384,125 @@ def frequency_modulation(s):
     abruptos en la intensidad. [8]
 
     :param s: Espectrograma de la señal (numpy array)
+    :param ctx: contexto espectral de la grabación, opcional (ContextoEspectral)
     :return: valor de la modulación frecuencial
     '''
 
+    if ctx is not None and s is None:
+        s = ctx.espectrograma[2]
+
     ds_df = np.diff(s, axis=0)
     ds_dt = np.diff(s, axis=1)
     fm = np.mean(np.absolute(np.arctan(np.divide(-ds_df[:, 1:], -ds_dt[1:, :])))*(180/math.pi))
     return fm
 
-def meanspec(audio, Fs= 1, wn="hann", ovlp=0, wl=512, nfft = None, norm=True):
+def histogram_rows(s, nbins):
 
     '''
 
-    Calcula el espectro medio haciendo el promedio en el eje de las frecuencias del espectrograma.
+    Calcula el histograma de cada fila de una matriz, con nbins bins de igual tamaño entre el mínimo y el máximo de la
+    fila. Da el mismo resultado que aplicar np.histogram(fila, bins=nbins) a cada fila, pero en una sola operación.
+
+    :param s: matriz con los datos, por ejemplo un espectrograma (numpy array)
+    :param nbins: número de bins de cada histograma (int)
+    :return: matriz con el conteo de cada bin para cada fila (numpy array)
+    '''
+
+    nfilas = s.shape[0]
+    first_edge = np.amin(s, axis=1).astype(float)
+    last_edge = np.amax(s, axis=1).astype(float)
+    constantes = first_edge == last_edge
+    first_edge[constantes] -= 0.5
+    last_edge[constantes] += 0.5
+    bin_edges = np.linspace(first_edge, last_edge, nbins + 1, axis=1)
+
+    #Igual que en np.histogram: se calcula el bin y se corrige comparando con los bordes
+    ind = ((s - first_edge[:, np.newaxis]) / (last_edge - first_edge)[:, np.newaxis] * nbins).astype(np.intp)
+    ind[ind == nbins] -= 1
+    filas = np.arange(nfilas)[:, np.newaxis]
+    ind[s < bin_edges[filas, ind]] -= 1
+    ind[(s >= bin_edges[filas, ind + 1]) & (ind != nbins - 1)] += 1
+
+    H = np.bincount((ind + filas*nbins).ravel(), minlength=nfilas*nbins).reshape(nfilas, nbins)
+    return H
+
+def hilbert_envelope(audio, Fs):
+
+    '''
+
+    Calcula la envolvente de amplitud de la señal con la transformada de Hilbert, minuto a minuto. Solo se tienen en
+    cuenta los minutos completos de la grabación.
 
     :param audio: señal monoaural temporal (numpy array)
+    :param Fs: frecuencia de muestreo en Hz (int)
+    :return: envolvente de la señal (numpy array)
+    '''
+
+    min_points = Fs*60
+    npoints = len(audio)
+    y = []
+
+    for seg in range(min_points, npoints, min_points):
+        y.append(np.abs(signal.hilbert(audio[seg - min_points:seg])))
+
+    env = np.concatenate(y)
+    return env
+
+def meanspec(audio=None, Fs= 1, wn="hann", ovlp=0, wl=512, nfft = None, norm=True, ctx=None):
+
+    '''
+
+    Calcula el espectro medio haciendo el promedio en el eje de las frecuencias del espectrograma.
+
+    :param audio: señal monoaural temporal (numpy array), o matriz con una señal del mismo tamaño por fila; en ese caso
+                  se calcula el espectro medio de cada fila
     :param Fs: frecuencia de muestreo en Hz, valor por defecto 1 (int)
     :param wn: tipo de ventana, valor por defecto "hann" (str)
     :param ovlp: puntos de solapamiento entre ventanas, valor por defecto 0 (int)
     :param wl: tamaño de la ventana, valor por defecto 512 (int)
     :param nfft: número de puntos de la transformada de Fourier, valor por defecto, None, es decir el mismo de wl (int)
     :param norm: booleano que indica si se normaliza o no el espectro, valor por defecto, True.
-    :return: señal con el espectro medio (numpy array)
+    :param ctx: contexto espectral de la grabación, opcional (ContextoEspectral). Si se entrega, la señal, la frecuencia
+                de muestreo y los parámetros de la ventana se toman del contexto
+    :return: una tupla con el vector de frecuencias y el espectro medio (numpy arrays), con una fila por señal si se
+             entregó una matriz
     '''
 
+    if ctx is not None:
+        audio, Fs, wn, ovlp, wl, nfft = ctx.audio, ctx.Fs, ctx.tipo_ventana, ctx.sobreposicion, ctx.tamano_ventana, \
+                                        ctx.nfft
+
     f, t, Zxx = signal.stft(audio, fs = Fs, window=wn, noverlap=ovlp, nperseg=wl, nfft=nfft)
-    mspec = np.mean(np.abs(Zxx), axis=1)
+    mspec = np.mean(np.abs(Zxx), axis=-1)
 
     if norm == True:
-        mspec = mspec/max(mspec)
+        mspec = mspec/np.max(mspec, axis=-1, keepdims=True)
 
     return f, mspec
 
-def median_envelope(audio, Fs, depth=16):
+def median_envelope(audio=None, Fs=None, depth=16, ctx=None):
 
     '''
 
     La mediana del envolvente de la amplitud (M)[9].
 
-    :param audio: señal monoaural temporal (numpy array)
+    :param audio: señal monoaural temporal (numpy array) o iterable con la señal de cada minuto
     :param Fs: frecuencia de muestreo en Hz (int)
     :param depth: la profundidad de digitalización de la señal, valor por defecto 16 (int)
+    :param ctx: contexto espectral de la grabación, opcional (ContextoEspectral). Si se entrega, se reutiliza la
+                envolvente ya calculada para la grabación
     :return: el valor de M (float)
     '''
 
-    min_points = Fs*60
-    npoints = len(audio)
-    y = []
-
-    for seg in range(min_points, npoints, min_points):
-        y.append(np.abs(signal.hilbert(audio[seg-min_points:seg])))
+    if ctx is not None:
+        y = ctx.envolvente
+    else:
+        y = hilbert_envelope(audio, Fs)
 
-    y = np.concatenate(y)
     M = (2**(depth-1))*np.median(y)
     return M
 
-def mid_band_activity(s, f, fmin = 450, fmax = 3500):
+def mid_band_activity(s=None, f=None, fmin = 450, fmax = 3500, ctx=None):
 
     '''
 
@@ -292,9 +512,14 @@ def mid_band_activity(s, f, fmin = 450, fmax = 3500):
     :param f: vector de frecuencias correspondientes al espectrograma s (numpy array)
     :param fmin: frecuencia inferior de la banda media en Hz, valor por defecto 450 (int)
     :param fmax: frecuencia superior de la banda media en Hz, valor por defecto 3500 (int)
+    :param ctx: contexto espectral de la grabación, opcional (ContextoEspectral)
     :return: valor de la actividad acústica en la banda media (float)
     '''
 
+    if ctx is not None:
+        s = ctx.espectrograma[2] if s is None else s
+        f = ctx.espectrograma[0] if f is None else f
+
     s = np.mean(s, axis=1)
     s = s**2
     s = s/np.amax(s)
@@ -303,7 +528,7 @@ def mid_band_activity(s, f, fmin = 450, fmax = 3500):
     MID = np.sum(s[np.logical_and(f>=fmin, f<= fmax)]>threshold)/len(s)
     return MID
 
-def musicality_degree(audio, Fs, win=256, nfft=None, type_win="hann", overlap=None):
+def musicality_degree(audio=None, Fs=None, win=256, nfft=None, type_win="hann", overlap=None, ctx=None):
 
     '''
 
@@ -315,11 +540,17 @@ def musicality_degree(audio, Fs, win=256, nfft=None, type_win="hann", overlap=No
     :param nfft: número de puntos de la transformada de Fourier, valor por defecto, None, es decir el mismo de win (int)
     :param type_win: tipo de ventana, valor por defecto "hann" (str)
     :param overlap: puntos de solapamiento entre ventanas, valor por defecto None, es decir win/2 (float)
+    :param ctx: contexto espectral de la grabación, opcional (ContextoEspectral). Si se entrega, se reutiliza la PSD de
+                Welch calculada con los parámetros de ventana del contexto
     :return: valor del grado de musicalidad (float)
     '''
 
-    f, pxx = signal.welch(audio, Fs, nperseg=win, nfft=nfft, window=type_win, noverlap=overlap)
-    f += 0.0000001
+    if ctx is not None:
+        f, pxx = ctx.welch
+    else:
+        f, pxx = signal.welch(audio, Fs, nperseg=win, nfft=nfft, window=type_win, noverlap=overlap)
+
+    f = f + 0.0000001
     lp2 = np.log10(pxx ** 2)
     lf = np.log10(f)
     dlf = np.diff(lf)
@@ -328,7 +559,7 @@ def musicality_degree(audio, Fs, win=256, nfft=None, type_win="hann", overlap=No
     md = np.mean(md_v)
     return md
 
-def NDSI(s, f, bio_band = (2000, 8000), tech_band = (200, 1500)):
+def NDSI(s=None, f=None, bio_band = (2000, 8000), tech_band = (200, 1500), ctx=None):
 
     '''
 
@@ -339,8 +570,14 @@ def NDSI(s, f, bio_band = (2000, 8000), tech_band = (200, 1500)):
     :param f: vector de frecuencias correspondientes al espectrograma s (numpy array)
     :param bio_band:  tupla con la frecuencia mínima y máxima de la banda biofónica, valor por defecto: (2000, 8000) (tuple)
     :param tech_band: tupla con la frecuencia mínima y máxima de la banda tecnofónica, valor por defecto: (200, 1500) (tuple)
+    :param ctx: contexto espectral de la grabación, opcional (ContextoEspectral)
     :return: el valor NDSI de la señal (float)
     '''
+
+    if ctx is not None:
+        s = ctx.espectrograma[2] if s is None else s
+        f = ctx.espectrograma[0] if f is None else f
+
     s = np.mean(s, axis=1)
     s = s ** 2
 
@@ -353,7 +590,7 @@ def NDSI(s, f, bio_band = (2000, 8000), tech_band = (200, 1500)):
     ND = (B-A)/(B+A)
     return ND
 
-def number_of_peaks(s, f, nedges=10):
+def number_of_peaks(s=None, f=None, nedges=10, ctx=None):
 
     '''
 
@@ -362,9 +599,14 @@ def number_of_peaks(s, f, nedges=10):
     :param s: Espectrograma de la señal (numpy array)
     :param f: vector de frecuencias correspondientes al espectrograma s (numpy array)
     :param nedges: número de partes en las que se divide la señal, por defecto 10 (int)
+    :param ctx: contexto espectral de la grabación, opcional (ContextoEspectral)
     :return: número de picos de la señal.
     '''
 
+    if ctx is not None:
+        s = ctx.espectrograma[2] if s is None else s
+        f = ctx.espectrograma[0] if f is None else f
+
     #Filtro de media móvil
     def smooth(a, n=10):
 
@@ -394,16 +636,25 @@ def number_of_peaks(s, f, nedges=10):
     step = round(len(s)/nedges)
     meansig = [np.mean(np.abs(s[j*step:(j+1)*step])) for j in range(nedges)]
 
+    meansig = np.array(meansig)
+    media_s = np.mean(s)
+    ns = len(s)
     ind = []
 
-    if s[0] > meansig[0] and s[0] > 1.2*np.mean(s) and np.mean(dsdf[1:4])<0:
+    if s[0] > meansig[0] and s[0] > 1.2*media_s and np.mean(dsdf[1:4])<0:
         ind.append(0)
 
-    for i in range(4, len(s)-3):
-        if s[i] > meansig[i%nedges] and s[i] > 1.2*np.mean(s) and np.mean(dsdf[i+1:i+4])>0 and np.mean(dsdf[i-4:i-1]) < 0:
-            ind.append(i)
-
-    if s[-1] > meansig[0] and s[-1] > 1.2*np.mean(s) and np.mean(dsdf[-4:-1]) > 0:
+    if ns > 7:
+        #Puntos interiores i = 4, ..., ns - 4. La media de la pendiente antes de i usa dsdf[i-4:i-1] y la media después
+        #usa dsdf[i+1:i+4], que en el último punto solo tiene dos valores. Las sumas se hacen en el mismo orden que
+        #np.mean para obtener exactamente los mismos valores.
+        i = np.arange(4, ns - 3)
+        antes = (dsdf[0:ns-7] + dsdf[1:ns-6] + dsdf[2:ns-5]) / 3
+        despues = np.append((dsdf[5:ns-3] + dsdf[6:ns-2] + dsdf[7:ns-1]) / 3, (dsdf[ns-3] + dsdf[ns-2]) / 2)
+        picos = (s[i] > meansig[i % nedges]) & (s[i] > 1.2*media_s) & (despues > 0) & (antes < 0)
+        ind.extend(i[picos].tolist())
+
+    if s[-1] > meansig[0] and s[-1] > 1.2*media_s and np.mean(dsdf[-4:-1]) > 0:
         ind.append(len(s)-1)
 
     if len(ind) == 0:
@@ -422,7 +673,7 @@ def number_of_peaks(s, f, nedges=10):
 
     return NP
 
-def rho(s, f, bio_band = (2000, 8000), tech_band = (200, 1500)):
+def rho(s=None, f=None, bio_band = (2000, 8000), tech_band = (200, 1500), ctx=None):
 
     '''
 
@@ -432,9 +683,14 @@ def rho(s, f, bio_band = (2000, 8000), tech_band = (200, 1500)):
     :param f: vector de frecuencias correspondientes al espectrograma s (numpy array)
     :param bio_band:  tupla con la frecuencia mínima y máxima de la banda biofónica, valor por defecto: (2000, 8000) (tuple)
     :param tech_band: tupla con la frecuencia mínima y máxima de la banda tecnofónica, valor por defecto: (200, 1500) (tuple)
+    :param ctx: contexto espectral de la grabación, opcional (ContextoEspectral)
     :return: valor de ρ (float)
     '''
 
+    if ctx is not None:
+        s = ctx.espectrograma[2] if s is None else s
+        f = ctx.espectrograma[0] if f is None else f
+
     s = np.mean(s, axis=1)
     s = s ** 2
 
@@ -447,20 +703,41 @@ def rho(s, f, bio_band = (2000, 8000), tech_band = (200, 1500)):
     P = B/A
     return P
 
-def rms(audio):
+def rms(audio=None, ctx=None):
 
     '''
 
     Calcula el valor RMS de la señal
 
     :param audio: señal monoaural temporal (numpy array)
+    :param ctx: contexto espectral de la grabación, opcional (ContextoEspectral)
     :return: valor RMS
     '''
 
-    erms = math.sqrt(sum(audio ** 2))
+    if ctx is not None and audio is None:
+        audio = ctx.audio
+
+    erms = math.sqrt(suma_cuadrados(audio))
     return erms
 
-def spectral_maxima_entropy(s, f, fmin, fmax):
+def suma_cuadrados(audio):
+
+    '''
+
+    Suma los cuadrados de las muestras de la señal, usada por rms y crest_factor. En precisión simple (float32) la suma
+    muestra a muestra acumularía el error de redondeo de millones de términos, por eso se acumula en float64.
+
+    :param audio: señal monoaural temporal (numpy array)
+    :return: la suma de los cuadrados (float)
+    '''
+
+    if audio.dtype == np.float32:
+        audio = audio.astype(np.float64)
+        return np.dot(audio, audio)
+
+    return sum(audio ** 2)
+
+def spectral_maxima_entropy(s=None, f=None, fmin=482, fmax=8820, ctx=None):
 
     '''
 
@@ -468,11 +745,16 @@ def spectral_maxima_entropy(s, f, fmin, fmax):
 
     :param s: Espectrograma de la señal (numpy array)
     :param f: vector de frecuencias correspondientes al espectrograma s (numpy array)
-    :param fmin: frecuencia inferior de la banda en la que se hará el análisis en Hz (int)
-    :param fmax: frecuencia superior de la banda en la que se hará el análisis en Hz (int)
+    :param fmin: frecuencia inferior de la banda en la que se hará el análisis en Hz, valor por defecto 482 (int)
+    :param fmax: frecuencia superior de la banda en la que se hará el análisis en Hz, valor por defecto 8820 (int)
+    :param ctx: contexto espectral de la grabación, opcional (ContextoEspectral)
     :return: valor del Hm (float)
     '''
 
+    if ctx is not None:
+        s = ctx.espectrograma[2] if s is None else s
+        f = ctx.espectrograma[0] if f is None else f
+
     s = s/np.amax(s)
     s_max = np.max(s, axis=1)
     s_band = s_max[np.logical_and(f >= fmin, f>=fmax)]
@@ -481,7 +763,7 @@ def spectral_maxima_entropy(s, f, fmin, fmax):
     Hm = -np.sum(np.multiply(s_norm, np.log2(s_norm)))/np.log2(N)
     return Hm
 
-def spectral_variance_entropy(s, f, fmin, fmax):
+def spectral_variance_entropy(s=None, f=None, fmin=482, fmax=8820, ctx=None):
 
     '''
 
@@ -489,11 +771,16 @@ def spectral_variance_entropy(s, f, fmin, fmax):
 
     :param s: Espectrograma de la señal (numpy array)
     :param f: vector de frecuencias correspondientes al espectrograma s (numpy array)
-    :param fmin: frecuencia inferior de la banda en la que se hará el análisis en Hz (int)
-    :param fmax: frecuencia superior de la banda en la que se hará el análisis en Hz (int)
+    :param fmin: frecuencia inferior de la banda en la que se hará el análisis en Hz, valor por defecto 482 (int)
+    :param fmax: frecuencia superior de la banda en la que se hará el análisis en Hz, valor por defecto 8820 (int)
+    :param ctx: contexto espectral de la grabación, opcional (ContextoEspectral)
     :return: valor del Hv (float)
     '''
 
+    if ctx is not None:
+        s = ctx.espectrograma[2] if s is None else s
+        f = ctx.espectrograma[0] if f is None else f
+
     s = s/np.amax(s)
     s_std = np.std(s, axis=1)
     s_band = s_std[np.logical_and(f >= fmin, f>=fmax)]
@@ -502,51 +789,54 @@ def spectral_variance_entropy(s, f, fmin, fmax):
     Hv = -np.sum(np.multiply(s_norm, np.log2(s_norm)))/np.log2(N)
     return Hv
 
-def temporal_entropy(audio, Fs):
+def temporal_entropy(audio=None, Fs=None, ctx=None):
 
     '''
 
     Calcula la entropía acústica temporal (Ht)[15]
 
-    :param audio: señal monoaural temporal (numpy array)
+    :param audio: señal monoaural temporal (numpy array) o iterable con la señal de cada minuto
     :param Fs: frecuencia de muestreo en Hz (int)
+    :param ctx: contexto espectral de la grabación, opcional (ContextoEspectral). Si se entrega, se reutiliza la
+                envolvente ya calculada para la grabación
     :return: el valor de Ht (float)
     '''
 
-    min_points = Fs*60
-    npoints = len(audio)
-    y = []
+    if ctx is not None:
+        env = ctx.envolvente
+    else:
+        env = hilbert_envelope(audio, Fs)
 
-    for seg in range(min_points, npoints, min_points):
-        y.append(np.abs(signal.hilbert(audio[seg - min_points:seg])))
-
-    env = np.concatenate(y)
     env_norm = env/np.sum(env)
 
     N = len(env_norm)
     Ht = -np.sum(np.multiply(env_norm, np.log2(env_norm)))/np.log2(N)
     return Ht
 
-def wav2SPL(audio, sen, gain, Vrms):
+def wav2SPL(audio=None, sen=-11, gain=9, Vrms=0.707, ctx=None):
 
     '''
 
     Calcula el nivel de presión sonora de la señal [16]
 
     :param audio: señal monoaural temporal (numpy array)
-    :param sen: sensibilidad del micrófono en dB (float)
-    :param gain: ganancia del micrófono en dB (float)
-    :param Vrms: Voltaje RMS del conversor análogo digital de la grabadora (float)
+    :param sen: sensibilidad del micrófono en dB, valor por defecto -11 (float)
+    :param gain: ganancia del micrófono en dB, valor por defecto 9 (float)
+    :param Vrms: Voltaje RMS del conversor análogo digital de la grabadora, valor por defecto 0.707 (float)
+    :param ctx: contexto espectral de la grabación, opcional (ContextoEspectral)
     :return: señal del nivel de presión sonora (numpy array)
     '''
 
+    if ctx is not None and audio is None:
+        audio = ctx.audio
+
     audio += 2 ** -17
     Vp = Vrms*math.sqrt(2)
     S = sen + gain + 20*math.log10(1/Vp)
     SPL = 20 * np.log10(np.absolute(audio)) - S
     return SPL
 
-def wiener_entropy(audio, win=256, nfft=None, type_win="hann", overlap=None):
+def wiener_entropy(audio=None, win=256, nfft=None, type_win="hann", overlap=None, ctx=None):
 
     '''
 
@@ -557,10 +847,16 @@ def wiener_entropy(audio, win=256, nfft=None, type_win="hann", overlap=None):
     :param nfft: número de puntos de la transformada de Fourier, valor por defecto, None, es decir el mismo de win (int)
     :param type_win: tipo de ventana, valor por defecto "hann" (str)
     :param overlap: puntos de solapamiento entre ventanas, valor por defecto None, es decir win/2 (float)
+    :param ctx: contexto espectral de la grabación, opcional (ContextoEspectral). Si se entrega, se reutiliza la PSD de
+                Welch calculada con los parámetros de ventana del contexto; la escala de la PSD no cambia el resultado
     :return: el valor de la entropia de wiener (float)
     '''
 
-    f, pxx = signal.welch(audio, nperseg=win, nfft=nfft, window=type_win, noverlap=overlap)
+    if ctx is not None:
+        f, pxx = ctx.welch
+    else:
+        f, pxx = signal.welch(audio, nperseg=win, nfft=nfft, window=type_win, noverlap=overlap)
+
     num = stats.mstats.gmean(pxx)
     den = np.mean(pxx)
     spf = num/den
@@ -0,0 +1,280 @@
+'''
+
+Micro-benchmarks de las funciones de Indices.py. Comparan el tiempo de las implementaciones vectorizadas con las
+implementaciones originales con ciclos de Python, que se conservan aquí como referencia, y verifican que ambas den el
+mismo resultado.
+
+Además de medir los tiempos, verifica la equivalencia de las implementaciones sobre espectros sintéticos aleatorios.
+
+Uso:
+    python benchmark_indices.py [minutos] [Fs]
+'''
+
+import sys
+import math
+import time
+import warnings
+import numpy as np
+from Indices import *
+
+def senal_sintetica(minutos=1, Fs=44100, semilla=0):
+
+    '''
+
+    Genera una señal parecida a una grabación de paisaje acústico: ruido de fondo, cantos con modulación de frecuencia y
+    algunos golpes de banda ancha.
+
+    :param minutos: duración de la señal en minutos, valor por defecto 1 (int)
+    :param Fs: frecuencia de muestreo en Hz, valor por defecto 44100 (int)
+    :param semilla: semilla del generador aleatorio, valor por defecto 0 (int)
+    :return: señal monoaural temporal (numpy array)
+    '''
+
+    rng = np.random.RandomState(semilla)
+    n = int(minutos * 60 * Fs)
+    t = np.arange(n) / Fs
+    audio = 0.01 * rng.randn(n)
+    audio += 0.05 * np.sin(2 * np.pi * (3000 + 800 * np.sin(2 * np.pi * 0.7 * t)) * t)
+    golpes = rng.randint(0, n, 20)
+
+    for g in golpes:
+        audio[g:g + Fs // 20] += 0.2 * rng.randn(len(audio[g:g + Fs // 20]))
+
+    return audio
+
+def background_noise_freq_bucle(s):
+
+    '''
+
+    Implementación original de background_noise_freq, con un ciclo por cada fila del espectrograma.
+
+    :param s: Espectrograma de la señal (numpy array)
+    :return: Vector que contiene el valor del ruido de fondo para cada celda de frecuencia (numpy array)
+    '''
+
+    nfbins = s.shape[0]
+    bn = np.zeros(nfbins)
+    for i in range(nfbins):
+        f = s[i, :]
+        nbins = int(s.shape[1]/8)
+        H, bin_edges = np.histogram(f, bins=nbins)
+        fwin = 5
+        nbinsn = H.size-fwin
+        sH = np.zeros(nbinsn)
+
+        for j in range(nbinsn):
+            sH[j] = H[j:j+fwin].sum()/fwin
+
+        modep = sH.argmax()
+        mode = np.amin(f) + (np.amax(f)-np.amin(f))*(modep/nbins)
+
+        acum = 0
+        j = 0
+        Hmax = np.amax(sH)
+        while acum < 0.68*Hmax:
+            acum += H[j]
+            j += 1
+
+        nsd = np.amin(f) + (np.amax(f)-np.amin(f))*(j/nbins)
+        bn[i] = mode + 0.1*nsd
+    return bn
+
+def ACItf_bucle(audio, Fs, j, s):
+
+    '''
+
+    Implementación original de ACItf, con un ciclo por cada cluster de j segundos.
+
+    :param audio: señal monoaural temporal (numpy array)
+    :param Fs: frecuencia de muestreo en Hz (int)
+    :param j: tamaño de cada cluster en segundos (int)
+    :param s: espectrograma de la señal (numpy array)
+    :return: valor del ACItf (float)
+    '''
+
+    s = s/np.amax(s)
+    specrows = s.shape[0]
+    speccols = s.shape[1]
+
+    dk = np.absolute(np.diff(s, axis=1)) #length speccols - 1
+
+    duracion = len(audio)/Fs
+    m = math.ceil(duracion/j) #Número de j en total
+    n = math.floor(speccols/m) #Número de tk en j
+
+    ACI = np.zeros((specrows, m))
+
+    for t in range(0, m):
+        k1 = range(n*t, n*(t+1)-1)
+        k2 = range(n*t, n*(t+1))
+        D = np.sum(dk[:, k1], axis=1)
+        ACI[:, t] = np.divide(D, np.sum(s[:, k2], axis = 1))
+
+    ACI_dft = np.sum(ACI, axis=0)
+    ACItot = sum(ACI_dft)
+
+    return ACItot
+
+def number_of_peaks_bucle(s, f, nedges=10):
+
+    '''
+
+    Implementación original de number_of_peaks, con un ciclo por cada punto del espectro medio.
+
+    :param s: Espectrograma de la señal (numpy array)
+    :param f: vector de frecuencias correspondientes al espectrograma s (numpy array)
+    :param nedges: número de partes en las que se divide la señal, por defecto 10 (int)
+    :return: número de picos de la señal.
+    '''
+
+    def smooth(a, n=10):
+        ret = np.cumsum(a, dtype=float)
+        ret[n:] = ret[n:] - ret[:-n]
+        return ret[n - 1:] / n
+
+    s = np.sum(s, axis=1)
+    s = s/np.amax(s)
+    s = 20*np.log10(s)
+    s = smooth(smooth(s))
+    f = smooth(smooth(f))
+    s -= np.amin(s)
+    ds = s[1:] - s[:-1]
+    df = f[1:] - f[:-1]
+    dsdf = np.divide(ds, df)
+
+    step = round(len(s)/nedges)
+    meansig = [np.mean(np.abs(s[j*step:(j+1)*step])) for j in range(nedges)]
+
+    ind = []
+
+    if s[0] > meansig[0] and s[0] > 1.2*np.mean(s) and np.mean(dsdf[1:4])<0:
+        ind.append(0)
+
+    for i in range(4, len(s)-3):
+        if s[i] > meansig[i%nedges] and s[i] > 1.2*np.mean(s) and np.mean(dsdf[i+1:i+4])>0 and np.mean(dsdf[i-4:i-1]) < 0:
+            ind.append(i)
+
+    if s[-1] > meansig[0] and s[-1] > 1.2*np.mean(s) and np.mean(dsdf[-4:-1]) > 0:
+        ind.append(len(s)-1)
+
+    if len(ind) == 0:
+        NP = 0
+        return NP
+
+    NP = 1
+    df_p = f[ind[1:]] - f[ind[:-1]]
+    acum = 0
+
+    for i in df_p:
+        acum += i
+        if acum >= 200:
+            NP += 1
+            acum = 0
+
+    return NP
+
+def espectro_sintetico(rng):
+
+    '''
+
+    Genera un espectrograma sintético con tamaño, rango dinámico y picos aleatorios
+
+    :param rng: generador aleatorio (numpy RandomState)
+    :return: una tupla con el espectrograma (numpy array) y su vector de frecuencias (numpy array)
+    '''
+
+    nfilas = rng.randint(20, 800)
+    ncols = rng.randint(48, 400) #background_noise_freq necesita al menos 6 bins (ncols/8)
+    s = rng.rand(nfilas, ncols) ** rng.uniform(0.5, 4)
+    centros = rng.randint(0, nfilas, 5)
+    picos = np.exp(-((np.arange(nfilas)[:, np.newaxis] - centros) / rng.uniform(1, 20)) ** 2).sum(axis=1)
+    s += picos[:, np.newaxis] * rng.uniform(0, 3)
+    f = np.linspace(0, rng.uniform(5000, 24000), nfilas)
+    return s, f
+
+def verificar_equivalencia(ncasos=300, semilla=0):
+
+    '''
+
+    Verifica que las implementaciones vectorizadas den exactamente los mismos valores que las originales sobre
+    espectrogramas sintéticos. Lanza AssertionError con el primer caso que no coincida.
+
+    :param ncasos: número de espectrogramas sintéticos, valor por defecto 300 (int)
+    :param semilla: semilla del generador aleatorio, valor por defecto 0 (int)
+    :return: None
+    '''
+
+    rng = np.random.RandomState(semilla)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+
+        for caso in range(ncasos):
+            s, f = espectro_sintetico(rng)
+            nedges = rng.randint(1, 30)
+            Fs = rng.choice([8000, 22050, 44100])
+            audio = np.zeros(rng.randint(5 * Fs, 5 * Fs * s.shape[1]))
+
+            assert np.array_equal(background_noise_freq_bucle(s), background_noise_freq(s)), \
+                "background_noise_freq, caso %d" % caso
+            assert number_of_peaks_bucle(s, f, nedges) == number_of_peaks(s, f, nedges), \
+                "number_of_peaks, caso %d" % caso
+            assert ACItf_bucle(audio, Fs, 5, s) == ACItf(audio, Fs, 5, s), "ACItf, caso %d" % caso
+
+    print("%d espectrogramas sintéticos: las implementaciones vectorizadas coinciden con las originales" % ncasos)
+
+def medir(funcion, *args, repeticiones=3):
+
+    '''
+
+    Mide el menor tiempo de ejecución de una función entre varias repeticiones
+
+    :param funcion: función a medir
+    :param args: argumentos de la función
+    :param repeticiones: número de repeticiones, valor por defecto 3 (int)
+    :return: una tupla con el resultado de la función y el menor tiempo en segundos (float)
+    '''
+
+    tiempos = []
+
+    for r in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion(*args)
+        tiempos.append(time.perf_counter() - inicio)
+
+    return resultado, min(tiempos)
+
+def comparar(nombre, original, vectorizada, *args):
+
+    '''
+
+    Compara el tiempo y el resultado de la implementación original y la vectorizada de un índice, e imprime el
+    resultado
+
+    :param nombre: nombre del índice (str)
+    :param original: implementación original
+    :param vectorizada: implementación vectorizada
+    :param args: argumentos de ambas implementaciones
+    :return: None
+    '''
+
+    r_orig, t_orig = medir(original, *args, repeticiones=1)
+    r_vec, t_vec = medir(vectorizada, *args)
+    iguales = np.array_equal(r_orig, r_vec)
+    print("%-25s original %8.3f s   vectorizada %8.3f s   x%6.1f   iguales: %s" % (nombre, t_orig, t_vec,
+                                                                               t_orig / t_vec, iguales))
+
+if __name__ == '__main__':
+
+    minutos = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+    Fs = int(sys.argv[2]) if len(sys.argv) > 2 else 44100
+
+    ctx = ContextoEspectral(senal_sintetica(minutos, Fs), Fs, "hann", 1024, 0, 1024)
+    f, t, s = ctx.espectrograma
+    print("Espectrograma de %d minuto(s) a %d Hz: %d x %d" % (minutos, Fs, s.shape[0], s.shape[1]))
+
+    comparar("background_noise_freq", background_noise_freq_bucle, background_noise_freq, s)
+    comparar("number_of_peaks", number_of_peaks_bucle, number_of_peaks, s, f, 10 * ctx.nmin)
+    comparar("ACItf", ACItf_bucle, ACItf, ctx.audio, Fs, 5, s)
+
+    verificar_equivalencia()
@@ -0,0 +1,651 @@
+'''
+
+Benchmark reproducible de Indices.py y del procesamiento completo (extraer_lote, como CLI_paisaje.py y la interfaz,
+y la estandarización) sobre grabaciones sintéticas. Las grabaciones se generan localmente con una semilla fija: ruido
+blanco, ruido rosa, cantos con modulación de frecuencia y ráfagas de banda ancha parecidas a la lluvia, con varias
+frecuencias de muestreo y duraciones, en WAV y FLAC.
+
+Los resultados se guardan en un archivo JSON. Si se entrega el JSON de una ejecución anterior, se comparan los tiempos y
+se marcan como regresión los que aumentaron más que la tolerancia; en ese caso el programa termina con código 1.
+
+Con --precision también se comparan los 29 índices calculados en precisión simple (float32, opción --float32 de
+CLI_paisaje.py) con los de float64. Resultado sobre las 24 grabaciones sintéticas WAV de 16 bits (numpy 1.26,
+scipy 1.11), error relativo máximo por índice:
+
+    0 (idénticos):      NP, MID, RMS y ADIm1-3, ADIm5-9, ADIm11
+    menor a 1e-6:       ACIft, ACItf, ESM, M, FM, BNT, CF
+    entre 1e-6 y 1e-4:  TE, NDSI, P, MD, SF, ADI, BI, ADIm4
+    hasta 5e-4:         BNF, ADIm10 (umbrales de ruido de fondo sobre histogramas, un valor puede cambiar de celda)
+
+Estas diferencias son mucho menores que la variación entre grabaciones de un mismo día, que es la que resumen los
+promedios diarios. La lectura y las transformadas de una grabación de dos minutos a 48 kHz usan 264 MB en float64 y
+132 MB en float32.
+
+Con --cribado solo se mide el algoritmo de lluvia. Primero se compara el cribado rápido (opción --cribado de
+CLI_paisaje.py) con el algoritmo completo: la tasa de acuerdo es la fracción de grabaciones que quedan igual (buenas o
+con ruido fuerte), con el umbral de cada método calculado sobre la misma carpeta, y el tiempo es el de la PSD de
+lluvia. Resultado sobre 40 grabaciones sintéticas de 10 minutos a 22.05 kHz, la mitad con lluvia en parte de los
+minutos, con un proceso:
+
+    1m:   85% de acuerdo, 5 pasan a buenas y 1 a ruido fuerte, 11.1 veces más rápido
+    3m:   85% de acuerdo, 3 pasan a buenas y 3 a ruido fuerte, 3.4 veces más rápido
+    20s:  85% de acuerdo, 5 pasan a buenas y 1 a ruido fuerte, 44 veces más rápido
+
+Los desacuerdos son grabaciones con lluvia solo en algunos minutos, cerca del umbral. En grabaciones que llueven o no
+durante toda su duración el acuerdo es completo, pero con lluvia intermitente el cribado puede dejar pasar grabaciones
+con lluvia; conviene medir el acuerdo con --datos sobre grabaciones reales antes de usarlo.
+
+Después las carpetas se procesan de punta a punta con extraer_lote. Por defecto el algoritmo completo calcula primero
+la PSD de lluvia de todas las grabaciones y lee de nuevo solo las que pasan el umbral para calcular sus índices;
+una_pasada lee cada grabación una sola vez y calcula los índices de todas (separar_lluvia=False). Sobre las mismas
+grabaciones:
+
+    una_pasada:  305 s, 20 descartadas por lluvia
+    completo:    149 s, los mismos promedios diarios, 2.05 veces más rápido
+    1m:          155 s, 16 descartadas por lluvia
+    3m:          138 s, 20 descartadas por lluvia
+    20s:         163 s, 16 descartadas por lluvia
+
+Los índices cuestan mucho más que la lectura: la segunda lectura de una grabación que pasa el umbral toma 0.07 s, y
+sus índices unos 7 s. Como el umbral está entre la media aritmética y la media geométrica de las PSD, cada carpeta
+descarta parte de sus grabaciones aunque no llueva, así que separar la lluvia casi siempre ahorra más de lo que cuesta.
+Con la lluvia ya separada, el cribado rápido solo ahorra la lectura completa de las grabaciones descartadas, y cada
+grabación con lluvia que deja pasar suma sus índices: 1m y 20s son más lentos que el algoritmo completo y 3m solo un
+7% más rápido, y los promedios diarios cambian hasta 9 desviaciones entre días.
+
+Uso:
+    python benchmark_paisaje.py --salida resultados.json [--referencia anterior.json] [--rapido] [--precision]
+    python benchmark_paisaje.py --salida cribado.json --cribado 1m,3m,20s [--datos CARPETA [--subcarpetas]]
+'''
+
+import argparse
+import contextlib
+import glob
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import numpy as np
+import scipy
+import soundfile as sf
+from Indices import *
+from benchmark_indices import medir
+from perfil import MedidorPasos
+import paisaje
+
+TIPOS = ["blanco", "rosa", "cantos", "lluvia"]
+FRECUENCIAS = [22050, 44100, 48000]
+DURACIONES = [1, 2]
+FORMATOS = ["wav", "flac"]
+TOLERANCIA = 0.2
+# Los aumentos menores a este tiempo se consideran ruido de la medición, aunque superen la tolerancia relativa
+AUMENTO_MINIMO = 0.005
+
+def senal_paisaje(tipo, minutos, Fs, semilla=0):
+
+    '''
+
+    Genera una grabación sintética de paisaje acústico. La señal dura un segundo más que los minutos pedidos, porque el
+    algoritmo de lluvia solo analiza los minutos completos que no terminan la grabación.
+
+    :param tipo: tipo de grabación: "blanco", "rosa", "cantos" o "lluvia" (str)
+    :param minutos: duración en minutos (int)
+    :param Fs: frecuencia de muestreo en Hz (int)
+    :param semilla: semilla del generador aleatorio, valor por defecto 0 (int)
+    :return: señal monoaural temporal con valores entre -1 y 1 (numpy array)
+    '''
+
+    rng = np.random.RandomState(semilla)
+    n = (minutos * 60 + 1) * Fs
+    t = np.arange(n) / Fs
+    audio = 0.01 * rng.randn(n)
+
+    if tipo == "rosa":
+        # Ruido con densidad espectral proporcional a 1/f
+        espectro = np.fft.rfft(rng.randn(n))
+        f = np.fft.rfftfreq(n, 1 / Fs)
+        espectro[1:] /= np.sqrt(f[1:])
+        audio = np.fft.irfft(espectro, n)
+        audio *= 0.05 / np.std(audio)
+
+    elif tipo == "cantos":
+        # Cantos cortos con barrido de frecuencia entre 2 kHz y 7 kHz, en momentos aleatorios
+        for inicio in rng.randint(0, n - Fs, 12 * minutos):
+            duracion = rng.randint(Fs // 10, Fs // 2)
+            tc = t[:duracion]
+            f0 = rng.uniform(2000, 5000)
+            barrido = f0 + rng.uniform(500, 2000) * tc / tc[-1]
+            audio[inicio:inicio + duracion] += 0.2 * np.hanning(duracion) * np.sin(2 * np.pi * barrido * tc)
+
+    elif tipo == "lluvia":
+        # Gotas: ráfagas de banda ancha muy cortas, muchas por segundo
+        for inicio in rng.randint(0, n - Fs // 100, 400 * minutos):
+            duracion = rng.randint(Fs // 1000, Fs // 100)
+            audio[inicio:inicio + duracion] += 0.3 * rng.randn(duracion) * np.hanning(duracion)
+
+    return np.clip(audio, -1, 1)
+
+def generar_grabaciones(carpeta, frecuencias=FRECUENCIAS, duraciones=DURACIONES, formatos=FORMATOS, semilla=0):
+
+    '''
+
+    Genera las grabaciones sintéticas, una por cada tipo, frecuencia de muestreo y duración, en una subcarpeta por
+    formato. Los nombres siguen el formato de las grabadoras (CODIGO_AAAAMMDD_HHMMSS), todas en el mismo día.
+
+    :param carpeta: recibe un str con la carpeta donde se guardan las grabaciones
+    Los demás parámetros son listas con los valores a generar, por defecto las constantes del módulo
+    :return: diccionario {formato: carpeta con las grabaciones del formato}
+    '''
+
+    carpetas = {}
+
+    for formato in formatos:
+        carpetas[formato] = os.path.join(carpeta, formato)
+        os.makedirs(carpetas[formato], exist_ok=True)
+        k = 0
+
+        for Fs in frecuencias:
+            for minutos in duraciones:
+                for tipo in TIPOS:
+                    ruta = os.path.join(carpetas[formato], "BENCH_20200101_%02d%02d00.%s" % (k // 60, k % 60, formato))
+                    if not os.path.exists(ruta):
+                        audio = senal_paisaje(tipo, minutos, Fs, semilla + k)
+                        sf.write(ruta, audio, Fs, subtype="PCM_16")
+                    k += 1
+
+    return carpetas
+
+def llamadas_indices(audio, Fs):
+
+    '''
+
+    Arma las llamadas de cada función de Indices.py para una grabación. Cada función se llama sin contexto espectral,
+    es decir calculando sus propias transformadas, como cuando se usa por separado.
+
+    :param audio: señal monoaural temporal (numpy array)
+    :param Fs: frecuencia de muestreo en Hz (int)
+    :return: diccionario {nombre de la función: función sin argumentos}
+    '''
+
+    ctx = ContextoEspectral(audio, Fs, "hann", 512, 0, 512)
+    f, t, s = ctx.espectrograma
+    bio_band = (2000, 8000)
+    tech_band = (200, 1500)
+    SPL = wav2SPL(audio.copy(), -11, 9, 0.707)
+
+    return {
+        "espectrograma": lambda: ContextoEspectral(audio, Fs, "hann", 512, 0, 512).espectrograma,
+        "ACIft": lambda: ACIft(s),
+        "ADI": lambda: ADI(s, 10000, 1000, -50),
+        "ACItf": lambda: ACItf(audio, Fs, 5, s),
+        "beta": lambda: beta(s, f, bio_band),
+        "temporal_entropy": lambda: temporal_entropy(audio, Fs),
+        "spectral_maxima_entropy": lambda: spectral_maxima_entropy(s, f, 482, 8820),
+        "spectral_variance_entropy": lambda: spectral_variance_entropy(s, f, 482, 8820),
+        "NDSI": lambda: NDSI(s, f, bio_band, tech_band),
+        "rho": lambda: rho(s, f, bio_band, tech_band),
+        "hilbert_envelope": lambda: hilbert_envelope(audio, Fs),
+        "median_envelope": lambda: median_envelope(audio, Fs, 16),
+        "number_of_peaks": lambda: number_of_peaks(s, f, 10 * ctx.nmin),
+        "mid_band_activity": lambda: mid_band_activity(s, f, 450, 3500),
+        "background_noise_freq": lambda: background_noise_freq(s),
+        "histogram_rows": lambda: histogram_rows(s, s.shape[1] // 8),
+        "wav2SPL": lambda: wav2SPL(audio.copy(), -11, 9, 0.707),
+        "background_noise_time": lambda: background_noise_time(SPL, 5),
+        "musicality_degree": lambda: musicality_degree(audio, Fs),
+        "frequency_modulation": lambda: frequency_modulation(s),
+        "wiener_entropy": lambda: wiener_entropy(audio),
+        "rms": lambda: rms(audio),
+        "crest_factor": lambda: crest_factor(audio),
+        "ADIm": lambda: ADIm(s, Fs, 1000),
+        "meanspec": lambda: meanspec(audio, Fs, "hann", 0, 512, 512),
+    }
+
+def medir_indices(frecuencias=FRECUENCIAS, duraciones=DURACIONES, repeticiones=3):
+
+    '''
+
+    Mide el tiempo de cada función de Indices.py sobre una grabación sintética con cantos por cada frecuencia de
+    muestreo y duración
+
+    :param repeticiones: número de repeticiones; se guarda el menor tiempo, valor por defecto 3 (int)
+    Los demás parámetros son listas con los valores a medir, por defecto las constantes del módulo
+    :return: diccionario {"funcion@Fs_minutos": segundos}
+    '''
+
+    tiempos = {}
+
+    for Fs in frecuencias:
+        for minutos in duraciones:
+            audio = senal_paisaje("cantos", minutos, Fs)
+            for nombre, llamada in llamadas_indices(audio, Fs).items():
+                segundos = medir(llamada, repeticiones=repeticiones)[1]
+                tiempos["%s@%d_%dmin" % (nombre, Fs, minutos)] = segundos
+                print("%-28s %6d Hz %d min %8.4f s" % (nombre, Fs, minutos, segundos))
+
+    return tiempos
+
+def medir_flujo(carpeta, extension, nprocesos=1):
+
+    '''
+
+    Procesa las grabaciones de una carpeta como CLI_paisaje.py y la interfaz: extraer_lote (algoritmo de lluvia,
+    descriptores y promedios diarios) y después estandarizar_df, y mide el tiempo de cada paso
+
+    :param carpeta: recibe un str con la carpeta de grabaciones
+    :param extension: recibe un str con la extensión de las grabaciones, por ejemplo ".wav"
+    :param nprocesos: recibe un entero con el número de procesos trabajadores, valor por defecto 1
+    :return: diccionario con el tiempo de reloj y de CPU de cada paso y del total, la duración del audio en horas y el
+             rendimiento en horas de audio por hora de CPU
+    '''
+
+    grabaciones = sorted(glob.glob(carpeta + '/*' + extension))
+    horas_audio = sum(sf.info(grabacion).duration for grabacion in grabaciones) / 3600
+    parametros = (0, True, "hann", 512, 0, 512, 1000, 11250, len(grabaciones), extension)
+    promedios = []
+
+    # extraer_lote escribe su avance en la salida estándar
+    def extraer():
+        with contextlib.redirect_stdout(io.StringIO()):
+            promedios.append(paisaje.extraer_lote([carpeta], parametros, nprocesos)[0])
+
+    pasos = [("extraer_lote", extraer),
+             ("estandarizar", lambda: paisaje.estandarizar_df(promedios[0], False))]
+
+    resultado = {"grabaciones": len(grabaciones), "horas_audio": horas_audio}
+    reloj_total = 0
+    cpu_total = 0
+
+    for nombre, paso in pasos:
+        inicio_reloj = time.perf_counter()
+        inicio_cpu = time.process_time()
+        paso()
+        resultado[nombre + "_segundos"] = time.perf_counter() - inicio_reloj
+        resultado[nombre + "_cpu"] = time.process_time() - inicio_cpu
+        reloj_total += resultado[nombre + "_segundos"]
+        cpu_total += resultado[nombre + "_cpu"]
+
+    paisaje.cerrar_pool()
+    resultado["total_segundos"] = reloj_total
+    resultado["total_cpu"] = cpu_total
+
+    # Con varios procesos el tiempo de CPU de los trabajadores no se cuenta, por eso se usa el tiempo de reloj por
+    # el número de procesos
+    horas_cpu = (cpu_total if nprocesos <= 1 else reloj_total * nprocesos) / 3600
+    resultado["horas_audio_por_hora_cpu"] = horas_audio / horas_cpu
+    print("%-6s %d grabaciones, %.2f h de audio: %.1f s, %.1f h de audio por hora de CPU" %
+          (extension, len(grabaciones), horas_audio, reloj_total, resultado["horas_audio_por_hora_cpu"]))
+    return resultado
+
+def comparar_precision(carpeta, extension=".wav"):
+
+    '''
+
+    Compara los índices calculados en precisión simple (float32) con los de float64 sobre las grabaciones sintéticas,
+    leyendo cada grabación en las dos precisiones, y mide la memoria máxima de las transformadas de la grabación más
+    larga en cada precisión
+
+    :param carpeta: recibe un str con la carpeta de las grabaciones
+    :param extension: recibe un str con la extensión de las grabaciones, valor por defecto ".wav"
+    :return: diccionario con el error relativo y absoluto máximo de cada índice y la memoria en MB de cada precisión
+    '''
+
+    errores = {}
+    grabaciones = sorted(glob.glob(carpeta + '/*' + extension))
+
+    for grabacion in grabaciones:
+        valores = {}
+        for precision in ["float64", "float32"]:
+            audio, Fs = paisaje.leer_grabacion(grabacion, 0, precision=precision)
+            valores[precision], titulos = paisaje.descriptores_grabacion(audio, Fs, True, "hann", 512, 0, 512, 1000,
+                                                                         11250)
+        if valores["float64"] is None:
+            continue
+        for titulo, doble, simple in zip(titulos, valores["float64"], valores["float32"]):
+            absoluto = abs(float(simple) - float(doble))
+            relativo = absoluto / abs(doble) if doble != 0 else absoluto
+            anterior = errores.get(titulo, (0, 0))
+            errores[titulo] = (max(anterior[0], relativo), max(anterior[1], absoluto))
+
+    resultado = {"indices": {titulo: {"error_relativo_max": relativo, "error_absoluto_max": absoluto}
+                             for titulo, (relativo, absoluto) in errores.items()}}
+
+    for titulo, (relativo, absoluto) in errores.items():
+        print("%-6s error relativo máximo %.2e, absoluto %.2e" % (titulo, relativo, absoluto))
+
+    # La memoria se mide solo en las transformadas: con tracemalloc, el ciclo de Python de rms en float64 tardaría
+    # demasiado (ver perfil.py)
+    grabacion = max(grabaciones, key=os.path.getsize)
+
+    for precision in ["float64", "float32"]:
+        medidor = MedidorPasos(memoria=True)
+        with medidor.medir("transformadas"):
+            audio, Fs = paisaje.leer_grabacion(grabacion, 0, precision=precision)
+            ctx = ContextoEspectral(audio, Fs, "hann", 512, 0, 512)
+            ctx.espectrograma, ctx.welch, ctx.envolvente, ctx.ruido_fondo
+            del audio, ctx
+        megas = medidor.terminar()["transformadas"][1] / 2**20
+        resultado["memoria_mb_" + precision] = megas
+        print("%s: %.1f MB en la lectura y las transformadas de %s" % (precision, megas, os.path.basename(grabacion)))
+
+    return resultado
+
+def generar_grabaciones_cribado(carpeta, n=40, minutos=10, Fs=22050, semilla=0):
+
+    '''
+
+    Genera grabaciones largas para comparar el cribado rápido de lluvia con el algoritmo completo. Cada minuto es ruido
+    rosa o cantos, y en los minutos con lluvia se le suman gotas. En una de cada cuatro grabaciones llueve todo el
+    tiempo, en otra la mitad de los minutos, en otra entre uno y tres minutos al azar, y en la otra no llueve. Se
+    guardan en WAV con los nombres de las grabadoras, diez grabaciones por día.
+
+    :param carpeta: recibe un str con la carpeta donde se guardan las grabaciones
+    :param n: recibe un entero con el número de grabaciones, valor por defecto 40
+    :param minutos: recibe un entero con la duración de cada grabación en minutos, valor por defecto 10
+    :param Fs: recibe un entero con la frecuencia de muestreo en Hz, valor por defecto 22050
+    :param semilla: recibe un entero con la semilla del generador aleatorio, valor por defecto 0
+    :return: str con la carpeta de las grabaciones
+    '''
+
+    carpeta = os.path.join(carpeta, "cribado")
+    os.makedirs(carpeta, exist_ok=True)
+    rng = np.random.RandomState(semilla)
+
+    for k in range(n):
+        ruta = os.path.join(carpeta, "CRIB_202001%02d_%02d0000.wav" % (k // 10 + 1, k % 10))
+        lluviosos = [set(range(minutos)), set(rng.choice(minutos, minutos // 2, replace=False)),
+                     set(rng.choice(minutos, rng.randint(1, 4), replace=False)), set()][k % 4]
+        if os.path.exists(ruta):
+            continue
+        partes = []
+        for m in range(minutos + 1):
+            parte = senal_paisaje(["rosa", "cantos"][rng.randint(2)], 1, Fs, semilla + 1000 * k + m)
+            parte = parte[:60 * Fs if m < minutos else Fs]
+            if m in lluviosos:
+                # Lluvia fuerte: unas 50 gotas por segundo sobre el paisaje del minuto
+                for inicio in rng.randint(0, len(parte) - Fs // 100, 3000):
+                    duracion = rng.randint(Fs // 1000, Fs // 100)
+                    parte[inicio:inicio + duracion] += 0.3 * rng.randn(duracion) * np.hanning(duracion)
+            partes.append(np.clip(parte, -1, 1))
+        sf.write(ruta, np.concatenate(partes), Fs, subtype="PCM_16")
+
+    return carpeta
+
+def comparar_cribado(carpetas, extension, muestras, canal=0, tipo_ventana="hann", tamano_ventana=1024,
+                     sobreposicion=0, nfft=1024):
+
+    '''
+
+    Compara el cribado rápido de lluvia (ver paisaje.psd_lluvia_muestra) con el algoritmo completo: para cada carpeta
+    calcula el umbral con las PSD completas y con las de cada muestra, y cuenta las grabaciones que quedan clasificadas
+    igual (buena o ruido fuerte). También mide el tiempo de lectura y PSD de cada método.
+
+    :param carpetas: recibe una lista con las carpetas de grabaciones; el umbral se calcula por carpeta, igual que en el
+                     procesamiento
+    :param extension: recibe un str con la extensión de las grabaciones, incluyendo el punto
+    :param muestras: recibe una lista de tuplas con las muestras a comparar (ver paisaje.validar_cribado)
+    :param canal: recibe un entero con el canal a analizar, empezando en 0, valor por defecto 0
+    Los demás parámetros son los de la PSD de lluvia, por defecto los de CLI_paisaje.py
+    :return: diccionario con el número de grabaciones y el tiempo del método completo, y para cada muestra la tasa de
+             acuerdo, las grabaciones que pasan a buenas o a ruidosas y el tiempo
+    '''
+
+    nombres = ["%d%s" % (cantidad, tipo[0]) for tipo, cantidad in muestras]
+    tiempos = dict.fromkeys(["completo"] + nombres, 0.0)
+    conteos = {nombre: {"iguales": 0, "pasan_a_buenas": 0, "pasan_a_ruidosas": 0} for nombre in nombres}
+    total = 0
+
+    for carpeta in carpetas:
+        grabaciones = sorted(glob.glob(carpeta + '/*' + extension))
+        if not grabaciones:
+            continue
+
+        PSD = {}
+        inicio = time.perf_counter()
+        PSD["completo"] = [paisaje.cribado_archivo(grabacion, canal, ("minutos", 10**9), tipo_ventana, tamano_ventana,
+                                                   sobreposicion, nfft) for grabacion in grabaciones]
+        tiempos["completo"] += time.perf_counter() - inicio
+
+        for nombre, muestra in zip(nombres, muestras):
+            inicio = time.perf_counter()
+            PSD[nombre] = [paisaje.cribado_archivo(grabacion, canal, muestra, tipo_ventana, tamano_ventana,
+                                                   sobreposicion, nfft) for grabacion in grabaciones]
+            tiempos[nombre] += time.perf_counter() - inicio
+
+        ruido = {}
+        for nombre, valores in PSD.items():
+            ruido[nombre] = paisaje.umbral_lluvia([0 if valor is None else valor for valor in valores])[2]
+
+        #Las grabaciones corruptas se rechazan igual con los dos métodos
+        validas = np.array([valor is not None and valor > 0 for valor in PSD["completo"]])
+        total += int(np.count_nonzero(validas))
+
+        for nombre in nombres:
+            conteos[nombre]["iguales"] += int(np.count_nonzero(validas & (ruido[nombre] == ruido["completo"])))
+            conteos[nombre]["pasan_a_buenas"] += int(np.count_nonzero(validas & ruido["completo"] & ~ruido[nombre]))
+            conteos[nombre]["pasan_a_ruidosas"] += int(np.count_nonzero(validas & ~ruido["completo"] & ruido[nombre]))
+
+    resultado = {"grabaciones": total, "tiempo_completo": tiempos["completo"], "muestras": {}}
+    print("%d grabaciones, algoritmo completo %.2f s" % (total, tiempos["completo"]))
+
+    for nombre in nombres:
+        acuerdo = conteos[nombre]["iguales"] / total if total else 1.0
+        resultado["muestras"][nombre] = dict(conteos[nombre], acuerdo=acuerdo, tiempo=tiempos[nombre])
+        print("%-5s acuerdo %.1f%%, %d pasan a buenas, %d pasan a ruidosas, %.2f s (%.1fx más rápido)" %
+              (nombre, 100 * acuerdo, conteos[nombre]["pasan_a_buenas"], conteos[nombre]["pasan_a_ruidosas"],
+               tiempos[nombre], tiempos["completo"] / max(tiempos[nombre], 1e-9)))
+
+    return resultado
+
+def procesar_cribado(carpetas, parametros, muestras, nprocesos=1):
+
+    '''
+
+    Procesa las carpetas de punta a punta con paisaje.extraer_lote, sin cribado y con cada muestra, y compara los
+    promedios diarios. Sin cribado se mide también la lectura única de cada grabación ("una_pasada", con
+    separar_lluvia=False), que calcula los descriptores de todas las grabaciones, incluso las que se descartan por
+    lluvia, frente a la opción por defecto ("completo"), que calcula primero la lluvia y lee de nuevo solo las que
+    pasan el umbral. Para comparar todos los días no se exige un mínimo de grabaciones diarias. La diferencia de cada
+    índice se mide en desviaciones estándar de sus promedios diarios sin cribado, es decir frente a la variación entre
+    días, porque algunos índices tienen promedios cercanos a cero.
+
+    :param carpetas: recibe una lista con las carpetas de grabaciones
+    :param parametros: recibe la tupla de parámetros de paisaje.validar_parametros
+    :param muestras: recibe una lista de tuplas con las muestras a comparar (ver paisaje.validar_cribado)
+    :param nprocesos: recibe un entero con el número de procesos trabajadores, valor por defecto 1
+    :return: diccionario con el tiempo, las grabaciones descartadas por lluvia y los días de cada método, si el método
+             completo da los mismos promedios que una_pasada, y para cada muestra los días en común con el método
+             completo y la diferencia máxima de sus promedios
+    '''
+
+    parametros = parametros[:8] + (1,) + parametros[9:]
+    metodos = [("una_pasada", None, False), ("completo", None, True)]
+    metodos += [("%d%s" % (cantidad, tipo[0]), (tipo, cantidad), True) for tipo, cantidad in muestras]
+    resultado = {}
+    promedios = {}
+
+    #El Pool se crea antes de medir, para no sumar su inicio al primer método
+    if nprocesos > 1:
+        paisaje.obtener_pool(nprocesos)
+
+    for nombre, muestra, separar in metodos:
+        inicio = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            prom_df, grab_malas_df = paisaje.extraer_lote(carpetas, parametros, nprocesos, cribado=muestra,
+                                                          separar_lluvia=separar)
+        promedios[nombre] = prom_df.set_index("Codigo", append=True)
+        resultado[nombre] = {"tiempo": time.perf_counter() - inicio, "dias": len(prom_df),
+                             "ruido_fuerte": int(np.count_nonzero(grab_malas_df["Motivo"] == "Ruido Fuerte"))}
+
+        if nombre == "completo":
+            resultado[nombre]["igual_una_pasada"] = bool(promedios[nombre].equals(promedios["una_pasada"]))
+
+        if muestra is not None:
+            comunes = promedios[nombre].index.intersection(promedios["completo"].index)
+            completo = promedios["completo"].loc[comunes].to_numpy(dtype=np.float64)
+            cribado = promedios[nombre].loc[comunes, list(promedios["completo"])].to_numpy(dtype=np.float64)
+            variacion = np.std(promedios["completo"].to_numpy(dtype=np.float64), axis=0)
+            diferencia = np.abs(cribado - completo) / np.maximum(variacion, np.finfo(np.float64).tiny)
+            resultado[nombre]["dias_comunes"] = len(comunes)
+            resultado[nombre]["diferencia_maxima"] = float(np.max(diferencia)) if diferencia.size else 0.0
+
+        print("%-10s %.1f s, %d descartadas por lluvia, %d días" % (nombre, resultado[nombre]["tiempo"],
+                                                                   resultado[nombre]["ruido_fuerte"],
+                                                                   resultado[nombre]["dias"]) +
+              ("" if muestra is None else ", diferencia máxima de los promedios %.2f desviaciones entre días" %
+               resultado[nombre]["diferencia_maxima"]) +
+              ("" if nombre != "completo" else ", iguales a una_pasada: %s" % resultado[nombre]["igual_una_pasada"]))
+
+    paisaje.cerrar_pool()
+    return resultado
+
+def comparar_resultados(actual, referencia, tolerancia=TOLERANCIA):
+
+    '''
+
+    Compara los tiempos de dos ejecuciones del benchmark
+
+    :param actual: recibe el diccionario de resultados de la ejecución actual
+    :param referencia: recibe el diccionario de resultados de una ejecución anterior
+    :param tolerancia: aumento relativo del tiempo que se acepta antes de marcar una regresión, valor por defecto 0.2
+    :return: lista de tuplas (medición, tiempo de referencia, tiempo actual) con las regresiones: las mediciones que
+             aumentaron más que la tolerancia y más que AUMENTO_MINIMO segundos
+    '''
+
+    regresiones = []
+    tiempos_actual = dict(actual["indices"])
+    tiempos_referencia = dict(referencia["indices"])
+
+    for formato, flujo in actual["flujo"].items():
+        for clave, valor in flujo.items():
+            if clave.endswith("_segundos"):
+                tiempos_actual[formato + ":" + clave] = valor
+
+    for formato, flujo in referencia["flujo"].items():
+        for clave, valor in flujo.items():
+            if clave.endswith("_segundos"):
+                tiempos_referencia[formato + ":" + clave] = valor
+
+    for clave, tiempo in sorted(tiempos_actual.items()):
+        anterior = tiempos_referencia.get(clave)
+        if anterior is not None and tiempo > anterior * (1 + tolerancia) and tiempo - anterior > AUMENTO_MINIMO:
+            regresiones.append((clave, anterior, tiempo))
+
+    return regresiones
+
+def leer_argumentos(argumentos=None):
+
+    '''
+
+    Lee los argumentos de la línea de comandos
+
+    :param argumentos: recibe una lista de str con los argumentos, valor por defecto None, es decir los de sys.argv
+    :return: un argparse.Namespace con los argumentos
+    '''
+
+    parser = argparse.ArgumentParser(description="Benchmark de Indices.py y del procesamiento completo")
+    parser.add_argument("--salida", default="benchmark_paisaje.json", help="archivo JSON con los resultados")
+    parser.add_argument("--referencia", help="JSON de una ejecución anterior para buscar regresiones")
+    parser.add_argument("--tolerancia", type=float, default=TOLERANCIA,
+                        help="aumento relativo del tiempo aceptado (por defecto 0.2, es decir 20%%)")
+    parser.add_argument("--carpeta", help="carpeta para las grabaciones sintéticas (por defecto una carpeta temporal); "
+                                          "si ya existen no se generan de nuevo")
+    parser.add_argument("--rapido", action="store_true", help="solo 22050 Hz y un minuto")
+    parser.add_argument("--repeticiones", type=int, default=3, help="repeticiones de cada índice (por defecto 3)")
+    parser.add_argument("--jobs", type=int, default=1, help="procesos trabajadores del procesamiento (por defecto 1)")
+    parser.add_argument("--precision", action="store_true",
+                        help="comparar también los índices en precisión simple (float32) con los de float64")
+    parser.add_argument("--cribado", metavar="M1,M2,...",
+                        help="solo comparar las muestras del cribado rápido de lluvia con el algoritmo completo, por "
+                             "ejemplo 1m,3m,20s, sobre grabaciones sintéticas largas o sobre las de --datos")
+    parser.add_argument("--datos", help="con --cribado, carpeta de grabaciones a usar en lugar de las sintéticas")
+    parser.add_argument("--subcarpetas", action="store_true", help="con --datos, buscar grabaciones en las subcarpetas")
+    parser.add_argument("--formato", default="wav", help="con --datos, formato de las grabaciones (por defecto wav)")
+    parser.add_argument("--canal", type=int, default=1, help="con --datos, canal a analizar, empezando en 1")
+    return parser.parse_args(argumentos)
+
+def main(argumentos=None):
+
+    '''
+
+    Genera las grabaciones, ejecuta el benchmark, guarda los resultados y los compara con la referencia
+
+    :param argumentos: recibe una lista de str con los argumentos, valor por defecto None, es decir los de sys.argv
+    :return: entero con el código de salida (1 si hay regresiones)
+    '''
+
+    args = leer_argumentos(argumentos)
+    frecuencias = FRECUENCIAS[:1] if args.rapido else FRECUENCIAS
+    duraciones = DURACIONES[:1] if args.rapido else DURACIONES
+
+    if args.cribado is not None:
+        try:
+            muestras = [paisaje.validar_cribado(muestra) for muestra in args.cribado.split(',')]
+        except ValueError as error:
+            print(error, file=sys.stderr)
+            return 2
+
+        if args.datos is not None:
+            extension = '.' + args.formato.lower()
+            carpetas = paisaje.buscar_carpetas(args.datos, args.subcarpetas, extension)
+            canal = args.canal - 1
+        else:
+            extension = ".wav"
+            carpetas = [generar_grabaciones_cribado(args.carpeta or tempfile.mkdtemp(prefix="benchmark_paisaje_"))]
+            canal = 0
+
+        resultado = comparar_cribado(carpetas, extension, muestras, canal)
+        #Los parámetros de los índices de CLI_paisaje.py
+        parametros = (canal, True, "hann", 1024, 0, 1024, 1000, 11250, 1, extension)
+        resultado["lote"] = procesar_cribado(carpetas, parametros, muestras, args.jobs)
+
+        with open(args.salida, 'w', encoding="utf-8") as archivo:
+            json.dump({"fecha": time.strftime("%Y-%m-%d %H:%M:%S"), "cribado": resultado}, archivo, indent=2,
+                      ensure_ascii=False)
+
+        print("Resultados guardados en " + args.salida)
+        return 0
+
+    carpeta = args.carpeta or tempfile.mkdtemp(prefix="benchmark_paisaje_")
+    carpetas = generar_grabaciones(carpeta, frecuencias, duraciones)
+
+    resultados = {"fecha": time.strftime("%Y-%m-%d %H:%M:%S"),
+                  "sistema": {"plataforma": platform.platform(), "procesador": platform.processor(),
+                              "python": platform.python_version(), "numpy": np.__version__,
+                              "scipy": scipy.__version__},
+                  "configuracion": {"frecuencias": frecuencias, "duraciones": duraciones, "formatos": FORMATOS,
+                                    "repeticiones": args.repeticiones, "jobs": args.jobs},
+                  "indices": medir_indices(frecuencias, duraciones, args.repeticiones),
+                  "flujo": {formato: medir_flujo(carpetas[formato], '.' + formato, args.jobs) for formato in FORMATOS}}
+
+    if args.precision:
+        resultados["precision"] = comparar_precision(carpetas["wav"])
+
+    with open(args.salida, 'w', encoding="utf-8") as archivo:
+        json.dump(resultados, archivo, indent=2, ensure_ascii=False)
+
+    print("Resultados guardados en " + args.salida)
+
+    if args.referencia is None:
+        return 0
+
+    with open(args.referencia, encoding="utf-8") as archivo:
+        referencia = json.load(archivo)
+
+    regresiones = comparar_resultados(resultados, referencia, args.tolerancia)
+
+    for clave, anterior, tiempo in regresiones:
+        print("REGRESIÓN %-40s %8.4f s -> %8.4f s (+%.0f%%)" % (clave, anterior, tiempo, 100 * (tiempo / anterior - 1)))
+
+    if not regresiones:
+        print("Sin regresiones respecto a " + args.referencia)
+
+    return 1 if regresiones else 0
+
+if __name__ == '__main__':
+
+    sys.exit(main())
@@ -0,0 +1,239 @@
+'''
+
+Contiene el caché en disco de los resultados por grabación (PSD de la banda de lluvia y descriptores), para que al volver
+a procesar una carpeta solo se calculen las grabaciones nuevas o modificadas. Este módulo es invocado por paisaje.py
+
+Cada resultado se guarda con una clave formada por la identidad del archivo (ruta, tamaño y fecha de modificación) y los
+parámetros del análisis. El caché se guarda en una base de datos SQLite con un tamaño máximo; al superarlo se eliminan
+los resultados usados hace más tiempo. Si cambia el código de cálculo se descartan todos los resultados guardados.
+
+Los resultados nuevos y los últimos usos se guardan en memoria y se escriben juntos en una sola transacción (ver
+confirmar), cada CONFIRMAR_CADA operaciones, al confirmar explícitamente (por ejemplo al terminar cada carpeta) y al
+cerrar. Así cada grabación no espera una escritura sincronizada en el disco, que en discos duros o carpetas de red es
+mucho más lenta que el cálculo de los descriptores en caché, y la base de datos no queda bloqueada para otros procesos
+mientras se calculan las grabaciones. Si el programa se corta, solo se pierden los resultados sin confirmar.
+'''
+
+import hashlib
+import os
+import pickle
+import sqlite3
+import time
+
+TAMANO_MAX_CACHE = 1024 * 2**20
+CONFIRMAR_CADA = 64
+RUTA_CACHE = os.path.join(os.path.expanduser("~"), ".paisaje", "cache_descriptores.sqlite")
+
+def version_codigo(rutas):
+
+    '''
+
+    Calcula una firma del código de cálculo, para invalidar el caché cuando alguno de los archivos cambia
+
+    :param rutas: recibe una lista con las rutas de los archivos de código
+    :return: str con el hash SHA-1 del contenido de los archivos
+    '''
+
+    firma = hashlib.sha1()
+
+    for ruta in rutas:
+        with open(ruta, "rb") as archivo:
+            firma.update(archivo.read())
+
+    return firma.hexdigest()
+
+class CacheDescriptores:
+
+    '''
+
+    Caché persistente de resultados por grabación, guardado en una base de datos SQLite. Cada registro guarda el
+    resultado serializado, su tamaño en bytes y el momento del último uso, que se usa para eliminar los registros menos
+    usados cuando el caché supera el tamaño máximo.
+    '''
+
+    def __init__(self, ruta, version, tamano_max=TAMANO_MAX_CACHE, confirmar_cada=CONFIRMAR_CADA):
+
+        '''
+
+        :param ruta: ruta del archivo de la base de datos; se crea si no existe (str)
+        :param version: firma del código de cálculo; si es distinta a la guardada se vacía el caché (str)
+        :param tamano_max: tamaño máximo de los resultados guardados en bytes, valor por defecto 1 GB (int)
+        :param confirmar_cada: número de resultados nuevos y usos pendientes con el que se escriben en la base de
+                               datos, valor por defecto CONFIRMAR_CADA (int)
+        '''
+
+        carpeta = os.path.dirname(os.path.abspath(ruta))
+        os.makedirs(carpeta, exist_ok=True)
+
+        self.ruta = ruta
+        self.tamano_max = tamano_max
+        self.confirmar_cada = confirmar_cada
+        # {clave: (resultado serializado, tamaño, último uso)} de los resultados nuevos sin escribir
+        self.nuevos = {}
+        # {clave: último uso} de los resultados leídos desde la última escritura
+        self.usos = {}
+        self.conexion = sqlite3.connect(ruta)
+        self.conexion.execute("CREATE TABLE IF NOT EXISTS meta (nombre TEXT PRIMARY KEY, valor TEXT)")
+        self.conexion.execute("CREATE TABLE IF NOT EXISTS resultados (clave TEXT PRIMARY KEY, valor BLOB, "
+                              "tamano INTEGER, ultimo_uso REAL)")
+        self.conexion.execute("CREATE INDEX IF NOT EXISTS uso ON resultados (ultimo_uso)")
+
+        guardada = self.conexion.execute("SELECT valor FROM meta WHERE nombre = 'version'").fetchone()
+
+        if guardada is None or guardada[0] != version:
+            self.conexion.execute("DELETE FROM resultados")
+            self.conexion.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)", (version,))
+
+        self.conexion.commit()
+
+        # El tamaño total se lee una vez y luego se actualiza con cada escritura, sin recorrer la tabla. No incluye lo
+        # que escriban otros procesos con el caché abierto al mismo tiempo
+        self.total = self.conexion.execute("SELECT COALESCE(SUM(tamano), 0) FROM resultados").fetchone()[0]
+
+    def clave(self, ruta_archivo, parametros):
+
+        '''
+
+        Construye la clave de un resultado a partir de la identidad del archivo y los parámetros del análisis
+
+        :param ruta_archivo: ruta de la grabación (str)
+        :param parametros: tupla con los parámetros del análisis, incluyendo el tipo de resultado
+        :return: str con la clave, o None si el archivo no existe
+        '''
+
+        try:
+            info = os.stat(ruta_archivo)
+        except OSError:
+            return None
+
+        identidad = (os.path.abspath(ruta_archivo), info.st_size, info.st_mtime_ns, parametros)
+        return hashlib.sha1(repr(identidad).encode("utf-8")).hexdigest()
+
+    def leer(self, clave):
+
+        '''
+
+        Busca un resultado en el caché y actualiza su último uso
+
+        :param clave: clave del resultado (str)
+        :return: el resultado guardado, o None si no está en el caché
+        '''
+
+        if clave is None:
+            return None
+
+        if clave in self.nuevos:
+            return pickle.loads(self.nuevos[clave][0])
+
+        fila = self.conexion.execute("SELECT valor FROM resultados WHERE clave = ?", (clave,)).fetchone()
+
+        if fila is None:
+            return None
+
+        self.usos[clave] = time.time()
+
+        if len(self.usos) + len(self.nuevos) >= self.confirmar_cada:
+            self.confirmar()
+
+        return pickle.loads(fila[0])
+
+    def guardar(self, clave, valor):
+
+        '''
+
+        Guarda un resultado en el caché. Se escribe en la base de datos al confirmar (ver confirmar)
+
+        :param clave: clave del resultado (str)
+        :param valor: resultado a guardar, debe poder serializarse con pickle
+        :return: None
+        '''
+
+        if clave is None:
+            return
+
+        datos = pickle.dumps(valor, protocol=pickle.HIGHEST_PROTOCOL)
+        self.nuevos[clave] = (sqlite3.Binary(datos), len(datos), time.time())
+        self.usos.pop(clave, None)
+
+        if len(self.usos) + len(self.nuevos) >= self.confirmar_cada:
+            self.confirmar()
+
+    def confirmar(self):
+
+        '''
+
+        Escribe en la base de datos los resultados nuevos y los últimos usos pendientes en una sola transacción, y
+        elimina los menos usados si se supera el tamaño máximo
+
+        :return: None
+        '''
+
+        if not self.nuevos and not self.usos:
+            return
+
+        for clave, (datos, tamano, uso) in self.nuevos.items():
+            anterior = self.conexion.execute("SELECT tamano FROM resultados WHERE clave = ?", (clave,)).fetchone()
+            self.total += tamano - (0 if anterior is None else anterior[0])
+
+        self.conexion.executemany("INSERT OR REPLACE INTO resultados VALUES (?, ?, ?, ?)",
+                                  [(clave,) + fila for clave, fila in self.nuevos.items()])
+        self.conexion.executemany("UPDATE resultados SET ultimo_uso = ? WHERE clave = ?",
+                                  [(uso, clave) for clave, uso in self.usos.items()])
+        self.nuevos = {}
+        self.usos = {}
+
+        if self.total > self.tamano_max:
+            self.depurar()
+
+        self.conexion.commit()
+
+    def depurar(self):
+
+        '''
+
+        Elimina los resultados usados hace más tiempo hasta que el caché no supere el tamaño máximo. Solo recorre los
+        registros que elimina
+
+        :return: None
+        '''
+
+        if self.total <= self.tamano_max:
+            return
+
+        eliminar = []
+
+        for clave, tamano in self.conexion.execute("SELECT clave, tamano FROM resultados ORDER BY ultimo_uso"):
+            if self.total <= self.tamano_max:
+                break
+            eliminar.append((clave,))
+            self.total -= tamano
+
+        self.conexion.executemany("DELETE FROM resultados WHERE clave = ?", eliminar)
+
+    def limpiar(self):
+
+        '''
+
+        Elimina todos los resultados del caché
+
+        :return: None
+        '''
+
+        self.nuevos = {}
+        self.usos = {}
+        self.total = 0
+        self.conexion.execute("DELETE FROM resultados")
+        self.conexion.commit()
+        self.conexion.execute("VACUUM")
+
+    def cerrar(self):
+
+        '''
+
+        Escribe los resultados pendientes y cierra la conexión con la base de datos
+
+        :return: None
+        '''
+
+        self.confirmar()
+        self.conexion.close()
@@ -0,0 +1,326 @@
+'''
+
+Contiene las estadísticas incrementales de los descriptores: los promedios diarios y los parámetros de estandarización
+(media y desviación estándar de cada índice sobre los promedios diarios) se actualizan con las grabaciones nuevas, sin
+recalcularlos sobre todas las grabaciones anteriores. Este módulo es invocado por paisaje.py
+
+Por cada día de cada grabadora se guarda el número de grabaciones, la suma y la suma de cuadrados de sus descriptores,
+de modo que al agregar grabaciones el promedio del día se actualiza en O(grabaciones nuevas). La media y la varianza de
+los promedios diarios se llevan con el algoritmo de Welford: cuando el promedio de un día cambia, su valor anterior se
+retira y el nuevo se agrega, sin recorrer los demás días. Solo cuentan los días que alcanzan el mínimo diario (5/6 de
+las grabaciones diarias esperadas, igual que promedios_diarios_df).
+
+Las estadísticas se guardan en un archivo JSON con la versión del formato y el número de actualizaciones. Los valores
+pueden diferir de los calculados de una vez en los últimos decimales, por el orden de las sumas. Los nombres de las
+grabaciones agregadas, que evitan contarlas dos veces, crecen con todo el histórico; por eso no van en el JSON sino en
+un archivo lateral (la ruta del JSON terminada en ".grabaciones") al que solo se agregan líneas. Así guardar cuesta
+O(días) por el JSON más O(grabaciones nuevas) por el archivo lateral, en lugar de reescribir todos los nombres. El
+JSON guarda la longitud válida del archivo lateral: las líneas escritas después, por ejemplo si el programa se
+interrumpe antes de reemplazar el JSON, se ignoran al leer y se descartan al guardar de nuevo.
+'''
+
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+VERSION_ESTADISTICAS = 2
+
+class EstadisticasIncrementales:
+
+    '''
+
+    Acumuladores por día y estadísticas globales de los promedios diarios de un procesamiento
+    '''
+
+    def __init__(self, grabxdia, parametros):
+
+        '''
+
+        :param grabxdia: recibe un entero con el número de grabaciones diarias esperadas
+        :param parametros: recibe una lista o tupla con los parámetros del cálculo de los descriptores; las
+                           estadísticas solo se actualizan con grabaciones calculadas con los mismos parámetros
+        '''
+
+        # Los títulos se toman de las primeras grabaciones, porque en la PSD dependen de la frecuencia de muestreo
+        self.titulos = None
+        self.grabxdia = grabxdia
+        # Se normalizan como quedan en el JSON (las tuplas pasan a listas), para compararlos con los del archivo
+        self.parametros = json.loads(json.dumps(list(parametros)))
+        self.actualizaciones = 0
+        # {(codigo, dia): [número de grabaciones, suma, suma de cuadrados, set de grabaciones]}
+        self.dias = {}
+        # Grabaciones agregadas que aún no están en el archivo lateral, y longitud en bytes de su parte válida
+        self.pendientes = []
+        self.longitud_grabaciones = 0
+        self.n = 0
+        self.media = None
+        self.m2 = None
+
+    @property
+    def min_grab(self):
+        return (self.grabxdia * 5) // 6
+
+    def agregar_welford(self, x):
+
+        '''
+
+        Agrega un promedio diario a la media y la varianza globales
+
+        :param x: recibe el vector de promedios del día (numpy array)
+        :return: None
+        '''
+
+        self.n += 1
+        delta = x - self.media
+        self.media = self.media + delta / self.n
+        self.m2 = self.m2 + delta * (x - self.media)
+
+    def retirar_welford(self, x):
+
+        '''
+
+        Retira de la media y la varianza globales un promedio diario agregado antes
+
+        :param x: recibe el vector de promedios del día (numpy array)
+        :return: None
+        '''
+
+        if self.n == 1:
+            self.n = 0
+            self.media = np.zeros_like(self.media)
+            self.m2 = np.zeros_like(self.m2)
+            return
+
+        self.n -= 1
+        media_anterior = self.media
+        self.media = media_anterior - (x - media_anterior) / self.n
+        self.m2 = self.m2 - (x - media_anterior) * (x - self.media)
+
+    def agregar(self, valores_df, tabla):
+
+        '''
+
+        Agrega los descriptores de las grabaciones que no se habían agregado antes y actualiza los promedios de sus
+        días y las estadísticas globales
+
+        :param valores_df: recibe el DataFrame con los descriptores de cada grabación, con el nombre como índice
+        :param tabla: recibe el DataFrame con el código y el día de cada grabación (ver tabla_nombres en paisaje.py)
+        :return: entero con el número de grabaciones nuevas
+        '''
+
+        if self.titulos is None:
+            self.titulos = list(valores_df)
+            self.media = np.zeros(len(self.titulos))
+            self.m2 = np.zeros(len(self.titulos))
+
+        elif list(valores_df) != self.titulos:
+            raise ValueError("Las estadísticas incrementales se calcularon con otros descriptores")
+
+        valores = valores_df.to_numpy(dtype=np.float64)
+        nuevas = {}
+
+        for i, (nombre, codigo, dia) in enumerate(zip(valores_df.index, tabla["Codigo"], tabla["Dia"])):
+            acumulador = self.dias.get((codigo, dia))
+            if acumulador is not None and nombre in acumulador[3]:
+                continue
+            nuevas.setdefault((codigo, dia), []).append(i)
+
+        for clave, filas in nuevas.items():
+            acumulador = self.dias.get(clave)
+            if acumulador is None:
+                acumulador = self.dias[clave] = [0, np.zeros(len(self.titulos)), np.zeros(len(self.titulos)), set()]
+            elif acumulador[0] >= self.min_grab:
+                self.retirar_welford(acumulador[1] / acumulador[0])
+
+            datos = valores[filas]
+            acumulador[0] += len(filas)
+            acumulador[1] = acumulador[1] + np.sum(datos, axis=0)
+            acumulador[2] = acumulador[2] + np.sum(datos ** 2, axis=0)
+            acumulador[3].update(valores_df.index[filas])
+            self.pendientes.extend((clave[0], clave[1], nombre) for nombre in valores_df.index[filas])
+
+            if acumulador[0] >= self.min_grab:
+                self.agregar_welford(acumulador[1] / acumulador[0])
+
+        if nuevas:
+            self.actualizaciones += 1
+
+        return sum(len(filas) for filas in nuevas.values())
+
+    def desviacion(self):
+
+        '''
+
+        :return: vector con la desviación estándar de cada descriptor sobre los promedios diarios (numpy array),
+                 con el mismo criterio de np.std. Es cero si no hay días completos
+        '''
+
+        if self.n == 0:
+            return np.zeros_like(self.m2)
+
+        return np.sqrt(np.maximum(self.m2, 0) / self.n)
+
+    def parametros_estandarizacion(self, titulos):
+
+        '''
+
+        :param titulos: recibe una lista con los títulos de los descriptores a estandarizar
+        :return: una tupla con la media y la desviación estándar de esos descriptores (numpy arrays)
+        '''
+
+        if self.n == 0:
+            raise ValueError("Las estadísticas incrementales no tienen días completos")
+
+        if not set(titulos) <= set(self.titulos):
+            raise ValueError("Las estadísticas incrementales no tienen todos los descriptores a estandarizar")
+
+        posiciones = [self.titulos.index(titulo) for titulo in titulos]
+        return self.media[posiciones], self.desviacion()[posiciones]
+
+    def promedios(self):
+
+        '''
+
+        :return: DataFrame con los promedios de los días completos, con el mismo formato de promedios_diarios_df
+        '''
+
+        completos = [(clave, acumulador) for clave, acumulador in self.dias.items() if acumulador[0] >= self.min_grab]
+        prom_df = pd.DataFrame([acumulador[1] / acumulador[0] for clave, acumulador in completos],
+                               index=[dia for (codigo, dia), acumulador in completos], columns=self.titulos)
+        prom_df.insert(0, "Codigo", [codigo for (codigo, dia), acumulador in completos])
+        return prom_df
+
+    def guardar(self, ruta):
+
+        '''
+
+        Guarda las estadísticas en un archivo JSON y agrega las grabaciones nuevas al archivo lateral (ver
+        ruta_grabaciones). El JSON se escribe con otro nombre y se renombra al terminar
+
+        :param ruta: recibe un str con la ruta del archivo
+        :return: None
+        '''
+
+        # Se descartan las líneas que quedaron sin confirmar en el JSON y se agregan las nuevas al final
+        lateral = ruta_grabaciones(ruta)
+
+        with open(lateral, 'r+b' if os.path.exists(lateral) else 'wb') as archivo:
+            archivo.seek(self.longitud_grabaciones)
+            archivo.truncate()
+            archivo.write("".join(json.dumps(list(grabacion), ensure_ascii=False) + "\n"
+                                  for grabacion in self.pendientes).encode("utf-8"))
+            longitud = archivo.tell()
+
+        datos = {"version": VERSION_ESTADISTICAS, "actualizaciones": self.actualizaciones,
+                 "fecha": time.strftime("%Y-%m-%d %H:%M:%S"), "titulos": self.titulos, "grabxdia": self.grabxdia,
+                 "parametros": self.parametros, "longitud_grabaciones": longitud,
+                 "global": {"n": self.n, "media": None if self.media is None else self.media.tolist(),
+                            "m2": None if self.m2 is None else self.m2.tolist(),
+                            "desviacion": None if self.m2 is None else self.desviacion().tolist()},
+                 "dias": [{"codigo": codigo, "dia": dia, "n": acumulador[0], "suma": acumulador[1].tolist(),
+                           "suma_cuadrados": acumulador[2].tolist()}
+                          for (codigo, dia), acumulador in self.dias.items()]}
+
+        temporal = ruta + ".tmp"
+
+        with open(temporal, 'w', encoding="utf-8") as archivo:
+            json.dump(datos, archivo, ensure_ascii=False)
+
+        os.replace(temporal, ruta)
+        self.longitud_grabaciones = longitud
+        self.pendientes = []
+
+    @classmethod
+    def leer(cls, ruta):
+
+        '''
+
+        Lee las estadísticas guardadas en un archivo, sin compararlas con los parámetros de un procesamiento. Los
+        archivos de la versión 1, con los nombres de las grabaciones en el JSON, se leen igual y sus nombres pasan al
+        archivo lateral la próxima vez que se guardan
+
+        :param ruta: recibe un str con la ruta del archivo
+        :return: EstadisticasIncrementales
+        '''
+
+        with open(ruta, encoding="utf-8") as archivo:
+            datos = json.load(archivo)
+
+        if datos.get("version") not in (1, VERSION_ESTADISTICAS):
+            raise ValueError("El archivo de estadísticas tiene otra versión: " + str(datos.get("version")))
+
+        estadisticas = cls(datos["grabxdia"], datos["parametros"])
+
+        if datos["titulos"] is None:
+            return estadisticas
+
+        estadisticas.titulos = datos["titulos"]
+        estadisticas.actualizaciones = datos["actualizaciones"]
+        estadisticas.n = datos["global"]["n"]
+        estadisticas.media = np.array(datos["global"]["media"], dtype=np.float64)
+        estadisticas.m2 = np.array(datos["global"]["m2"], dtype=np.float64)
+
+        for dia in datos["dias"]:
+            nombres = dia.get("grabaciones", [])
+            estadisticas.dias[(dia["codigo"], dia["dia"])] = [dia["n"], np.array(dia["suma"], dtype=np.float64),
+                                                              np.array(dia["suma_cuadrados"], dtype=np.float64),
+                                                              set(nombres)]
+            estadisticas.pendientes.extend((dia["codigo"], dia["dia"], nombre) for nombre in nombres)
+
+        if datos["version"] == 1:
+            return estadisticas
+
+        estadisticas.longitud_grabaciones = datos["longitud_grabaciones"]
+
+        lateral = ruta_grabaciones(ruta)
+        contenido = b""
+
+        if os.path.exists(lateral):
+            with open(lateral, 'rb') as archivo:
+                contenido = archivo.read(estadisticas.longitud_grabaciones)
+
+        if len(contenido) < estadisticas.longitud_grabaciones:
+            raise ValueError("Falta parte del archivo de grabaciones de las estadísticas: " + lateral)
+
+        for linea in contenido.decode("utf-8").splitlines():
+            codigo, dia, nombre = json.loads(linea)
+            estadisticas.dias[(codigo, dia)][3].add(nombre)
+
+        return estadisticas
+
+    @classmethod
+    def abrir(cls, ruta, grabxdia, parametros):
+
+        '''
+
+        Abre las estadísticas guardadas en un archivo, o crea unas nuevas si el archivo no existe
+
+        :param ruta: recibe un str con la ruta del archivo
+        Los demás parámetros son los mismos del constructor. Si no coinciden con los del archivo se lanza ValueError
+        :return: EstadisticasIncrementales
+        '''
+
+        estadisticas = cls(grabxdia, parametros)
+
+        if not os.path.exists(ruta):
+            return estadisticas
+
+        guardadas = cls.leer(ruta)
+
+        if guardadas.grabxdia != grabxdia or guardadas.parametros != estadisticas.parametros:
+            raise ValueError("El archivo de estadísticas se calculó con otros parámetros")
+
+        return guardadas
+
+def ruta_grabaciones(ruta):
+
+    '''
+
+    :param ruta: recibe un str con la ruta del archivo JSON de estadísticas
+    :return: str con la ruta del archivo lateral con los nombres de las grabaciones agregadas, una por línea
+    '''
+
+    return ruta + ".grabaciones"
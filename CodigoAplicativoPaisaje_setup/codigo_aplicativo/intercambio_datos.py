@@ -0,0 +1,157 @@
+'''
+
+Contiene el intercambio de DataFrames entre los pasos del procesamiento (paisaje.py) sin copiarlos por los Queue.
+
+Los valores numéricos de un DataFrame grande (por ejemplo, los promedios diarios de la PSD, con miles de columnas) se
+guardan una sola vez en un archivo .npy en una carpeta temporal, y por el Queue solo se envía un DescriptorDF con la ruta
+del archivo, el índice, los nombres de las columnas y las columnas no numéricas (por ejemplo "Codigo"). El paso que lo
+recibe abre el archivo como memoria mapeada (numpy.memmap), de modo que los valores no se serializan, no pasan por la
+tubería del Queue y no se copian en memoria. Se usan archivos mapeados en lugar de multiprocessing.shared_memory porque en
+Windows un bloque de memoria compartida desaparece cuando ningún proceso lo tiene abierto, y los pasos se ejecutan uno
+después del otro.
+'''
+
+import os
+import shutil
+import tempfile
+import uuid
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+# Los DataFrames con menos bytes numéricos que este valor se envían directamente por el Queue, porque para ellos es
+# más costoso crear el archivo que serializarlos
+TAMANO_MIN_INTERCAMBIO = 256 * 2**10
+
+DescriptorDF = namedtuple("DescriptorDF", "ruta indice columnas otras")
+
+def carpeta_intercambio():
+
+    '''
+
+    Retorna la carpeta temporal de intercambio del proceso actual; se crea si no existe
+
+    :return: str con la ruta de la carpeta
+    '''
+
+    carpeta = os.path.join(tempfile.gettempdir(), "paisaje_intercambio_" + str(os.getpid()))
+    os.makedirs(carpeta, exist_ok=True)
+    return carpeta
+
+def compartir_df(df):
+
+    '''
+
+    Guarda los valores numéricos de un DataFrame en un archivo .npy de la carpeta de intercambio
+
+    :param df: recibe un DataFrame
+    :return: un DescriptorDF con la ruta del archivo y los datos necesarios para reconstruir el DataFrame, o el mismo
+             DataFrame si es pequeño o si sus columnas numéricas no tienen un único tipo
+    '''
+
+    numericas = [columna for columna in df.columns if pd.api.types.is_numeric_dtype(df[columna])]
+
+    if len(set(df[numericas].dtypes)) != 1:
+        return df
+
+    valores = df[numericas].to_numpy()
+
+    if valores.nbytes < TAMANO_MIN_INTERCAMBIO:
+        return df
+
+    ruta = os.path.join(carpeta_intercambio(), uuid.uuid4().hex + ".npy")
+    np.save(ruta, valores)
+    otras = [(p, columna, df[columna].to_numpy()) for p, columna in enumerate(df.columns) if columna not in numericas]
+    return DescriptorDF(ruta, df.index, numericas, otras)
+
+def abrir_df(descriptor):
+
+    '''
+
+    Reconstruye el DataFrame de un DescriptorDF, con los valores numéricos mapeados desde el archivo (sin copiarlos)
+
+    :param descriptor: recibe un DescriptorDF
+    :return: DataFrame
+    '''
+
+    # Con "c" (copia al escribir) el DataFrame se puede modificar sin alterar el archivo
+    valores = np.load(descriptor.ruta, mmap_mode="c")
+    df = pd.DataFrame(valores, index=descriptor.indice, columns=descriptor.columnas, copy=False)
+
+    for posicion, columna, datos in descriptor.otras:
+        df.insert(posicion, columna, datos)
+
+    return df
+
+def empaquetar(objeto):
+
+    '''
+
+    Prepara un objeto para enviarlo por un Queue: los DataFrames grandes se reemplazan por su DescriptorDF (ver
+    compartir_df). Las tuplas se recorren elemento por elemento y los DescriptorDF ya creados se envían igual.
+
+    :param objeto: recibe un DataFrame, un DescriptorDF, una tupla de ellos o cualquier otro objeto
+    :return: el objeto a enviar por el Queue
+    '''
+
+    if isinstance(objeto, DescriptorDF):
+        return objeto
+
+    if isinstance(objeto, tuple):
+        return tuple(empaquetar(elemento) for elemento in objeto)
+
+    if isinstance(objeto, pd.DataFrame):
+        return compartir_df(objeto)
+
+    return objeto
+
+def desempaquetar(objeto):
+
+    '''
+
+    Reconstruye un objeto recibido por un Queue: los DescriptorDF se abren como DataFrames (ver abrir_df)
+
+    :param objeto: recibe el objeto leído del Queue
+    :return: el objeto con los DataFrames reconstruidos
+    '''
+
+    if isinstance(objeto, DescriptorDF):
+        return abrir_df(objeto)
+
+    if isinstance(objeto, tuple):
+        return tuple(desempaquetar(elemento) for elemento in objeto)
+
+    return objeto
+
+def liberar(objeto):
+
+    '''
+
+    Elimina los archivos de los DescriptorDF de un objeto recibido por un Queue, cuando ya no se usan. Si un archivo
+    todavía está abierto (en Windows no se puede eliminar), se deja para limpiar_intercambio.
+
+    :param objeto: recibe el objeto leído del Queue
+    :return: None
+    '''
+
+    if isinstance(objeto, DescriptorDF):
+        try:
+            os.remove(objeto.ruta)
+        except OSError:
+            pass
+
+    elif isinstance(objeto, tuple):
+        for elemento in objeto:
+            liberar(elemento)
+
+def limpiar_intercambio():
+
+    '''
+
+    Elimina la carpeta de intercambio del proceso actual con los archivos que queden en ella
+
+    :return: None
+    '''
+
+    shutil.rmtree(os.path.join(tempfile.gettempdir(), "paisaje_intercambio_" + str(os.getpid())), ignore_errors=True)
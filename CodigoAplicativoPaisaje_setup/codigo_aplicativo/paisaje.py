@@ -8,224 +8,789 @@ C. Isaza, D. Duque, S. Buritica and P. Caicedo. “Automatic identification of L
 '''
 
 
+import os
+import glob
+import pickle
+import hashlib
 import soundfile as sf
+import Indices
 from Indices import *
 import pandas as pd
+from functools import partial
+from multiprocessing import Pool
+from cache_descriptores import CacheDescriptores, version_codigo, RUTA_CACHE
+from planificador import Planificador
+from intercambio_datos import empaquetar, desempaquetar, liberar, limpiar_intercambio
+from perfil import sin_medir, medir_archivo, escribir_perfil, perfil_cprofile
+from salida_columnar import SalidaColumnar
+from estadisticas_incrementales import EstadisticasIncrementales
 
 # ----------------------------------------- Funciones de Procesamiento -------------------------------------------------#
 
-def algoritmo_lluvia(avance, param, salida, malas, cod_proc, fin_proc):
+BANDA_LLUVIA = (600, 1200)
+
+_pool = None
+_pool_nprocesos = 0
+
+TITULOS_INDICES = ["ACIft", "ADI", "ACItf", "BI", "TE", "ESM", "NDSI", "P", "M", "NP", "MID", "BNF", "BNT", "MD", "FM",
+                   "SF", "RMS", "CF", "ADIm1", "ADIm2", "ADIm3", "ADIm4", "ADIm5", "ADIm6", "ADIm7", "ADIm8", "ADIm9",
+                   "ADIm10", "ADIm11"]
+
+# Productos del contexto espectral que usa cada índice además del espectrograma (ver ContextoEspectral). Todos los
+# índices usan el espectrograma, porque con ACIft se detectan las grabaciones discontinuas
+PRODUCTOS_INDICES = {"TE": ["envolvente"], "M": ["envolvente"], "MD": ["welch"], "SF": ["welch"],
+                     "BNF": ["ruido_fondo"]}
+PRODUCTOS_INDICES.update({"ADIm" + str(k): ["ruido_fondo"] for k in range(1, 12)})
+
+def agregar_rechazadas(grab_malas_df, grabaciones, motivo):
 
     '''
 
-    Esta función filtra las grabaciones con altos niveles de ruido, según la publicación [1]
+    Agrega al DataFrame de grabaciones rechazadas las grabaciones indicadas con su motivo de rechazo
 
-    Además se genera un umbral automático para el reconocimiento de las grabaciones más ruidosas.
+    :param grab_malas_df: recibe un DataFrame con las grabaciones rechazadas hasta el momento
+    :param grabaciones: recibe una lista con los nombres de las grabaciones rechazadas
+    :param motivo: recibe un str con el motivo del rechazo
+    :return: DataFrame con las grabaciones rechazadas actualizado
+    '''
+
+    if len(grabaciones) == 0:
+        return grab_malas_df
+
+    nuevas_df = pd.DataFrame({"Grabaciones rechazadas": list(grabaciones), "Motivo": [motivo] * len(grabaciones)})
+    return pd.concat([grab_malas_df, nuevas_df], ignore_index=True)
+
+def leer_grabacion(ruta_archivo, canal, streaming=False, precision="float64"):
 
-    :param avance: recibe un Queue para indicar a la barra de progreso el avance del procedimiento
-    :param param: recibe un Queue con parámetros necesarios para el siguiente proceso
-    :param salida: recibe un Queue que guarda la salida del proceso
-    :param malas: recibe un Queue que guarda las grabaciones rechazadas durante el procesamiento
-    :param cod_proc: recibe un entero con el código del proceso
-    :param fin_proc: recibe un Event que indica si el proceso actual terminó
-    :return: None
     '''
 
-    canal, indices, tipo_ventana, tamano_ventana, sobreposicion, nfft, fmin, fmax, grabxdia, extension, cod_car = param.get(0)
-    param.put((canal, indices, tipo_ventana, tamano_ventana, sobreposicion, nfft, fmin, fmax, grabxdia, extension, cod_car))
-    grabaciones = salida.get(0)
-    banda_lluvia = (600, 1200)
-    n_grabs = len(grabaciones)
-    PSD_medio = np.zeros((n_grabs,))
-    grab_malas_df = pd.DataFrame(columns=["Grabaciones rechazadas", "Motivo"])
+    Lee una grabación y selecciona el canal de interés
+
+    :param ruta_archivo: recibe un str con la ruta de la grabación
+    :param canal: recibe un entero con el canal a analizar (solo se tiene en cuenta si la grabación es multicanal)
+    :param streaming: recibe un bool que indica si el archivo se lee por bloques de un minuto (True), guardando solo el
+                      canal de interés, o completo con todos sus canales (False). Valor por defecto False. Por bloques
+                      la memoria de la lectura es la de un canal completo más un minuto de todos los canales, en lugar
+                      de la de todos los canales completos; en grabaciones monoaurales no cambia. Los índices se
+                      calculan igual sobre el canal completo
+    :param precision: recibe un str con el tipo de la señal, "float64" o "float32" (precisión simple, la mitad de la
+                      memoria), valor por defecto "float64"
+    :return: una tupla con la señal monoaural (numpy array) y la frecuencia de muestreo (int)
+    '''
 
-    for i in range(n_grabs):
+    if streaming:
 
-        try:
-            x, Fs = sf.read(grabaciones[i])
-        except RuntimeError:
-            grab_malas_df.append({"Grabaciones rechazadas":grabaciones[i].split('\\')[-1], "Motivo":"Archivo corrupto"},
-                                 ignore_index=True)
-            continue
+        with sf.SoundFile(ruta_archivo) as archivo:
+            Fs = archivo.samplerate
+            columna = canal if archivo.channels > 1 else 0
+            audio = np.empty(archivo.frames, dtype=precision)
+            inicio = 0
 
-        if len(x.shape) == 1:
-            audio = x
-        else:
-            audio = x[:, canal]
+            for bloque in archivo.blocks(blocksize=Fs * 60, dtype=precision, always_2d=True):
+                audio[inicio:inicio + len(bloque)] = bloque[:, columna]
+                inicio += len(bloque)
+
+        return audio[:inicio], Fs
+
+    x, Fs = sf.read(ruta_archivo, dtype=precision)
+
+    if len(x.shape) == 1:
+        audio = x
+    else:
+        audio = x[:, canal]
+
+    return audio, Fs
+
+def psd_lluvia(audio, Fs, tipo_ventana, tamano_ventana, sobreposicion, nfft):
+
+    '''
 
+    Calcula la densidad espectral de potencia media en la banda de lluvia, minuto a minuto, según la publicación [1]
+
+    :param audio: señal monoaural temporal (numpy array) o lista con la señal de cada minuto (ver
+                  psd_lluvia_muestra)
+    :param Fs: frecuencia de muestreo en Hz (int)
+    :param tipo_ventana: tipo de ventana (str)
+    :param tamano_ventana: tamaño de la ventana (int)
+    :param sobreposicion: puntos de solapamiento entre ventanas (int)
+    :param nfft: número de puntos de la transformada de Fourier (int)
+    :return: valor medio de la PSD en la banda de lluvia (float). Lanza ValueError si la grabación no tiene minutos
+             completos
+    '''
+
+    if isinstance(audio, np.ndarray):
         puntos_minuto = Fs * 60
+        minutos = (audio[seg - puntos_minuto:seg] for seg in range(puntos_minuto, len(audio), puntos_minuto))
+    else:
+        minutos = audio
 
-        npuntos = len(audio)
-        banda = []
+    banda = []
 
-        for seg in range(puntos_minuto, npuntos, puntos_minuto):
-            f, p = signal.welch(audio[seg - puntos_minuto:seg], Fs, nperseg=tamano_ventana, window=tipo_ventana,
-                                nfft=nfft, noverlap=sobreposicion)
-            banda.append(p[np.logical_and(f >= banda_lluvia[0], f <= banda_lluvia[1])])
+    for minuto in minutos:
+        f, p = signal.welch(minuto, Fs, nperseg=tamano_ventana, window=tipo_ventana, nfft=nfft,
+                            noverlap=sobreposicion)
+        banda.append(p[np.logical_and(f >= BANDA_LLUVIA[0], f <= BANDA_LLUVIA[1])])
 
-        try:
-            banda = np.concatenate(banda)
-        except ValueError:
-            grab_malas_df.append({"Grabaciones rechazadas":grabaciones[i].split('\\')[-1], "Motivo":"Archivo corrupto"},
-                                 ignore_index=True)
-            continue
+    banda = np.concatenate(banda)
+    return np.mean(banda)
+
+def psd_lluvia_lote(audios, Fs, tipo_ventana, tamano_ventana, sobreposicion, nfft):
+
+    '''
+
+    Calcula la PSD media en la banda de lluvia de varias grabaciones del mismo tamaño, con una sola llamada a
+    signal.welch sobre todos sus minutos. El resultado de cada grabación es el mismo de psd_lluvia.
+
+    :param audios: matriz con una señal monoaural por fila (numpy array de dos dimensiones)
+    Los demás parámetros son los mismos de psd_lluvia
+    :return: vector con la PSD media de cada grabación (numpy array). Lanza ValueError si las grabaciones no tienen
+             minutos completos
+    '''
+
+    puntos_minuto = Fs * 60
+    segmentos = range(puntos_minuto, audios.shape[1], puntos_minuto)
+
+    if len(segmentos) == 0:
+        raise ValueError("Las grabaciones no tienen minutos completos")
+
+    minutos = np.stack([audios[:, seg - puntos_minuto:seg] for seg in segmentos], axis=1)
+    f, p = signal.welch(minutos, Fs, nperseg=tamano_ventana, window=tipo_ventana, nfft=nfft, noverlap=sobreposicion)
+    banda = p[..., np.logical_and(f >= BANDA_LLUVIA[0], f <= BANDA_LLUVIA[1])]
+    return np.mean(banda.reshape(len(audios), -1), axis=1)
+
+def psd_lluvia_muestra(ruta_archivo, canal, muestra, tipo_ventana, tamano_ventana, sobreposicion, nfft,
+                       precision="float64"):
+
+    '''
+
+    Estima la PSD media en la banda de lluvia decodificando solo una muestra de la grabación, para el cribado rápido.
+    El resto del archivo no se lee: con SoundFile.seek se salta directamente a cada minuto de la muestra.
+
+    :param ruta_archivo: recibe un str con la ruta de la grabación
+    :param canal: recibe un entero con el canal a analizar (solo se tiene en cuenta si la grabación es multicanal)
+    :param muestra: recibe una tupla ("minutos", K) para analizar K minutos completos repartidos uniformemente en la
+                    grabación (con K mayor o igual que los minutos de la grabación el resultado es el de psd_lluvia), o
+                    ("segundos", N) para analizar los primeros N segundos (ver validar_cribado)
+    :param precision: recibe un str con el tipo de la señal, "float64" o "float32", valor por defecto "float64"
+    Los demás parámetros son los mismos de psd_lluvia
+    :return: valor medio estimado de la PSD en la banda de lluvia (float). Igual que psd_lluvia, lanza ValueError si la
+             grabación no tiene minutos completos
+    '''
+
+    tipo, cantidad = muestra
+
+    with sf.SoundFile(ruta_archivo) as archivo:
+        Fs = archivo.samplerate
+        puntos_minuto = Fs * 60
+        columna = canal if archivo.channels > 1 else 0
+        #Los mismos minutos completos de psd_lluvia
+        inicios = range(0, archivo.frames - puntos_minuto, puntos_minuto)
+
+        if len(inicios) == 0:
+            raise ValueError("La grabación no tiene minutos completos")
+
+        if tipo == "segundos":
+            bloque = archivo.read(frames=min(cantidad * Fs, archivo.frames), dtype=precision, always_2d=True)
+            return psd_lluvia([bloque[:, columna]], Fs, tipo_ventana, tamano_ventana, sobreposicion, nfft)
+
+        minutos = []
+
+        for j in np.unique(np.linspace(0, len(inicios) - 1, min(cantidad, len(inicios))).round().astype(int)):
+            archivo.seek(inicios[j])
+            minutos.append(archivo.read(frames=puntos_minuto, dtype=precision, always_2d=True)[:, columna])
+
+    return psd_lluvia(minutos, Fs, tipo_ventana, tamano_ventana, sobreposicion, nfft)
+
+def umbral_lluvia(PSD_medio):
+
+    '''
+
+    Calcula el umbral automático para el reconocimiento de las grabaciones más ruidosas [1]. Las grabaciones con PSD
+    igual a cero (corruptas) no se tienen en cuenta.
 
-        PSD_medio[i] = np.mean(banda)
-        porcentaje = round(100 * (i + 1) / n_grabs, 2)
-        print("Corriendo algoritmo de lluvia " + str(porcentaje) + "%")
-        avance.put((cod_proc, i + 1))
+    :param PSD_medio: vector con la PSD media en la banda de lluvia de cada grabación (numpy array)
+    :return: una tupla con el umbral (float), la condición de las grabaciones buenas y la de las grabaciones ruidosas
+             (numpy arrays booleanos)
+    '''
 
     PSD_medio = np.array(PSD_medio)
     PSD_medio_sin_ceros = PSD_medio[PSD_medio > 0]
     umbral = (np.mean(PSD_medio_sin_ceros) + stats.mstats.gmean(PSD_medio_sin_ceros)) / 2
     cond_buenas = np.logical_and(PSD_medio < umbral, PSD_medio != 0)
     cond_malas = np.logical_and(PSD_medio >= umbral, PSD_medio != 0)
-    grabaciones = np.array(grabaciones)
-    grab_buenas = grabaciones[cond_buenas]
-    grab_malas = np.array([[grab.split('\\')[-1] for grab in grabaciones[cond_malas]]]).T
-    motivos = np.array([["Ruido Fuerte"]*grab_malas.shape[0]]).T
-    grab_malas_df=pd.concat([grab_malas_df, pd.DataFrame(np.hstack((grab_malas, motivos)),
-                                                         columns=["Grabaciones rechazadas", "Motivo"])],
-                            ignore_index=True)
+    return umbral, cond_buenas, cond_malas
 
-    malas.put(grab_malas_df)
-    salida.put(grab_buenas)
-    fin_proc.set()
-    avance.put((cod_proc, 0))
+class UmbralIncremental:
+
+    '''
 
-def calcular_descriptores(avance, param, salida, malas, cod_proc, fin_proc):
+    Estimación incremental del umbral de umbral_lluvia, para decidir sobre cada grabación en cuanto llega sin esperar a
+    las demás grabaciones de la carpeta. La media aritmética se lleva con la suma de las PSD medias y la media
+    geométrica con la suma de sus logaritmos, así que agregar una grabación es O(1). Con todas las grabaciones de la
+    carpeta el umbral es el de umbral_lluvia, salvo redondeo.
 
+    Con pocas grabaciones el umbral es poco confiable (con una sola, la grabación queda sobre el umbral), así que
+    mientras no se alcancen las grabaciones de calentamiento se usa el umbral previo del sitio, o no hay umbral.
     '''
 
-    Este algoritmo calcula los descriptores.
+    def __init__(self, calentamiento=1, umbral_previo=None):
+
+        '''
+
+        :param calentamiento: recibe un entero con el número de grabaciones no corruptas necesarias para estimar el
+                              umbral, valor por defecto 1
+        :param umbral_previo: recibe un float opcional con el umbral a usar durante el calentamiento, por ejemplo el
+                              umbral final de una temporada anterior del mismo sitio. Valor por defecto None
+        '''
+
+        self.calentamiento = max(calentamiento, 1)
+        self.umbral_previo = umbral_previo
+        self.n = 0
+        self.suma = 0.0
+        self.suma_log = 0.0
+
+    def agregar(self, PSD):
+
+        '''
+
+        :param PSD: recibe la PSD media en la banda de lluvia de una grabación; las corruptas (None o cero) no cuentan
+        :return: None
+        '''
+
+        if PSD is None or PSD <= 0:
+            return
+
+        self.n += 1
+        self.suma += float(PSD)
+        self.suma_log += float(np.log(PSD))
+
+    @property
+    def umbral(self):
+
+        '''
+
+        :return: float con el umbral estimado, el umbral previo durante el calentamiento, o None si no hay ninguno
+        '''
+
+        if self.n < self.calentamiento:
+            return self.umbral_previo
+
+        return (self.suma / self.n + float(np.exp(self.suma_log / self.n))) / 2
+
+def descriptores_psd(f, mspec, fmin, fmax):
 
-    :param avance: recibe un Queue para indicar a la barra de progreso el avance del procedimiento
-    :param param: recibe un Queue con parámetros necesarios para el siguiente proceso
-    :param salida: recibe un Queue que guarda la salida del proceso
-    :param malas: recibe un Queue que guarda las grabaciones rechazadas durante el procesamiento
-    :param cod_proc: recibe un entero con el código del proceso
-    :param fin_proc: recibe un Event que indica si el proceso actual terminó
-    :return: None
     '''
 
-    canal, indices, tipo_ventana, tamano_ventana, sobreposicion, nfft, fmin, fmax, grabxdia, extension, cod_car = param.get(0)
-    param.put((canal, indices, tipo_ventana, tamano_ventana, sobreposicion, nfft, fmin, fmax, grabxdia, extension, cod_car))
-    grab_buenas = salida.get(0)
-    valores = []
-    nombres_archivo = []
-    ngrab_buenas = len(grab_buenas)
-    grab_malas_df = malas.get(0)
+    Selecciona la banda del filtro en el espectro medio de una grabación, que es el descriptor PSD
+
+    :param f: vector de frecuencias del espectro medio (numpy array)
+    :param mspec: espectro medio normalizado (numpy array, ver meanspec)
+    :param fmin: frecuencia mínima del filtro en Hz (int)
+    :param fmax: frecuencia máxima del filtro en Hz (int)
+    :return: una tupla con la lista de descriptores y la lista de títulos
+    '''
 
-    for i in range(ngrab_buenas):
+    feats = list(mspec[np.logical_and(f > fmin, f < fmax)])
+    titulos = ["mPSD" + str(feat) for feat in range(len(feats))]
+    return feats, titulos
 
-        ruta_archivo = grab_buenas[i]
-        x, Fs = sf.read(ruta_archivo)
+def descriptores_grabacion(audio, Fs, indices, tipo_ventana, tamano_ventana, sobreposicion, nfft, fmin, fmax,
+                           progreso=None, medidor=None, ctx=None):
+
+    '''
+
+    Calcula los descriptores (índices o PSD) de una grabación
+
+    :param audio: señal monoaural temporal (numpy array)
+    :param Fs: frecuencia de muestreo en Hz (int)
+    :param indices: recibe True para calcular todos los índices, una tupla con los nombres de los índices a calcular
+                    (ver seleccion_indices) o False para calcular la PSD
+    :param tipo_ventana: tipo de ventana (str)
+    :param tamano_ventana: tamaño de la ventana (int)
+    :param sobreposicion: puntos de solapamiento entre ventanas (int)
+    :param nfft: número de puntos de la transformada de Fourier (int)
+    :param fmin: frecuencia mínima del filtro para la PSD en Hz (int)
+    :param fmax: frecuencia máxima del filtro para la PSD en Hz (int)
+    :param progreso: función opcional que recibe la fracción calculada de los índices, para la barra de progreso
+    :param medidor: recibe un MedidorPasos opcional que mide cada transformada y cada índice (ver perfil.py)
+    :param ctx: recibe el ContextoEspectral de la grabación, por ejemplo con las transformadas ya calculadas en lote;
+                valor por defecto None, es decir se crea uno nuevo
+    :return: una tupla con la lista de descriptores (None si la grabación es discontinua) y la lista de títulos
+    '''
+
+    medir = sin_medir if medidor is None else medidor.medir
+
+    #El contexto guarda el espectrograma, la PSD de Welch, la envolvente y el ruido de fondo para no recalcularlos
+    if ctx is None:
+        ctx = ContextoEspectral(audio, Fs, tipo_ventana, tamano_ventana, sobreposicion, nfft)
+
+    if not indices:
+        with medir("PSD"):
+            f, mspec = ctx.espectro_medio
+        return descriptores_psd(f, mspec, fmin, fmax)
+
+    if progreso is None:
+        progreso = lambda fraccion: None
+
+    titulos = TITULOS_INDICES if indices is True else list(indices)
+    bio_band = (2000, 8000)
+    tech_band = (200, 1500)
+    nmin = ctx.nmin
+
+    with medir("STFT"):
+        f, t, s = ctx.espectrograma
+
+    with medir("ACIft"):
+        ACIf = ACIft(s)
+
+    if np.isnan(ACIf):
+        return None, titulos
+
+    #Solo se calculan los productos espectrales que usan los índices pedidos. Se calculan aquí para que su tiempo no se
+    #sume al del primer índice que los usa
+    productos = {producto for titulo in titulos for producto in PRODUCTOS_INDICES.get(titulo, [])}
+
+    for producto, nombre in [("welch", "Welch"), ("envolvente", "envolvente"), ("ruido_fondo", "ruido de fondo")]:
+        if producto in productos:
+            with medir(nombre):
+                getattr(ctx, producto)
+
+    valores = {}
+    calculos = {"ACIft": lambda: ACIf,
+                "ADI": lambda: ADI(s, 10000, 1000, -50),
+                "ACItf": lambda: ACItf(audio, Fs, 5, s),
+                "BI": lambda: beta(s, f, bio_band) / nmin,
+                "TE": lambda: temporal_entropy(ctx=ctx),
+                "ESM": lambda: spectral_maxima_entropy(s, f, 482, 8820),
+                "NDSI": lambda: NDSI(s, f, bio_band, tech_band),
+                "P": lambda: rho(s, f, bio_band, tech_band),
+                "M": lambda: median_envelope(depth=16, ctx=ctx),
+                "NP": lambda: number_of_peaks(s, f, 10 * nmin),
+                "MID": lambda: mid_band_activity(s, f, 450, 3500),
+                "BNF": lambda: np.mean(background_noise_freq(ctx=ctx)),
+                "BNT": lambda: background_noise_time(wav2SPL(audio, -11, 9, 0.707), 5),
+                "MD": lambda: musicality_degree(ctx=ctx),
+                "FM": lambda: frequency_modulation(s),
+                "SF": lambda: wiener_entropy(ctx=ctx),
+                "RMS": lambda: rms(audio),
+                "CF": lambda: crest_factor(audio, valores.get("RMS")),
+                "ADIm": lambda: ADIm(s, Fs, 1000, ctx=ctx)[:11]}
+
+    feats = []
+    desplazada = False
+
+    for k, titulo in enumerate(titulos, 1):
+
+        #wav2SPL (BNT) le suma 2**-17 a la señal en el mismo arreglo, y RMS y CF siempre se han calculado después sobre
+        #esa señal. Si BNT no se pide se suma igual, para que RMS y CF den lo mismo que con todos los índices
+        if titulo in ("RMS", "CF") and "BNT" not in titulos and not desplazada:
+            audio += 2 ** -17
+            desplazada = True
+
+        if titulo.startswith("ADIm"):
+            if "ADIm" not in valores:
+                with medir("ADIm"):
+                    valores["ADIm"] = calculos["ADIm"]()
+            feats.append(valores["ADIm"][int(titulo[4:]) - 1])
 
-        if len(x.shape) == 2:
-            audio = x[:, canal]
         else:
-            audio = x
-
-        feats = []
-        if indices:
-
-            titulos = ["ACIft", "ADI", "ACItf", "BI", "TE", "ESM", "NDSI", "P", "M", "NP", "MID", "BNF", "BNT", "MD",
-                       "FM", "SF", "RMS", "CF", "ADIm1", "ADIm2", "ADIm3", "ADIm4", "ADIm5", "ADIm6", "ADIm7", "ADIm8",
-                       "ADIm9", "ADIm10", "ADIm11"]
-
-            nmin = len(audio) // (60 * Fs)
-            bio_band = (2000, 8000)
-            tech_band = (200, 1500)
-
-            f, t, s = signal.spectrogram(audio, Fs, window=tipo_ventana, nperseg=nmin * tamano_ventana,
-                                         mode="magnitude", \
-                                         noverlap=sobreposicion, nfft=nmin * nfft)
-
-            ACIf = ACIft(s)
-
-            if np.isnan(ACIf):
-                grab_malas_df.append({"Grabaciones rechazadas":grab_buenas[i].split('\\')[-1], "Motivo" : "Archivo discontinuo"},
-                                     ignore_index=True)
-                continue
-
-            step_av = 1 / 29
-            feats.append(ACIf)
-            avance.put((cod_proc, i + step_av))
-            feats.append(ADI(s, 10000, 1000, -50))
-            avance.put((cod_proc, i + 2 * step_av))
-            feats.append(ACItf(audio, Fs, 5, s))
-            avance.put((cod_proc, i + 3 * step_av))
-            feats.append(beta(s, f, bio_band) / nmin)
-            avance.put((cod_proc, i + 4 * step_av))
-            feats.append(temporal_entropy(audio, Fs))
-            avance.put((cod_proc, i + 5 * step_av))
-            feats.append(spectral_maxima_entropy(s, f, 482, 8820))
-            avance.put((cod_proc, i + 6 * step_av))
-            feats.append(NDSI(s, f, bio_band, tech_band))
-            avance.put((cod_proc, i + 7 * step_av))
-            feats.append(rho(s, f, bio_band, tech_band))
-            avance.put((cod_proc, i + 8 * step_av))
-            feats.append(median_envelope(audio, Fs, 16))
-            avance.put((cod_proc, i + 9 * step_av))
-            feats.append(number_of_peaks(s, f, 10 * nmin))
-            avance.put((cod_proc, i + 10 * step_av))
-            feats.append(mid_band_activity(s, f, 450, 3500))
-            avance.put((cod_proc, i + 11 * step_av))
-            feats.append(np.mean(background_noise_freq(s)))
-            avance.put((cod_proc, i + 12 * step_av))
-            feats.append(background_noise_time(wav2SPL(audio, -11, 9, 0.707), 5))
-            avance.put((cod_proc, i + 13 * step_av))
-            feats.append(musicality_degree(audio, Fs, tamano_ventana, nfft, tipo_ventana, sobreposicion))
-            avance.put((cod_proc, i + 14 * step_av))
-            feats.append(frequency_modulation(s))
-            avance.put((cod_proc, i + 15 * step_av))
-            feats.append(wiener_entropy(audio, tamano_ventana, nfft, tipo_ventana, sobreposicion))
-            avance.put((cod_proc, i + 16 * step_av))
-            feats.append(rms(audio))
-            avance.put((cod_proc, i + 17 * step_av))
-            feats.append(crest_factor(audio, feats[16]))
-            avance.put((cod_proc, i + 18 * step_av))
-            feats.extend(list(ADIm(s, Fs, 1000)[:11]))
+            with medir(titulo):
+                valores[titulo] = calculos[titulo]()
+            feats.append(valores[titulo])
+
+        progreso(k / len(titulos))
+
+    return feats, titulos
 
+def seleccion_indices(nombres):
+
+    '''
+
+    Convierte la lista de índices pedida por el usuario en el valor de indices que reciben las funciones de
+    procesamiento. "ADIm" equivale a ADIm1 a ADIm11.
+
+    :param nombres: recibe un str con los nombres de los índices separados por comas (ver TITULOS_INDICES), o una lista
+                    de str. Vacío significa todos los índices
+    :return: True si se piden todos los índices, o una tupla con los nombres pedidos en el orden de TITULOS_INDICES. Si
+             algún nombre no existe se lanza ValueError con el mensaje para el usuario
+    '''
+
+    if isinstance(nombres, str):
+        nombres = nombres.split(',')
+
+    pedidos = set()
+
+    for nombre in nombres:
+        nombre = nombre.strip()
+        if nombre == "":
+            continue
+        if nombre == "ADIm":
+            pedidos.update("ADIm" + str(k) for k in range(1, 12))
+        elif nombre in TITULOS_INDICES:
+            pedidos.add(nombre)
         else:
-            f, mspec = meanspec(audio, Fs, tipo_ventana, sobreposicion, tamano_ventana, nfft)
-            feats = list(mspec[np.logical_and(f > fmin, f < fmax)])
-            titulos = ["mPSD" + str(feat) for feat in range(len(feats))]
-
-        porcentaje = round(100 * (i + 1) / ngrab_buenas, 2)
-        valores.append(feats)
-        nombres_archivo.append(ruta_archivo.split('\\')[-1])
-        print("Calculando descriptores", str(porcentaje) + "%")  # mensaje en consola
-        avance.put((cod_proc, i + 1))
-
-    valores = np.array(valores)
-    valores_df = pd.DataFrame(valores, index=nombres_archivo, columns=titulos)
-    malas.put(grab_malas_df)
-    salida.put(valores_df)
-    fin_proc.set()
-    avance.put((cod_proc, 0))
+            raise ValueError("No existe el índice " + nombre)
 
-def escribir_salida(avance, salida, malas, ruta_salida, cod_proc, fin_proc, leer_excel):
+    if len(pedidos) == 0 or len(pedidos) == len(TITULOS_INDICES):
+        return True
+
+    return tuple(titulo for titulo in TITULOS_INDICES if titulo in pedidos)
+
+def lluvia_y_descriptores_archivo(ruta_archivo, canal, indices, tipo_ventana, tamano_ventana, sobreposicion, nfft, fmin,
+                                  fmax, streaming=False, progreso=None, medidor=None, precision="float64"):
+
+    '''
+
+    Lee una grabación una sola vez y calcula su PSD media en la banda de lluvia y sus descriptores. Se usa como tarea
+    de cada trabajador de extraer_lote.
+
+    :param ruta_archivo: recibe un str con la ruta de la grabación
+    :param canal: recibe un entero con el canal a analizar
+    :param streaming: recibe un bool que indica si la grabación se lee por bloques de un minuto, guardando solo el
+                      canal de interés (ver leer_grabacion), valor por defecto False
+    :param precision: recibe un str con la precisión del cálculo, "float64" o "float32", valor por defecto "float64"
+                      (ver leer_grabacion)
+    Los demás parámetros son los mismos de descriptores_grabacion
+    :return: una tupla con la PSD media (None si el archivo está corrupto), la lista de descriptores (None si la
+             grabación es discontinua) y la lista de títulos
+    '''
+
+    medir = sin_medir if medidor is None else medidor.medir
+
+    try:
+        with medir("lectura"):
+            audio, Fs = leer_grabacion(ruta_archivo, canal, streaming, precision)
+        with medir("lluvia"):
+            PSD = psd_lluvia(audio, Fs, tipo_ventana, tamano_ventana, sobreposicion, nfft)
+    except (RuntimeError, ValueError):
+        return None, None, None
+
+    feats, titulos = descriptores_grabacion(audio, Fs, indices, tipo_ventana, tamano_ventana, sobreposicion, nfft, fmin,
+                                            fmax, progreso, medidor)
+    return PSD, feats, titulos
+
+def lluvia_y_descriptores_lote(rutas, canal, indices, tipo_ventana, tamano_ventana, sobreposicion, nfft, fmin, fmax,
+                               streaming=False, precision="float64"):
+
+    '''
+
+    Igual que lluvia_y_descriptores_archivo, para un lote de grabaciones. Las grabaciones con el mismo tamaño y la misma
+    frecuencia de muestreo se apilan en una matriz y su PSD de lluvia, su espectrograma, su PSD de Welch (MD y SF) o su
+    espectro medio (PSD) se calculan en una sola llamada a scipy, lo que reduce el costo por llamada cuando hay muchas
+    grabaciones cortas. Los índices se calculan después grabación por grabación sobre esas transformadas. Se usa como
+    tarea de cada trabajador de extraer_lote.
+
+    :param rutas: recibe una lista con las rutas de las grabaciones
+    Los demás parámetros son los mismos de lluvia_y_descriptores_archivo
+    :return: lista con el resultado de lluvia_y_descriptores_archivo para cada grabación, en el mismo orden
+    '''
+
+    resultados = [(None, None, None)] * len(rutas)
+    grupos = {}
+
+    for i, ruta_archivo in enumerate(rutas):
+        try:
+            audio, Fs = leer_grabacion(ruta_archivo, canal, streaming, precision)
+        except (RuntimeError, ValueError):
+            continue
+        grupos.setdefault((Fs, len(audio)), []).append((i, audio))
+
+    productos = ["espectrograma"] if indices else ["espectro_medio"]
+
+    if indices is True or {"MD", "SF"} & set(indices or ()):
+        productos.append("welch")
+
+    for (Fs, n), grupo in grupos.items():
+        posiciones = [i for i, audio in grupo]
+        audios = np.stack([audio for i, audio in grupo])
+        del grupo
+
+        try:
+            PSDs = psd_lluvia_lote(audios, Fs, tipo_ventana, tamano_ventana, sobreposicion, nfft)
+        except ValueError:
+            continue
+
+        contextos = ContextoEspectral.lote(audios, Fs, tipo_ventana, tamano_ventana, sobreposicion, nfft, productos)
+
+        for k, i in enumerate(posiciones):
+            feats, titulos = descriptores_grabacion(audios[k], Fs, indices, tipo_ventana, tamano_ventana, sobreposicion,
+                                                    nfft, fmin, fmax, ctx=contextos[k])
+            resultados[i] = (PSDs[k], feats, titulos)
+
+    return resultados
+
+def cribado_archivo(ruta_archivo, canal, muestra, tipo_ventana, tamano_ventana, sobreposicion, nfft, streaming=False,
+                    precision="float64"):
+
+    '''
+
+    Estima la PSD media en la banda de lluvia de una grabación con psd_lluvia_muestra. Se usa como tarea de cada
+    trabajador en el cribado de extraer_lote.
+
+    :param muestra: recibe la muestra de psd_lluvia_muestra, o None para calcular la PSD con toda la grabación, igual
+                    que lluvia_y_descriptores_archivo
+    :param streaming: recibe un bool que indica si la grabación se lee por bloques cuando muestra es None, valor por
+                      defecto False (ver leer_grabacion)
+    Los demás parámetros son los mismos de psd_lluvia_muestra
+    :return: la PSD media estimada (float), o None si el archivo está corrupto
+    '''
+
+    try:
+        if muestra is None:
+            audio, Fs = leer_grabacion(ruta_archivo, canal, streaming, precision)
+            return psd_lluvia(audio, Fs, tipo_ventana, tamano_ventana, sobreposicion, nfft)
+        return psd_lluvia_muestra(ruta_archivo, canal, muestra, tipo_ventana, tamano_ventana, sobreposicion, nfft,
+                                  precision)
+    except (RuntimeError, ValueError):
+        return None
+
+def umbral_cribado(resultados):
+
+    '''
+
+    :param resultados: recibe una lista con el resultado de cribado_archivo para cada grabación de una carpeta
+    :return: float con el umbral de lluvia de la carpeta (ver umbral_lluvia)
+    '''
+
+    return umbral_lluvia([0 if PSD is None else PSD for PSD in resultados])[0]
+
+def descriptores_cribados(dependencias, ruta_archivo, canal, indices, tipo_ventana, tamano_ventana, sobreposicion, nfft,
+                          fmin, fmax, streaming=False, precision="float64"):
+
+    '''
+
+    Calcula los descriptores de una grabación solo si pasó el cribado: las grabaciones corruptas o sobre el umbral de
+    lluvia de su carpeta no se leen de nuevo ni se calculan sus descriptores. Se usa como tarea de cada trabajador en el
+    cribado de extraer_lote.
+
+    :param dependencias: recibe una lista con el umbral de lluvia de la carpeta (ver umbral_cribado) y el resultado de
+                         cribado_archivo para la grabación
+    Los demás parámetros son los mismos de lluvia_y_descriptores_archivo
+    :return: el mismo resultado de lluvia_y_descriptores_archivo, con la PSD calculada en el cribado. Las grabaciones
+             rechazadas no tienen descriptores ni títulos; al reunir la carpeta (ver reunir_lluvia_y_descriptores) el
+             umbral se calcula de nuevo con las mismas PSD, así que se rechazan igual. Si la lectura completa falla, la
+             grabación conserva su PSD y queda como discontinua, para no cambiar el umbral de la carpeta
+    '''
+
+    umbral, PSD = dependencias
+
+    if PSD is None:
+        return None, None, None
+
+    if PSD == 0 or PSD >= umbral:
+        return PSD, None, None
+
+    try:
+        audio, Fs = leer_grabacion(ruta_archivo, canal, streaming, precision)
+    except (RuntimeError, ValueError):
+        return PSD, None, None
+
+    feats, titulos = descriptores_grabacion(audio, Fs, indices, tipo_ventana, tamano_ventana, sobreposicion, nfft, fmin,
+                                            fmax)
+    return PSD, feats, titulos
+
+def obtener_pool(nprocesos):
+
+    '''
+
+    Retorna el Pool de procesos trabajadores del proceso actual. El Pool se crea la primera vez y se reutiliza en las
+    siguientes llamadas, para no importar de nuevo las librerías en cada paso o carpeta; solo se crea uno nuevo si
+    cambia el número de procesos.
+
+    :param nprocesos: recibe un entero con el número de procesos trabajadores
+    :return: el Pool de procesos
+    '''
+
+    global _pool, _pool_nprocesos
+
+    if _pool is not None and _pool_nprocesos != nprocesos:
+        cerrar_pool()
+
+    if _pool is None:
+        _pool = Pool(nprocesos)
+        _pool_nprocesos = nprocesos
+
+    return _pool
+
+def cerrar_pool():
+
+    '''
+
+    Termina el Pool de procesos trabajadores del proceso actual, si existe. Se usa al cerrar el programa o cuando una
+    tarea falla, para no dejar tareas pendientes en el Pool.
+
+    :return: None
+    '''
+
+    global _pool, _pool_nprocesos
+
+    if _pool is not None:
+        _pool.terminate()
+        _pool.join()
+
+    _pool = None
+    _pool_nprocesos = 0
+
+def abrir_cache(ruta_cache):
+
+    '''
+
+    Abre el caché de resultados por grabación. La versión del caché es la firma de Indices.py y de este módulo, de modo
+    que si cambia el cálculo de algún descriptor los resultados guardados se descartan.
+
+    :param ruta_cache: recibe un str con la ruta del archivo del caché, o None para no usar caché
+    :return: un CacheDescriptores, o None si ruta_cache es None
+    '''
+
+    if ruta_cache is None:
+        return None
+
+    return CacheDescriptores(ruta_cache, version_codigo([Indices.__file__, __file__]))
+
+def reunir_lluvia_y_descriptores(grabaciones, resultados):
+
+    '''
+
+    Reúne los resultados de lluvia_y_descriptores_archivo de todas las grabaciones de una carpeta: aplica el umbral
+    automático de lluvia sobre la carpeta y arma los DataFrames de descriptores y de grabaciones rechazadas
+
+    :param grabaciones: recibe una lista con las rutas de las grabaciones de la carpeta
+    :param resultados: recibe una lista con el resultado de lluvia_y_descriptores_archivo para cada grabación, en el
+                       mismo orden
+    :return: una tupla con el DataFrame de descriptores de las grabaciones buenas y el DataFrame de grabaciones
+             rechazadas
+    '''
+
+    n_grabs = len(grabaciones)
+    PSD_medio = np.zeros((n_grabs,))
+    valores = [None] * n_grabs
+    corruptas = []
+    titulos = TITULOS_INDICES
+
+    for i, (PSD, feats, titulos_grab) in enumerate(resultados):
+
+        if PSD is None:
+            corruptas.append(grabaciones[i].split('\\')[-1])
+            continue
+
+        PSD_medio[i] = PSD
+        valores[i] = feats
+
+        #Las grabaciones descartadas en el cribado rápido no tienen títulos
+        if titulos_grab is not None:
+            titulos = titulos_grab
+
+    umbral, cond_buenas, cond_malas = umbral_lluvia(PSD_medio)
+    nombres = [grab.split('\\')[-1] for grab in grabaciones]
+    buenas = [i for i in range(n_grabs) if cond_buenas[i] and valores[i] is not None]
+    discontinuas = [nombres[i] for i in range(n_grabs) if cond_buenas[i] and valores[i] is None]
+
+    grab_malas_df = pd.DataFrame(columns=["Grabaciones rechazadas", "Motivo"])
+    grab_malas_df = agregar_rechazadas(grab_malas_df, corruptas, "Archivo corrupto")
+    grab_malas_df = agregar_rechazadas(grab_malas_df, [nombres[i] for i in range(n_grabs) if cond_malas[i]],
+                                       "Ruido Fuerte")
+    grab_malas_df = agregar_rechazadas(grab_malas_df, discontinuas, "Archivo discontinuo")
+
+    valores_df = pd.DataFrame(np.array([valores[i] for i in buenas]), index=[nombres[i] for i in buenas],
+                              columns=titulos)
+    return valores_df, grab_malas_df
+
+def ruta_puntos_control(ruta_salida):
+
+    '''
+
+    Retorna la carpeta donde se guardan los puntos de control de una ejecución, junto a los archivos de salida
+
+    :param ruta_salida: recibe un str con la ruta de salida, sin extensión
+    :return: str con la ruta de la carpeta de puntos de control
+    '''
+
+    return ruta_salida + "_puntos_control"
+
+def archivo_punto_control(ruta_control, carpeta):
+
+    '''
+
+    Retorna la ruta del punto de control de una carpeta de grabaciones
+
+    :param ruta_control: recibe un str con la carpeta de puntos de control
+    :param carpeta: recibe un str con la carpeta de grabaciones
+    :return: str con la ruta del archivo del punto de control
+    '''
+
+    nombre = hashlib.sha1(os.path.abspath(carpeta).encode("utf-8")).hexdigest()
+    return os.path.join(ruta_control, nombre + ".pkl")
+
+def guardar_punto_control(ruta_control, carpeta, parametros, prom_df, grab_malas_df):
+
+    '''
+
+    Guarda los promedios diarios y las grabaciones rechazadas de una carpeta ya procesada, para poder reanudar la
+    ejecución sin volver a procesarla. El archivo se escribe primero con otro nombre y luego se renombra, de modo que un
+    corte durante la escritura no deja un punto de control incompleto.
+
+    :param ruta_control: recibe un str con la carpeta de puntos de control
+    :param carpeta: recibe un str con la carpeta de grabaciones
+    :param parametros: recibe una tupla con los parámetros del procesamiento (canal, indices, tipo_ventana,
+                       tamano_ventana, sobreposicion, nfft, fmin, fmax, grabxdia, extension)
+    :param prom_df: recibe un DataFrame con los promedios diarios de la carpeta
+    :param grab_malas_df: recibe un DataFrame con las grabaciones rechazadas de la carpeta
+    :return: None
+    '''
+
+    os.makedirs(ruta_control, exist_ok=True)
+    ruta_archivo = archivo_punto_control(ruta_control, carpeta)
+    punto = {"carpeta": os.path.abspath(carpeta), "parametros": tuple(parametros), "promedios": prom_df,
+             "rechazadas": grab_malas_df}
+
+    with open(ruta_archivo + ".tmp", "wb") as archivo:
+        pickle.dump(punto, archivo, protocol=pickle.HIGHEST_PROTOCOL)
 
+    os.replace(ruta_archivo + ".tmp", ruta_archivo)
+
+def leer_punto_control(ruta_control, carpeta, parametros):
+
+    '''
+
+    Lee el punto de control de una carpeta de grabaciones. Solo se usa si fue guardado con los mismos parámetros del
+    procesamiento actual.
+
+    :param ruta_control: recibe un str con la carpeta de puntos de control
+    :param carpeta: recibe un str con la carpeta de grabaciones
+    :param parametros: recibe una tupla con los parámetros del procesamiento, igual que en guardar_punto_control
+    :return: una tupla con los promedios diarios y las grabaciones rechazadas (DataFrames), o None si la carpeta no
+             tiene un punto de control válido
     '''
 
-    Esta función escribe los resultados en dos archivos:
+    ruta_archivo = archivo_punto_control(ruta_control, carpeta)
+
+    try:
+        with open(ruta_archivo, "rb") as archivo:
+            punto = pickle.load(archivo)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return None
+
+    if punto["carpeta"] != os.path.abspath(carpeta) or punto["parametros"] != tuple(parametros):
+        return None
+
+    return punto["promedios"], punto["rechazadas"]
+
+def escribir_archivos(salida, grab_malas_df, ruta_salida):
+
+    '''
+
+    Escribe los resultados en dos archivos:
 
     -Un excel que contiene además de los valores resultantes, una hoja con la lista de las grabaciones "dañadas"
     -Un archivo .dat que es utilizado por SALSA para el reconocimiento automático.
 
-    :param avance: recibe un Queue para indicar a la barra de progreso el avance del procedimiento
-    :param salida: recibe un Queue que guarda la salida del proceso
-    :param malas: recibe un Queue que guarda las grabaciones rechazadas durante el procesamiento
-    :param ruta_salida: recibe un str con la ruta absoluta de salida, en donde serán guardados los archivos resultantes
-    :param cod_proc: recibe un entero con el código del proceso
-    :param fin_proc: recibe un Event que indica si el proceso actual terminó
-    :param leer_excel: recibe un Event que indica que el archivo excel de salida está disponible para escribir
-    :return: None
+    :param salida: recibe una tupla con el DataFrame de promedios diarios (PSD) o con los DataFrames de promedios sin
+                   estandarizar y estandarizados (Índices)
+    :param grab_malas_df: recibe un DataFrame con las grabaciones rechazadas
+    :param ruta_salida: recibe un str con la ruta absoluta de salida, sin extensión
+    :return: None. Si el archivo excel está abierto en otro programa se lanza PermissionError
     '''
 
-    grab_malas_df = malas.get(0)
-    salida = salida.get(0)
     ispsd = len(salida) == 1
 
     if ispsd:
@@ -260,43 +825,66 @@ def escribir_salida(avance, salida, malas, ruta_salida, cod_proc, fin_proc, leer
         valores_df.to_excel(writer, index_label="Dia", sheet_name="estandarizados")
 
     grab_malas_df.to_excel(writer, sheet_name="rechazadas")
+    writer.close()
+
+def escribir_salida(avance, salida, malas, ruta_salida, cod_proc, fin_proc, leer_excel):
+
+    '''
+
+    Esta función escribe los resultados en los archivos de salida (ver escribir_archivos). Si el archivo excel está
+    abierto, avisa a la interfaz y espera a que se cierre para intentarlo de nuevo.
+
+    :param avance: recibe un Queue para indicar a la barra de progreso el avance del procedimiento
+    :param salida: recibe un Queue que guarda la salida del proceso
+    :param malas: recibe un Queue que guarda las grabaciones rechazadas durante el procesamiento
+    :param ruta_salida: recibe un str con la ruta absoluta de salida, en donde serán guardados los archivos resultantes
+    :param cod_proc: recibe un entero con el código del proceso
+    :param fin_proc: recibe un Event que indica si el proceso actual terminó
+    :param leer_excel: recibe un Event que indica que el archivo excel de salida está disponible para escribir
+    :return: None
+    '''
 
+    grab_malas_df = malas.get(0)
+    recibido = salida.get(0)
+    salida = desempaquetar(recibido)
     excel_abierto = True
 
     while excel_abierto and leer_excel.wait():
         try:
-            writer.close()
+            escribir_archivos(salida, grab_malas_df, ruta_salida)
             excel_abierto = False
         except PermissionError:
             leer_excel.clear()
             fin_proc.set()
             avance.put((-2, None))
 
+    del salida
+    liberar(recibido)
     fin_proc.set()
     avance.put((cod_proc, 0))
 
-def estandarizar(recalcular, avance, salida, cod_proc, fin_proc):
+def estandarizar_df(valores_df, recalcular, estadisticas=None):
 
     '''
 
-    Esta función estandariza los valores resultantes para el caso de los índices.
+    Estandariza los promedios diarios de los índices.
 
+    :param valores_df: recibe un DataFrame con los promedios diarios, incluyendo la columna "Codigo"
     :param recalcular: recibe un bool que indica si se recalculan los parámetros para la estandarización (True) o no (False)
-    :param avance: recibe un Queue para indicar a la barra de progreso el avance del procedimiento
-    :param salida: recibe un Queue que guarda la salida del proceso
-    :param cod_proc: recibe un entero con el código del proceso
-    :param fin_proc: recibe un Event que indica si el proceso actual terminó
-    :return: None
+    :param estadisticas: recibe unas EstadisticasIncrementales opcionales de las que se toman los parámetros cuando no
+                         se recalculan, en lugar de los parámetros fijos; si aún no tienen días completos se usan
+                         los fijos. Valor por defecto None
+    :return: DataFrame con los valores estandarizados
     '''
 
-    valores_df = salida.get(0)
-    valores_df = valores_df[0]
     valores_df_nocod = valores_df.drop("Codigo", axis=1)
     valores = valores_df_nocod.values
 
     if recalcular:
         mean_data = np.mean(valores, axis=0)
         std_data = np.std(valores, axis=0)
+    elif estadisticas is not None and estadisticas.n > 0:
+        mean_data, std_data = estadisticas.parametros_estandarizacion(list(valores_df_nocod))
     else:
         '''
         orden = ["ACIft", "ADI", "ACItf", "BI", "TE", "ESM", "NDSI", "P", "M", "NP", "MID", "BNF", "BNT", "MD", "FM", 
@@ -316,80 +904,819 @@ def estandarizar(recalcular, avance, salida, cod_proc, fin_proc):
                              0.020473526, 0.022824243, 0.023105743, 0.022028239, 0.025576337, 0.024031996, 0.026575113,
                              0.028468976, 0.028189446, 0.028091119])
 
+        #Se toman los parámetros de los índices calculados, que pueden ser solo algunos (ver seleccion_indices)
+        posiciones = [TITULOS_INDICES.index(titulo) for titulo in valores_df_nocod]
+        mean_data = mean_data[posiciones]
+        std_data = std_data[posiciones]
+
     std_valores = (valores - mean_data) / (std_data)
     titulos_desc = list(valores_df_nocod)
     std_df = pd.DataFrame(std_valores, index=valores_df.index.values, columns=titulos_desc)
     std_df["Codigo"] = valores_df["Codigo"]
     std_df = std_df[["Codigo"] + titulos_desc]
-    salida.put((valores_df, std_df))
-    fin_proc.set()
-    avance.put((cod_proc, None))
+    return std_df
 
-def promedios_diarios(avance, param, salida, malas, cod_proc, fin_proc):
+def estandarizar(recalcular, avance, salida, cod_proc, fin_proc, ruta_estadisticas=None):
 
     '''
 
-    Calcula los promedios diarios de los descriptores
+    Esta función estandariza los valores resultantes para el caso de los índices (ver estandarizar_df).
 
+    :param recalcular: recibe un bool que indica si se recalculan los parámetros para la estandarización (True) o no (False)
     :param avance: recibe un Queue para indicar a la barra de progreso el avance del procedimiento
-    :param param: recibe un Queue con parámetros necesarios para el siguiente proceso
     :param salida: recibe un Queue que guarda la salida del proceso
-    :param malas: recibe un Queue que guarda las grabaciones rechazadas durante el procesamiento
     :param cod_proc: recibe un entero con el código del proceso
     :param fin_proc: recibe un Event que indica si el proceso actual terminó
+    :param ruta_estadisticas: recibe un str con la ruta del archivo de estadísticas incrementales que actualizó
+                              lote_descriptores, valor por defecto None, se estandariza con los parámetros fijos
     :return: None
     '''
 
-    canal, indices, tipo_ventana, tamano_ventana, sobreposicion, nfft, fmin, fmax, grabxdia, extension, cod_car = param.get(0)
-    param.put((canal, indices, tipo_ventana, tamano_ventana, sobreposicion, nfft, fmin, fmax, grabxdia, extension, cod_car))
-    valores_df = salida.get(0)
-    grab_malas_df = malas.get(0)
-    nombres_archivo = valores_df.index.values
-    valores = valores_df.values
+    recibido = salida.get(0)[0]
+    valores_df = desempaquetar(recibido)
+    estadisticas = None
+
+    #El archivo no existe si ninguna carpeta terminó con grabaciones buenas
+    if ruta_estadisticas is not None and os.path.exists(ruta_estadisticas):
+        estadisticas = EstadisticasIncrementales.leer(ruta_estadisticas)
+
+    # Los promedios sin estandarizar siguen al paso de escritura con el mismo descriptor, sin volver a copiarlos
+    salida.put((recibido, empaquetar(estandarizar_df(valores_df, recalcular, estadisticas))))
+    fin_proc.set()
+    avance.put((cod_proc, None))
+
+def tabla_nombres(nombres_archivo):
+
+    '''
+
+    Separa los nombres de las grabaciones, con el formato de las grabadoras CODIGO_AAAAMMDD_HHMMSS, en una tabla con
+    el código de la grabadora, el día y la hora. Todos los nombres se procesan juntos, una sola vez.
+
+    :param nombres_archivo: recibe un arreglo o lista con los nombres (o rutas) de las grabaciones
+    :return: DataFrame con las columnas Codigo, Dia (AAAAMMDD) y Hora (HHMMSS), en el orden de los nombres
+    '''
 
-    dias = []
+    partes = pd.Series(nombres_archivo, dtype=object).str.split('_')
+    return pd.DataFrame({"Codigo": partes.str[0], "Dia": partes.str[-2], "Hora": partes.str[-1].str[:6]})
+
+def promedios_diarios_df(valores_df, grab_malas_df, grabxdia):
+
+    '''
+
+    Calcula los promedios diarios de los descriptores. Los días con menos de 5/6 de las grabaciones diarias esperadas se
+    descartan y sus grabaciones se agregan a las rechazadas.
+
+    :param valores_df: recibe un DataFrame con los descriptores de cada grabación
+    :param grab_malas_df: recibe un DataFrame con las grabaciones rechazadas
+    :param grabxdia: recibe un entero con el número de grabaciones diarias esperadas
+    :return: una tupla con el DataFrame de promedios diarios y el DataFrame de grabaciones rechazadas
+    '''
+
+    nombres_archivo = valores_df.index.values
+    tabla = tabla_nombres(nombres_archivo)
     min_grab = (grabxdia * 5) // 6
-    cdias = []
-    codigos = []
-    nfeats = valores.shape[1]
-    prom_dia = np.empty((0, nfeats))
-
-    for nombre in nombres_archivo:
-        div_nombre = nombre.split('_')
-        dia_str = div_nombre[-2]
-        if dia_str not in dias:
-            dias.append(dia_str)
-
-    ndias = len(dias)
-
-    for d in range(ndias):
-        ind_dia = [i for i, nombre_archivo in enumerate(nombres_archivo) if nombre_archivo.split('_')[-2] == dias[d]]
-        ndia = len(ind_dia)
-
-        if ndia < min_grab:
-            motivos = np.array([ndia*["No alcanza el mínimo diario"]]).T
-            grab_malas = np.array([nombres_archivo[ind_dia]]).T
-            grab_malas_df = pd.concat([grab_malas_df, pd.DataFrame(np.hstack((grab_malas, motivos)),
-                                                                   columns=["Grabaciones rechazadas", "Motivo"])],
-                                      ignore_index=True)
-            continue
 
-        codigos.append(nombres_archivo[ind_dia[0]].split('_')[0]) #Ojo, se asume que todos los archivos de la carpeta tienen el mismo código
-        cdias.append(dias[d])
-        datos_dia = valores[ind_dia, :]
-        prom_dia = np.append(prom_dia, np.array([np.mean(datos_dia, axis=0)]), axis=0)
-        porcentaje = round(100 * (d + 1) / ndias, 2)
-        print("Calculando promedios diarios", str(porcentaje) + "%")
+    #Días numerados en el orden en que aparecen; el ordenamiento estable agrupa las grabaciones de cada día sin cambiar
+    #su orden, así que cada día es un bloque contiguo
+    num_dia, dias = pd.factorize(tabla["Dia"])
+    ngrab_dia = np.bincount(num_dia, minlength=len(dias))
+    orden = np.argsort(num_dia, kind="stable")
+    inicios = np.concatenate(([0], np.cumsum(ngrab_dia)[:-1])).astype(int)
+    completos = ngrab_dia >= min_grab
+
+    incompletas = orden[~completos[num_dia[orden]]]
+    grab_malas_df = agregar_rechazadas(grab_malas_df, nombres_archivo[incompletas], "No alcanza el mínimo diario")
+
+    valores = valores_df.values[orden]
+    prom_dia = np.empty((np.count_nonzero(completos), valores.shape[1]))
+
+    #np.mean sobre las filas de cada día, igual que con el día por separado, para obtener los mismos valores
+    for fila, d in enumerate(np.flatnonzero(completos)):
+        prom_dia[fila] = np.mean(valores[inicios[d]:inicios[d] + ngrab_dia[d]], axis=0)
 
+    print("Calculando promedios diarios 100.0%")
+
+    #Ojo, se asume que todos los archivos del día tienen el mismo código; se toma el de la primera grabación
+    codigos = list(tabla["Codigo"].values[orden[inicios[completos]]])
     titulos_desc = list(valores_df)
-    prom_df = pd.DataFrame(prom_dia, index=cdias, columns=titulos_desc)
+    prom_df = pd.DataFrame(prom_dia, index=list(dias[completos]), columns=titulos_desc)
     prom_df["Codigo"] = codigos
     prom_df = prom_df[["Codigo"] + titulos_desc]
+    return prom_df, grab_malas_df
+
+def buscar_carpetas(carpeta_grabaciones, subcarpetas, extension):
+
+    '''
+
+    Busca las carpetas con grabaciones a procesar
+
+    :param carpeta_grabaciones: recibe un str con la carpeta de grabaciones
+    :param subcarpetas: recibe un bool que indica si se buscan grabaciones en las subcarpetas (True) o solo en la
+                        carpeta (False)
+    :param extension: recibe un str con la extensión de las grabaciones, incluyendo el punto
+    :return: lista con las carpetas que contienen grabaciones
+    '''
+
+    if not subcarpetas:
+        if len(glob.glob(carpeta_grabaciones + '/*' + extension)) == 0:
+            return []
+        return [carpeta_grabaciones]
+
+    carpetas = []
+
+    for root, dirs, files in os.walk(carpeta_grabaciones):
+        for file in files:
+            if extension in file:
+                carpetas.append(root)
+                break
+
+    return carpetas
+
+def validar_parametros(subcarpetas, carpeta_grabaciones, extension, canal_str, indices, fmin_str, fmax_str,
+                       tamano_ventana_str, carpeta_salida, grabxdia_str, nprocesos_str, indices_str="",
+                       requiere_grabaciones=True):
+
+    '''
+
+    Verifica los parámetros del procesamiento, tal como se ingresan en la interfaz o en la línea de comandos, y los
+    convierte a los valores que usan las funciones de procesamiento
+
+    :param subcarpetas: recibe un bool que indica si se buscan grabaciones en las subcarpetas
+    :param carpeta_grabaciones: recibe un str con la carpeta de grabaciones
+    :param extension: recibe un str con la extensión de las grabaciones, incluyendo el punto
+    :param canal_str: recibe un str con el canal a analizar, empezando en 1
+    :param indices: recibe un bool que indica si se calculan índices (True) o PSD (False)
+    :param fmin_str: recibe un str con la frecuencia mínima del filtro en Hz
+    :param fmax_str: recibe un str con la frecuencia máxima del filtro en Hz
+    :param tamano_ventana_str: recibe un str con el tamaño de la ventana para la PSD
+    :param carpeta_salida: recibe un str con la carpeta donde se guardan los resultados
+    :param grabxdia_str: recibe un str con el número de grabaciones diarias esperadas
+    :param nprocesos_str: recibe un str con el número de procesos trabajadores
+    :param indices_str: recibe un str con los nombres de los índices a calcular separados por comas (ver
+                        seleccion_indices), valor por defecto "", es decir todos
+    :param requiere_grabaciones: recibe un bool que indica si la carpeta debe tener grabaciones, valor por defecto True.
+                                 Con False (por ejemplo al vigilar una carpeta que empieza vacía) basta con que la
+                                 carpeta exista; si no tiene grabaciones, el canal y la ventana no se comparan con la
+                                 primera de ellas
+    :return: una tupla con la lista de carpetas a procesar y la tupla de parámetros del procesamiento (canal, indices,
+             tipo_ventana, tamano_ventana, sobreposicion, nfft, fmin, fmax, grabxdia, extension). Si algún valor no es
+             válido se lanza ValueError con el mensaje para el usuario
+    '''
+
+    carpetas = buscar_carpetas(carpeta_grabaciones, subcarpetas, extension)
+
+    if len(carpetas) == 0 and requiere_grabaciones:
+        raise ValueError("No se encontraron grabaciones")
+
+    if not os.path.isdir(carpeta_grabaciones):
+        raise ValueError("Ingrese una carpeta de grabaciones válida")
+
+    grabaciones = glob.glob(carpetas[0] + '/*' + extension) if carpetas else []
+    x = None
+
+    for grab in grabaciones:
+        try:
+            x, Fs = sf.read(grab)
+            break
+        except:
+            pass
+
+    if x is None and requiere_grabaciones:
+        raise ValueError("No se encontraron grabaciones")
+
+    if not (canal_str+grabxdia_str+fmin_str+fmax_str+tamano_ventana_str+nprocesos_str).isnumeric():
+        raise ValueError("Ingrese valores numéricos")
+
+    if int(nprocesos_str) < 1:
+        raise ValueError("Ingrese al menos un proceso")
+
+    canal = int(canal_str) - 1
+
+    if x is not None and len(x.shape) <= canal:
+        raise ValueError("No existe el canal " + str(canal + 1))
+
+    tipo_ventana = "hann"
+    sobreposicion = 0
+    tamano_ventana = int(tamano_ventana_str)
+    fmin = int(fmin_str)
+    fmax = int(fmax_str)
+
+    if indices:
+        indices = seleccion_indices(indices_str)
+        tamano_ventana = 1024
+
+    elif x is not None and tamano_ventana > Fs // 2:
+        raise ValueError("Ventana demasiado grande")
+
+    nfft = tamano_ventana
+
+    if not os.path.isdir(carpeta_salida):
+        raise ValueError("Ingrese un directorio de salida válido")
+
+    grabxdia = int(grabxdia_str)
+
+    return carpetas, (canal, indices, tipo_ventana, tamano_ventana, sobreposicion, nfft, fmin, fmax, grabxdia, extension)
+
+def validar_entradas(avance, param, salida, cod_proc, fin_proc):
+
+    '''
+    Esta función verifica que los valores ingresados en la interfaz sean correctos (ver validar_parametros). Si hay un
+    error, envía a la interfaz el mensaje (-1, mensaje de error)
+
+    :param avance: recibe un Queue para indicar a la barra de progreso el avance del procedimiento
+    :param param: recibe un Queue con parámetros necesarios para el siguiente proceso
+    :param salida: recibe un Queue que guarda la salida del proceso
+    :param cod_proc: recibe un entero con el código del proceso
+    :param fin_proc: recibe un Event que indica si el proceso actual terminó
+    :return: retorna None
+    '''
+
+    try:
+        carpetas, parametros = validar_parametros(*param.get())
+    except ValueError as error:
+        fin_proc.set()
+        avance.put((-1, str(error)))
+        return
+
+    salida.put(carpetas)
+    param.put(parametros)
+    fin_proc.set()
+    avance.put((cod_proc, None))
+
+def reunir_carpeta(resultados, carpeta, grabaciones, parametros, ruta_control=None, columnar=None, estadisticas=None,
+                   ruta_estadisticas=None):
+
+    '''
+
+    Reúne los resultados por grabación de una carpeta, calcula sus promedios diarios y guarda su punto de control
+
+    :param resultados: recibe una lista con el resultado de lluvia_y_descriptores_archivo para cada grabación
+    :param carpeta: recibe un str con la carpeta de grabaciones
+    :param grabaciones: recibe una lista con las rutas de las grabaciones de la carpeta
+    :param parametros: recibe la tupla de parámetros que retorna validar_parametros
+    :param ruta_control: recibe un str con la carpeta de puntos de control, valor por defecto None, sin punto de control
+    :param columnar: recibe la SalidaColumnar en la que se agregan los descriptores y los promedios de la carpeta,
+                     valor por defecto None, sin salida columnar
+    :param estadisticas: recibe las EstadisticasIncrementales a las que se agregan las grabaciones buenas de la
+                         carpeta, valor por defecto None
+    :param ruta_estadisticas: recibe un str con la ruta del archivo donde se guardan las estadísticas antes del punto
+                              de control, valor por defecto None, no se guardan
+    :return: una tupla con el DataFrame de promedios diarios y el DataFrame de grabaciones rechazadas
+    '''
+
+    valores_df, grab_malas_df = reunir_lluvia_y_descriptores(grabaciones, resultados)
+    prom_df, grab_malas_df = promedios_diarios_df(valores_df, grab_malas_df, parametros[8])
+
+    #Antes del punto de control, para que las carpetas reanudadas ya tengan su salida columnar y sus estadísticas en
+    #disco. Si la ejecución se corta entre los dos pasos, la carpeta se procesa de nuevo y sus grabaciones no se
+    #agregan dos veces a las estadísticas
+    if columnar is not None:
+        columnar.agregar(carpeta, valores_df, prom_df)
+
+    if estadisticas is not None:
+        estadisticas.agregar(valores_df, tabla_nombres(valores_df.index.values))
+        if ruta_estadisticas is not None:
+            estadisticas.guardar(ruta_estadisticas)
+
+    if ruta_control is not None:
+        guardar_punto_control(ruta_control, carpeta, parametros, prom_df, grab_malas_df)
+
+    return prom_df, grab_malas_df
+
+def barrido_psd_archivo(ruta_archivo, canal, ventanas, bandas, tipo_ventana="hann", sobreposicion=0, streaming=False,
+                        precision="float64"):
+
+    '''
+
+    Lee una grabación una sola vez y calcula su PSD media en la banda de lluvia y su espectro medio para cada tamaño de
+    ventana, sobre la misma señal en memoria. Las bandas del filtro se aplican después como cortes del espectro medio,
+    sin calcularlo de nuevo. Se usa como tarea de cada trabajador de procesar_barrido.
+
+    :param ruta_archivo: recibe un str con la ruta de la grabación
+    :param canal: recibe un entero con el canal a analizar
+    :param ventanas: recibe una lista con los tamaños de ventana; la FFT usa el mismo número de puntos
+    :param bandas: recibe una lista de tuplas (fmin, fmax) con las bandas del filtro en Hz
+    Los demás parámetros son los mismos de lluvia_y_descriptores_archivo
+    :return: diccionario {(tamano_ventana, fmin, fmax): resultado de lluvia_y_descriptores_archivo con esa
+             configuración}
+    '''
+
+    resultados = dict.fromkeys([(ventana, fmin, fmax) for ventana in ventanas for fmin, fmax in bandas],
+                               (None, None, None))
+
+    try:
+        audio, Fs = leer_grabacion(ruta_archivo, canal, streaming, precision)
+    except (RuntimeError, ValueError):
+        return resultados
+
+    for ventana in ventanas:
+        try:
+            PSD = psd_lluvia(audio, Fs, tipo_ventana, ventana, sobreposicion, ventana)
+        except ValueError:
+            continue
+
+        f, mspec = meanspec(audio, Fs, tipo_ventana, sobreposicion, ventana, ventana)
+
+        for fmin, fmax in bandas:
+            resultados[(ventana, fmin, fmax)] = (PSD,) + descriptores_psd(f, mspec, fmin, fmax)
+
+    return resultados
+
+def tomar_resultado(resultados, posicion):
+
+    '''
+
+    Toma el resultado de una grabación de los resultados de su lote (ver lluvia_y_descriptores_lote)
+
+    :param resultados: recibe una lista con el resultado del lote, que es la dependencia de la tarea
+    :param posicion: recibe un entero con la posición de la grabación en el lote
+    :return: el resultado de la grabación
+    '''
+
+    return resultados[0][posicion]
+
+def abrir_estadisticas(ruta_estadisticas, parametros, precision="float64", cribado=None):
+
+    '''
+
+    Abre el archivo de estadísticas incrementales de un procesamiento, o crea unas estadísticas nuevas si no existe
+
+    :param ruta_estadisticas: recibe un str con la ruta del archivo de estadísticas
+    :param parametros: recibe la tupla de parámetros que retorna validar_parametros
+    :param precision: recibe un str con la precisión del cálculo, "float64" o "float32", valor por defecto "float64"
+    :param cribado: recibe una tupla opcional con la muestra del cribado rápido de lluvia (ver validar_cribado), que
+                    cambia qué grabaciones se descartan por lluvia. Valor por defecto None, sin cribado
+    :return: EstadisticasIncrementales. Si el archivo se calculó con otros parámetros se lanza ValueError
+    '''
+
+    #Las grabaciones diarias se validan aparte, porque cambian qué días cuentan pero no los descriptores. Sin cribado
+    #los parámetros no cambian, para conservar los archivos de ejecuciones anteriores
+    parametros_estadisticas = parametros[:8] + (parametros[9], precision)
+
+    if cribado is not None:
+        parametros_estadisticas += (("cribado",) + tuple(cribado),)
+
+    return EstadisticasIncrementales.abrir(ruta_estadisticas, parametros[8], parametros_estadisticas)
+
+def extraer_lote(carpetas, parametros, nprocesos=1, streaming=False, ruta_cache=None, ruta_control=None, reanudar=False,
+                 progreso=None, perfil=None, perfil_memoria=False, lote_stft=1, precision="float64", columnar=None,
+                 estadisticas=None, cribado=None, ruta_estadisticas=None, separar_lluvia=True):
+
+    '''
+
+    Calcula los promedios diarios de todas las carpetas con un Planificador: las grabaciones de todas las carpetas se
+    reparten en un mismo Pool de nprocesos trabajadores, y cada carpeta se reúne (umbral de lluvia, promedios diarios y
+    punto de control) en cuanto terminan sus grabaciones. Así una carpeta empieza a procesarse mientras terminan las
+    últimas grabaciones de la anterior, sin superar nprocesos trabajadores en total. El resultado es el mismo de
+    procesar las carpetas una por una y unir sus promedios en orden.
+
+    :param carpetas: recibe una lista con las carpetas de grabaciones
+    :param parametros: recibe la tupla de parámetros que retorna validar_parametros
+    :param nprocesos: recibe un entero con el número de procesos trabajadores, valor por defecto 1
+    :param streaming: recibe un bool que indica si las grabaciones se leen por bloques de un minuto, guardando solo el
+                      canal de interés (ver leer_grabacion), valor por defecto False
+    :param ruta_cache: recibe un str con la ruta del caché de resultados por grabación, valor por defecto None, sin
+                       caché
+    :param ruta_control: recibe un str con la carpeta de puntos de control, valor por defecto None, sin puntos de control
+    :param reanudar: recibe un bool que indica si las carpetas con punto de control se toman de él, valor por defecto
+                     False
+    :param progreso: función opcional que recibe el número de grabaciones terminadas de todas las carpetas
+    :param perfil: recibe un diccionario opcional en el que se guardan las mediciones de tiempo y memoria de cada
+                   grabación calculada, con la ruta de la grabación como llave (ver perfil.py). Las grabaciones
+                   tomadas del caché o de un punto de control no se miden
+    :param perfil_memoria: recibe un bool que indica si en el perfil también se mide la memoria, valor por defecto False
+    :param lote_stft: recibe un entero con el número de grabaciones pendientes de una carpeta que cada trabajador
+                      calcula juntas (ver lluvia_y_descriptores_lote), valor por defecto 1, grabación por grabación.
+                      No se usa con el perfil, que mide cada grabación por separado
+    :param precision: recibe un str con la precisión del cálculo, "float64" o "float32", valor por defecto "float64"
+                      (ver leer_grabacion). Los resultados en float32 se guardan en el caché aparte de los de float64
+    :param columnar: recibe una SalidaColumnar opcional en la que se agrega cada carpeta al terminarla (ver
+                     reunir_carpeta), valor por defecto None
+    :param estadisticas: recibe unas EstadisticasIncrementales opcionales a las que se agrega cada carpeta al
+                         terminarla (ver reunir_carpeta), valor por defecto None. Al reanudar, las carpetas del punto de
+                         control con días que no están en las estadísticas se procesan de nuevo
+    :param cribado: recibe una tupla opcional con la muestra del cribado rápido de lluvia (ver validar_cribado). Con
+                    cribado, la PSD de lluvia de cada grabación se estima con una muestra (ver cribado_archivo), el
+                    umbral de cada carpeta se calcula en cuanto terminan sus cribados y solo las grabaciones que lo
+                    pasan se leen completas para calcular sus descriptores. No se puede usar con el perfil, y los lotes
+                    de lote_stft no se usan. Valor por defecto None, la PSD de lluvia se calcula con toda la grabación
+    :param ruta_estadisticas: recibe un str con la ruta del archivo donde se guardan las estadísticas al terminar cada
+                              carpeta, valor por defecto None, no se guardan
+    :param separar_lluvia: recibe un bool que indica si, sin cribado rápido, la PSD de lluvia de todas las grabaciones
+                           se calcula primero (con toda la grabación, ver cribado_archivo) y solo las que pasan el
+                           umbral de su carpeta se leen de nuevo para calcular sus descriptores (True), o si cada
+                           grabación se lee una sola vez y se calculan su PSD y sus descriptores (False, ver
+                           lluvia_y_descriptores_archivo). El resultado es el mismo; separar evita calcular los índices
+                           de las grabaciones con ruido fuerte a cambio de leer dos veces las demás (ver
+                           benchmark_paisaje.py --cribado). Con el perfil o con lotes de lote_stft siempre se usa una
+                           sola lectura. Valor por defecto True
+    :return: una tupla con el DataFrame de promedios diarios y el DataFrame de grabaciones rechazadas de todas las
+             carpetas
+    '''
+
+    canal, indices, tipo_ventana, tamano_ventana, sobreposicion, nfft, fmin, fmax, grabxdia, extension = parametros
+    tarea = partial(lluvia_y_descriptores_archivo, canal=canal, indices=indices, tipo_ventana=tipo_ventana,
+                    tamano_ventana=tamano_ventana, sobreposicion=sobreposicion, nfft=nfft, fmin=fmin, fmax=fmax,
+                    streaming=streaming, precision=precision)
+
+    if perfil is not None:
+        if cribado is not None:
+            raise ValueError("El perfil no se puede usar con el cribado rápido")
+        tarea = partial(medir_archivo, tarea, memoria=perfil_memoria)
+        lote_stft = 1
+
+    #Sin cribado rápido la PSD del cribado se calcula con toda la grabación, así que el resultado no cambia
+    separar = cribado is not None or (separar_lluvia and perfil is None and lote_stft <= 1)
+
+    if separar:
+        tarea_cribado = partial(cribado_archivo, canal=canal, muestra=cribado, tipo_ventana=tipo_ventana,
+                                tamano_ventana=tamano_ventana, sobreposicion=sobreposicion, nfft=nfft,
+                                streaming=streaming, precision=precision)
+        tarea = partial(descriptores_cribados, canal=canal, indices=indices, tipo_ventana=tipo_ventana,
+                        tamano_ventana=tamano_ventana, sobreposicion=sobreposicion, nfft=nfft, fmin=fmin, fmax=fmax,
+                        streaming=streaming, precision=precision)
+        lote_stft = 1
+
+    tarea_lote = partial(lluvia_y_descriptores_lote, canal=canal, indices=indices, tipo_ventana=tipo_ventana,
+                         tamano_ventana=tamano_ventana, sobreposicion=sobreposicion, nfft=nfft, fmin=fmin, fmax=fmax,
+                         streaming=streaming, precision=precision)
+
+    cache = abrir_cache(ruta_cache)
+    parametros_cache = ("lluvia_y_descriptores", canal, indices, tipo_ventana, tamano_ventana, sobreposicion, nfft, fmin,
+                        fmax)
+
+    #Las claves y los puntos de control de float64 no cambian, para conservar los de ejecuciones anteriores
+    parametros_control = parametros
+
+    if precision != "float64":
+        parametros_cache += (precision,)
+        parametros_control = parametros_control + (precision,)
+
+    #Con el cribado cambian las PSD de lluvia, y por lo tanto los resultados guardados y los puntos de control
+    if cribado is not None:
+        parametros_cache += (("cribado",) + tuple(cribado),)
+        parametros_control = parametros_control + (("cribado",) + tuple(cribado),)
+
+    plan = Planificador(nprocesos, obtener_pool(nprocesos) if nprocesos > 1 else None)
+    claves = {}
+    grabaciones_plan = {}
+    hechas = 0
+    total = 0
+
+    for c, carpeta in enumerate(carpetas):
+
+        grabaciones = glob.glob(carpeta + '/*' + extension)
+        total += len(grabaciones)
+        punto = None
+
+        if reanudar and ruta_control is not None:
+            punto = leer_punto_control(ruta_control, carpeta, parametros_control)
+
+        #Por ejemplo, una carpeta terminada en una ejecución anterior sin estadísticas
+        if punto is not None and estadisticas is not None:
+            dias_punto = zip(punto[0]["Codigo"], punto[0].index)
+            if not all(clave in estadisticas.dias for clave in dias_punto):
+                punto = None
+
+        if punto is not None:
+            plan.agregar_resultado(("carpeta", c), punto)
+            hechas += len(grabaciones)
+            continue
+
+        nombres = []
+        pendientes = []
+        en_cache = {}
+
+        for i, grabacion in enumerate(grabaciones):
+            nombre = ("grabacion", c, i)
+            nombres.append(nombre)
+            resultado = None
+
+            if cache is not None:
+                claves[nombre] = cache.clave(grabacion, parametros_cache)
+                resultado = cache.leer(claves[nombre])
+
+            if resultado is None:
+                pendientes.append(nombre)
+                grabaciones_plan[nombre] = grabacion
+            else:
+                plan.agregar_resultado(nombre, resultado)
+                en_cache[nombre] = resultado
+                hechas += 1
+
+        #Los cribados de la carpeta van primero; cada grabación espera el umbral de su carpeta, y las tomadas del caché
+        #aportan al umbral la PSD de su resultado
+        if separar:
+            for i, nombre in enumerate(nombres):
+                if nombre in grabaciones_plan:
+                    plan.agregar(("cribado", c, i), tarea_cribado, grabaciones_plan[nombre], en_trabajador=True)
+                else:
+                    plan.agregar_resultado(("cribado", c, i), en_cache[nombre][0])
+
+            plan.agregar(("umbral", c), umbral_cribado, dependencias=[("cribado", c, i) for i in range(len(nombres))])
+
+            for nombre in pendientes:
+                plan.agregar(nombre, tarea, grabaciones_plan[nombre],
+                             dependencias=[("umbral", c), ("cribado",) + nombre[1:]], en_trabajador=True)
+
+        elif lote_stft <= 1:
+            for nombre in pendientes:
+                plan.agregar(nombre, tarea, grabaciones_plan[nombre], en_trabajador=True)
+
+        #Cada lote se calcula en un trabajador y cada grabación toma su resultado del lote en el proceso actual, de modo
+        #que el caché y el progreso se siguen actualizando por grabación
+        else:
+            for b in range(0, len(pendientes), lote_stft):
+                lote = pendientes[b:b + lote_stft]
+                plan.agregar(("lote", c, b), tarea_lote, [grabaciones_plan[nombre] for nombre in lote],
+                             en_trabajador=True)
+                for j, nombre in enumerate(lote):
+                    plan.agregar(nombre, tomar_resultado, j, dependencias=[("lote", c, b)])
+
+        plan.agregar(("carpeta", c), reunir_carpeta, carpeta, grabaciones, parametros_control, ruta_control,
+                     columnar, estadisticas, ruta_estadisticas, dependencias=nombres)
+
+    def al_terminar(nombre, resultado):
+        nonlocal hechas
+
+        #Los resultados de cada carpeta se escriben en el caché juntos, al terminarla
+        if nombre[0] == "carpeta" and cache is not None:
+            cache.confirmar()
+
+        if nombre[0] != "grabacion":
+            return
+
+        if perfil is not None:
+            resultado, perfil[grabaciones_plan[nombre]] = resultado
+
+        #Las grabaciones rechazadas en el cribado no se guardan, porque con otro umbral (por ejemplo si llegan
+        #grabaciones nuevas a la carpeta) podrían pasarlo
+        if cache is not None and resultado[2] is not None:
+            cache.guardar(claves[nombre], resultado)
+
+        hechas += 1
+        porcentaje = round(100 * hechas / total, 2)
+        print("Corriendo algoritmo de lluvia y calculando descriptores " + str(porcentaje) + "%")
+
+        if progreso is not None:
+            progreso(hechas)
+
+        return resultado
+
+    if progreso is not None and hechas > 0:
+        progreso(hechas)
+
+    try:
+        resultados = plan.ejecutar(al_terminar)
+    except BaseException:
+        cerrar_pool()
+        #Se conservan en el caché las grabaciones ya calculadas
+        if cache is not None:
+            cache.cerrar()
+        raise
+
+    if cache is not None:
+        cache.cerrar()
+
+    prom_df = pd.concat([resultados[("carpeta", c)][0] for c in range(len(carpetas))])
+    grab_malas_df = pd.concat([resultados[("carpeta", c)][1] for c in range(len(carpetas))], ignore_index=True)
+    return prom_df, grab_malas_df
+
+def lote_descriptores(avance, param, salida, malas, cod_proc, fin_proc, ruta_salida, reanudar=False, nprocesos=1,
+                      streaming=False, ruta_cache=None, lote_stft=1, precision="float64", formato_columnar=None,
+                      ruta_estadisticas=None):
+
+    '''
+
+    Esta función procesa todas las carpetas de grabaciones con extraer_lote y entrega los promedios diarios de todas
+    las carpetas, unidos, para los pasos de estandarización y escritura
+
+    :param avance: recibe un Queue para indicar a la barra de progreso el avance del procedimiento
+    :param param: recibe un Queue con parámetros necesarios para el siguiente proceso
+    :param salida: recibe un Queue que guarda la salida del proceso
+    :param malas: recibe un Queue que guarda las grabaciones rechazadas durante el procesamiento
+    :param cod_proc: recibe un entero con el código del proceso
+    :param fin_proc: recibe un Event que indica si el proceso actual terminó
+    :param ruta_salida: recibe un str con la ruta absoluta de salida, sin extensión; junto a ella se guardan los puntos
+                        de control
+    :param reanudar: recibe un bool que indica si las carpetas con punto de control se toman de él, valor por defecto
+                     False
+    :param nprocesos: recibe un entero con el número de procesos trabajadores, valor por defecto 1
+    :param streaming: recibe un bool que indica si las grabaciones se leen por bloques de un minuto, guardando solo el
+                      canal de interés (ver leer_grabacion), valor por defecto False
+    :param ruta_cache: recibe un str con la ruta del caché de resultados por grabación, valor por defecto None, sin caché
+    :param lote_stft: recibe un entero con el número de grabaciones que cada trabajador calcula juntas, valor por
+                      defecto 1 (ver extraer_lote)
+    :param precision: recibe un str con la precisión del cálculo, "float64" o "float32", valor por defecto "float64"
+                      (ver leer_grabacion)
+    :param formato_columnar: recibe un str con el formato de la salida columnar, "feather" o "parquet", valor por
+                             defecto None, sin salida columnar (ver salida_columnar.py)
+    :param ruta_estadisticas: recibe un str con la ruta del archivo de estadísticas incrementales al que se agregan las
+                              grabaciones nuevas (se crea si no existe), valor por defecto None, sin estadísticas
+    :return: None
+    '''
+
+    parametros = param.get()
+    carpetas = salida.get()
+    columnar = None if formato_columnar is None else SalidaColumnar(ruta_salida, formato_columnar, reanudar)
+    estadisticas = None
+
+    if ruta_estadisticas is not None:
+        estadisticas = abrir_estadisticas(ruta_estadisticas, parametros, precision)
+
+    prom_df, grab_malas_df = extraer_lote(carpetas, parametros, nprocesos, streaming, ruta_cache,
+                                          ruta_puntos_control(ruta_salida), reanudar,
+                                          lambda valor: avance.put((cod_proc, valor)), lote_stft=lote_stft,
+                                          precision=precision, columnar=columnar, estadisticas=estadisticas,
+                                          ruta_estadisticas=ruta_estadisticas)
     malas.put(grab_malas_df)
-    salida.put((prom_df,))
+    salida.put(empaquetar((prom_df,)))
     fin_proc.set()
     avance.put((cod_proc, 0))
 
+def procesar_lote(carpetas, parametros, ruta_salida, recalcular=False, nprocesos=1, streaming=False, ruta_cache=None,
+                  reanudar=False, perfil=False, cprofile=False, perfil_memoria=False, lote_stft=1, precision="float64",
+                  formato_columnar=None, ruta_estadisticas=None, cribado=None):
+
+    '''
+
+    Procesa todas las carpetas (ver extraer_lote), une sus promedios diarios, los estandariza (Índices) y escribe los
+    archivos de salida. Cada carpeta terminada se guarda como punto de control; si reanudar es True, las carpetas con
+    punto de control no se procesan de nuevo.
+
+    :param carpetas: recibe una lista con las carpetas de grabaciones
+    :param parametros: recibe la tupla de parámetros que retorna validar_parametros
+    :param ruta_salida: recibe un str con la ruta absoluta de salida, sin extensión
+    :param recalcular: recibe un bool que indica si se recalculan los parámetros para la estandarización, valor por
+                       defecto False
+    :param reanudar: recibe un bool que indica si se usan los puntos de control de una ejecución anterior, valor por
+                     defecto False
+    :param perfil: recibe un bool que indica si se mide el tiempo y la memoria de cada paso del cálculo por grabación;
+                   el resumen se escribe en ruta_salida + "_perfil.json". Valor por defecto False
+    :param cprofile: recibe un bool que indica si se ejecuta cProfile sobre la primera grabación; las estadísticas se
+                     escriben en ruta_salida + "_perfil.prof". Valor por defecto False
+    :param perfil_memoria: recibe un bool que indica si el perfil también mide la memoria de cada paso, lo que hace más
+                           lentos los pasos con ciclos en Python. Valor por defecto False
+    :param lote_stft: recibe un entero con el número de grabaciones que cada trabajador calcula juntas, valor por
+                      defecto 1 (ver extraer_lote)
+    :param precision: recibe un str con la precisión del cálculo, "float64" o "float32", valor por defecto "float64"
+                      (ver leer_grabacion)
+    :param formato_columnar: recibe un str con el formato de la salida columnar, "feather" o "parquet", valor por
+                             defecto None, sin salida columnar (ver salida_columnar.py)
+    :param ruta_estadisticas: recibe un str con la ruta del archivo de estadísticas incrementales, valor por defecto
+                              None, sin estadísticas. Las grabaciones nuevas se agregan a las estadísticas del archivo,
+                              que se usan para estandarizar cuando no se recalcula (ver estadisticas_incrementales.py)
+    :param cribado: recibe una tupla opcional con la muestra del cribado rápido de lluvia, valor por defecto None (ver
+                    extraer_lote)
+    Los demás parámetros son los mismos de extraer_lote
+    :return: una tupla con la salida escrita (tupla de DataFrames) y el DataFrame de grabaciones rechazadas
+    '''
+
+    canal, indices, tipo_ventana, tamano_ventana, sobreposicion, nfft, fmin, fmax, grabxdia, extension = parametros
+
+    if cprofile:
+        tarea = partial(lluvia_y_descriptores_archivo, canal=canal, indices=indices, tipo_ventana=tipo_ventana,
+                        tamano_ventana=tamano_ventana, sobreposicion=sobreposicion, nfft=nfft, fmin=fmin, fmax=fmax,
+                        streaming=streaming, precision=precision)
+        muestras = [grabacion for carpeta in carpetas for grabacion in glob.glob(carpeta + '/*' + extension)]
+        if muestras:
+            perfil_cprofile(tarea, muestras[0], ruta_salida + "_perfil.prof")
+
+    perfil = perfil or perfil_memoria
+    mediciones = {} if perfil else None
+    columnar = None if formato_columnar is None else SalidaColumnar(ruta_salida, formato_columnar, reanudar)
+    estadisticas = None
+
+    if ruta_estadisticas is not None:
+        estadisticas = abrir_estadisticas(ruta_estadisticas, parametros, precision, cribado)
+
+    prom_df, grab_malas_df = extraer_lote(carpetas, parametros, nprocesos, streaming, ruta_cache,
+                                          ruta_puntos_control(ruta_salida), reanudar, perfil=mediciones,
+                                          perfil_memoria=perfil_memoria, lote_stft=lote_stft, precision=precision,
+                                          columnar=columnar, estadisticas=estadisticas, cribado=cribado,
+                                          ruta_estadisticas=ruta_estadisticas)
+
+    if perfil:
+        escribir_perfil(mediciones, ruta_salida + "_perfil.json")
+
+    if indices:
+        salida = (prom_df, estandarizar_df(prom_df, recalcular, estadisticas))
+    else:
+        salida = (prom_df,)
+
+    escribir_archivos(salida, grab_malas_df, ruta_salida)
+    return salida, grab_malas_df
+
+def validar_cribado(cribado_str):
+
+    '''
+
+    Valida la muestra del cribado rápido de lluvia
+
+    :param cribado_str: recibe un str con la muestra: "<K>m" para analizar K minutos repartidos en cada grabación, o
+                        "<N>s" para analizar sus primeros N segundos. Por ejemplo "3m" o "20s"
+    :return: tupla ("minutos", K) o ("segundos", N) (ver psd_lluvia_muestra). Si el valor no es válido se lanza
+             ValueError
+    '''
+
+    unidades = {"m": "minutos", "s": "segundos"}
+    texto = cribado_str.strip().lower()
+
+    if len(texto) < 2 or texto[-1] not in unidades or not texto[:-1].isdigit() or int(texto[:-1]) <= 0:
+        raise ValueError("El cribado debe ser un número de minutos o de segundos, por ejemplo 3m o 20s")
+
+    return unidades[texto[-1]], int(texto[:-1])
+
+def validar_barrido(ventanas_str, bandas_str):
+
+    '''
+
+    Valida las configuraciones de un barrido de parámetros de la PSD
+
+    :param ventanas_str: recibe un str con los tamaños de ventana separados por comas, por ejemplo "256,512,1024"
+    :param bandas_str: recibe un str con las bandas del filtro separadas por comas, cada una como fmin-fmax en Hz, por
+                       ejemplo "1000-11250,2000-8000"
+    :return: una tupla con la lista de tamaños de ventana y la lista de bandas (fmin, fmax). Si algún valor no es
+             válido se lanza ValueError con el mensaje para el usuario
+    '''
+
+    ventanas = [ventana.strip() for ventana in ventanas_str.split(",")]
+    bandas = [banda.strip().split("-") for banda in bandas_str.split(",")]
+
+    if not all(ventana.isnumeric() and int(ventana) > 0 for ventana in ventanas):
+        raise ValueError("Ingrese tamaños de ventana numéricos")
+
+    if not all(len(banda) == 2 and banda[0].isnumeric() and banda[1].isnumeric() for banda in bandas):
+        raise ValueError("Ingrese las bandas como fmin-fmax")
+
+    bandas = [(int(fmin), int(fmax)) for fmin, fmax in bandas]
+
+    if any(fmin >= fmax for fmin, fmax in bandas):
+        raise ValueError("La frecuencia mínima de cada banda debe ser menor que la máxima")
+
+    return sorted(set(int(ventana) for ventana in ventanas)), list(dict.fromkeys(bandas))
+
+def procesar_barrido(carpetas, parametros, ventanas, bandas, ruta_salida, nprocesos=1, streaming=False,
+                     precision="float64"):
+
+    '''
+
+    Calcula la PSD de todas las carpetas para cada combinación de tamaño de ventana y banda del filtro, leyendo cada
+    grabación una sola vez (ver barrido_psd_archivo), y escribe una salida por configuración en
+    ruta_salida + "_v<ventana>_<fmin>-<fmax>". Cada salida es la misma de procesar_lote con esos parámetros.
+
+    :param carpetas: recibe una lista con las carpetas de grabaciones
+    :param parametros: recibe la tupla de parámetros que retorna validar_parametros para la PSD; el tamaño de ventana
+                       y el filtro se toman de ventanas y bandas
+    :param ventanas: recibe una lista con los tamaños de ventana
+    :param bandas: recibe una lista de tuplas (fmin, fmax) con las bandas del filtro en Hz
+    :param ruta_salida: recibe un str con la ruta absoluta de salida, sin extensión
+    Los demás parámetros son los mismos de procesar_lote
+    :return: diccionario {(tamano_ventana, fmin, fmax): una tupla con la salida escrita y el DataFrame de grabaciones
+             rechazadas}
+    '''
+
+    canal, indices, tipo_ventana, tamano_ventana, sobreposicion, nfft, fmin, fmax, grabxdia, extension = parametros
+    tarea = partial(barrido_psd_archivo, canal=canal, ventanas=ventanas, bandas=bandas, tipo_ventana=tipo_ventana,
+                    sobreposicion=sobreposicion, streaming=streaming, precision=precision)
+    plan = Planificador(nprocesos, obtener_pool(nprocesos) if nprocesos > 1 else None)
+    grabaciones = [glob.glob(carpeta + '/*' + extension) for carpeta in carpetas]
+    total = sum(len(grabaciones_carpeta) for grabaciones_carpeta in grabaciones)
+    hechas = 0
+
+    for c, grabaciones_carpeta in enumerate(grabaciones):
+        for i, grabacion in enumerate(grabaciones_carpeta):
+            plan.agregar(("grabacion", c, i), tarea, grabacion, en_trabajador=True)
+
+    def al_terminar(nombre, resultado):
+        nonlocal hechas
+        hechas += 1
+        print("Corriendo algoritmo de lluvia y calculando la PSD " + str(round(100 * hechas / total, 2)) + "%")
+
+    try:
+        resultados = plan.ejecutar(al_terminar)
+    except BaseException:
+        cerrar_pool()
+        raise
+
+    salidas = {}
+
+    for ventana in ventanas:
+        for fmin, fmax in bandas:
+            configuracion = (ventana, fmin, fmax)
+            parametros_configuracion = (canal, False, tipo_ventana, ventana, sobreposicion, ventana, fmin, fmax,
+                                        grabxdia, extension)
+            partes = [reunir_carpeta([resultados[("grabacion", c, i)][configuracion]
+                                      for i in range(len(grabaciones_carpeta))],
+                                     carpetas[c], grabaciones_carpeta, parametros_configuracion)
+                      for c, grabaciones_carpeta in enumerate(grabaciones)]
+            prom_df = pd.concat([parte[0] for parte in partes])
+            grab_malas_df = pd.concat([parte[1] for parte in partes], ignore_index=True)
+            escribir_archivos((prom_df,), grab_malas_df, ruta_salida + "_v%d_%d-%d" % configuracion)
+            salidas[configuracion] = ((prom_df,), grab_malas_df)
+
+    return salidas
+
 
 # --------------------------------------- Fin Funciones de Procesamiento -----------------------------------------------#
 
@@ -0,0 +1,192 @@
+'''
+
+Contiene la medición opcional del tiempo y la memoria de cada paso del cálculo de descriptores (lectura, algoritmo de
+lluvia, transformadas y cada índice), por grabación, y el resumen por percentiles de una ejecución. Este módulo es
+invocado por paisaje.py
+
+Las mediciones de una grabación son un diccionario {paso: (segundos, bytes)}, donde bytes es la memoria adicional
+máxima que reservó el paso, medida con tracemalloc (numpy registra sus arreglos en tracemalloc). La memoria solo se mide
+si se pide: tracemalloc registra cada objeto de Python que se crea, así que los pasos con ciclos en Python (por ejemplo
+rms, que suma muestra por muestra) se vuelven decenas de veces más lentos y sus tiempos dejan de ser representativos.
+'''
+
+import cProfile
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+import numpy as np
+
+PERCENTILES = [50, 90, 99]
+
+def sin_medir(nombre):
+
+    '''
+
+    Reemplaza a MedidorPasos.medir cuando no se mide nada
+
+    :param nombre: recibe el nombre del paso, no se usa
+    :return: un contexto que no hace nada
+    '''
+
+    return nullcontext()
+
+class MedidorPasos:
+
+    '''
+
+    Mide el tiempo de reloj y la memoria máxima de cada paso del cálculo de una grabación. Los pasos no deben
+    anidarse, porque tracemalloc guarda un solo valor máximo.
+    '''
+
+    def __init__(self, memoria=False):
+
+        '''
+
+        :param memoria: indica si se mide la memoria máxima de cada paso, valor por defecto False (bool)
+        '''
+
+        self.memoria = memoria
+        self.mediciones = {}
+
+    @contextmanager
+    def medir(self, nombre):
+
+        '''
+
+        Mide el bloque de código del with y guarda el resultado con el nombre del paso
+
+        :param nombre: nombre del paso (str)
+        '''
+
+        if self.memoria:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            inicial = tracemalloc.get_traced_memory()[0]
+
+        inicio = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            segundos = time.perf_counter() - inicio
+            pico = tracemalloc.get_traced_memory()[1] - inicial if self.memoria else 0
+            self.mediciones[nombre] = (segundos, pico)
+
+    def terminar(self):
+
+        '''
+
+        Detiene la medición de memoria
+
+        :return: diccionario con las mediciones {paso: (segundos, bytes)}
+        '''
+
+        if self.memoria and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+        return self.mediciones
+
+def medir_archivo(tarea, ruta_archivo, memoria=False):
+
+    '''
+
+    Ejecuta la tarea de una grabación midiendo cada paso. Se usa como tarea de los trabajadores cuando se pide el
+    perfil de la ejecución.
+
+    :param tarea: recibe la función de la tarea; debe aceptar el argumento medidor
+    :param ruta_archivo: recibe un str con la ruta de la grabación
+    :param memoria: recibe un bool que indica si se mide la memoria de cada paso, valor por defecto False
+    :return: una tupla con el resultado de la tarea y las mediciones de la grabación
+    '''
+
+    medidor = MedidorPasos(memoria)
+    inicio = time.perf_counter()
+
+    try:
+        resultado = tarea(ruta_archivo, medidor=medidor)
+    finally:
+        mediciones = medidor.terminar()
+
+    # El total contiene a los demás pasos, por eso no se mide con el medidor y no tiene memoria
+    mediciones["total"] = (time.perf_counter() - inicio, 0)
+    return resultado, mediciones
+
+def resumen_perfil(mediciones):
+
+    '''
+
+    Resume las mediciones de todas las grabaciones de una ejecución con percentiles por paso
+
+    :param mediciones: recibe un diccionario {ruta de la grabación: mediciones de la grabación}
+    :return: diccionario {paso: estadísticas}, con el número de grabaciones, el tiempo total, los percentiles del
+             tiempo en segundos y, si se midió, los percentiles de la memoria en MB
+    '''
+
+    pasos = {}
+
+    for medicion in mediciones.values():
+        for paso, valores in medicion.items():
+            pasos.setdefault(paso, []).append(valores)
+
+    resumen = {}
+
+    for paso, valores in pasos.items():
+        valores = np.array(valores, dtype=float)
+        segundos = valores[:, 0]
+        megas = valores[:, 1] / 2**20
+        estadisticas = {"grabaciones": len(valores), "segundos_total": float(np.sum(segundos))}
+
+        for p in PERCENTILES:
+            estadisticas["segundos_p" + str(p)] = float(np.percentile(segundos, p))
+
+        estadisticas["segundos_max"] = float(np.max(segundos))
+        resumen[paso] = estadisticas
+
+        if not np.any(megas):
+            continue
+
+        for p in PERCENTILES:
+            estadisticas["memoria_mb_p" + str(p)] = float(np.percentile(megas, p))
+
+        estadisticas["memoria_mb_max"] = float(np.max(megas))
+
+    return resumen
+
+def escribir_perfil(mediciones, ruta_json):
+
+    '''
+
+    Escribe el resumen por pasos y las mediciones de cada grabación en un archivo JSON
+
+    :param mediciones: recibe un diccionario {ruta de la grabación: mediciones de la grabación}
+    :param ruta_json: recibe un str con la ruta del archivo
+    :return: None
+    '''
+
+    perfil = {"resumen": resumen_perfil(mediciones),
+              "grabaciones": {ruta: {paso: {"segundos": segundos, "memoria_bytes": pico}
+                                     for paso, (segundos, pico) in medicion.items()}
+                              for ruta, medicion in mediciones.items()}}
+
+    with open(ruta_json, 'w', encoding="utf-8") as archivo:
+        json.dump(perfil, archivo, indent=2, ensure_ascii=False)
+
+def perfil_cprofile(tarea, ruta_archivo, ruta_prof):
+
+    '''
+
+    Ejecuta la tarea de una grabación con cProfile y guarda las estadísticas, que se pueden ver con pstats o snakeviz
+
+    :param tarea: recibe la función de la tarea
+    :param ruta_archivo: recibe un str con la ruta de la grabación
+    :param ruta_prof: recibe un str con la ruta del archivo de estadísticas
+    :return: el resultado de la tarea
+    '''
+
+    perfilador = cProfile.Profile()
+    resultado = perfilador.runcall(tarea, ruta_archivo)
+    perfilador.dump_stats(ruta_prof)
+    return resultado
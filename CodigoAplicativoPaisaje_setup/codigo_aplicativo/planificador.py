@@ -0,0 +1,180 @@
+'''
+
+Contiene un planificador de tareas con dependencias (un grafo dirigido acíclico), usado por paisaje.py para procesar
+varias carpetas a la vez: las grabaciones de todas las carpetas se reparten en un mismo Pool de procesos trabajadores, y
+cada carpeta se reúne en cuanto terminan sus grabaciones, sin esperar a las demás carpetas.
+'''
+
+import heapq
+from multiprocessing import Pool
+from queue import Queue
+
+class Planificador:
+
+    '''
+
+    Ejecuta un conjunto de tareas respetando sus dependencias. Hay dos tipos de tareas:
+
+    -De trabajador: se envían al Pool de procesos. Deben ser funciones que se puedan serializar con pickle.
+    -Locales: se ejecutan en el proceso actual en cuanto sus dependencias terminan. Se usan para reunir resultados.
+
+    Las tareas listas se lanzan en el orden en que se agregaron, de modo que las primeras carpetas terminan primero. El
+    número de procesos trabajadores limita el total de tareas de trabajador que se ejecutan a la vez.
+    '''
+
+    def __init__(self, nprocesos=1, pool=None):
+
+        '''
+
+        :param nprocesos: número de procesos trabajadores; con 1 todas las tareas se ejecutan en el proceso actual,
+                          valor por defecto 1 (int)
+        :param pool: Pool de procesos a usar, por ejemplo uno que se reutiliza entre ejecuciones. Valor por defecto None,
+                     es decir se crea un Pool para la ejecución y se cierra al terminar
+        '''
+
+        self.nprocesos = nprocesos
+        self.pool = pool
+        self.tareas = {}
+        self.resultados = {}
+
+    def agregar(self, nombre, funcion, *args, dependencias=(), en_trabajador=False):
+
+        '''
+
+        Agrega una tarea al plan
+
+        :param nombre: nombre único de la tarea, cualquier valor que pueda ser llave de un diccionario
+        :param funcion: función a ejecutar. Si la tarea tiene dependencias, recibe como primer argumento la lista con los
+                        resultados de sus dependencias, en el mismo orden
+        :param args: argumentos adicionales de la función
+        :param dependencias: nombres de las tareas que deben terminar antes, valor por defecto ninguna
+        :param en_trabajador: indica si la tarea se ejecuta en el Pool (True) o en el proceso actual (False), valor por
+                              defecto False
+        :return: None
+        '''
+
+        self.tareas[nombre] = (funcion, args, tuple(dependencias), en_trabajador)
+
+    def agregar_resultado(self, nombre, resultado):
+
+        '''
+
+        Agrega una tarea que ya tiene resultado (por ejemplo, tomado del caché), para que otras tareas dependan de ella
+
+        :param nombre: nombre único de la tarea
+        :param resultado: resultado de la tarea
+        :return: None
+        '''
+
+        self.resultados[nombre] = resultado
+
+    def argumentos(self, nombre):
+
+        '''
+
+        Arma los argumentos de una tarea: la lista de resultados de sus dependencias (si tiene) y sus argumentos
+
+        :param nombre: nombre de la tarea
+        :return: tupla con los argumentos de la función de la tarea
+        '''
+
+        funcion, args, dependencias, en_trabajador = self.tareas[nombre]
+
+        if dependencias:
+            args = ([self.resultados[d] for d in dependencias],) + args
+
+        return args
+
+    def ejecutar(self, al_terminar=None):
+
+        '''
+
+        Ejecuta todas las tareas del plan
+
+        :param al_terminar: función opcional que recibe el nombre y el resultado de cada tarea al terminar. Se ejecuta en
+                            el proceso actual. Si retorna un valor distinto de None, ese valor reemplaza el resultado
+                            de la tarea
+        :return: diccionario con el resultado de cada tarea
+        '''
+
+        if al_terminar is None:
+            al_terminar = lambda nombre, resultado: None
+
+        # Para cada tarea se cuentan las dependencias que faltan; cuando llega a cero pasa a la cola de tareas listas
+        # (locales o de trabajador), ordenada por el orden en que se agregó la tarea
+        orden = {nombre: k for k, nombre in enumerate(self.tareas)}
+        faltan = {}
+        dependientes = {}
+        listas = ([], [])
+
+        for nombre, (funcion, args, dependencias, en_trabajador) in self.tareas.items():
+            if nombre in self.resultados:
+                continue
+            faltan[nombre] = 0
+            for d in dependencias:
+                if d not in self.resultados:
+                    faltan[nombre] += 1
+                    dependientes.setdefault(d, []).append(nombre)
+            if faltan[nombre] == 0:
+                heapq.heappush(listas[en_trabajador], (orden[nombre], nombre))
+
+        pendientes = len(faltan)
+
+        def terminar(nombre, resultado):
+            reemplazo = al_terminar(nombre, resultado)
+            self.resultados[nombre] = resultado if reemplazo is None else reemplazo
+            for siguiente in dependientes.get(nombre, []):
+                faltan[siguiente] -= 1
+                if faltan[siguiente] == 0:
+                    heapq.heappush(listas[self.tareas[siguiente][3]], (orden[siguiente], siguiente))
+
+        if self.nprocesos <= 1:
+            while listas[0] or listas[1]:
+                cola = listas[0] if listas[0] else listas[1]
+                k, nombre = heapq.heappop(cola)
+                terminar(nombre, self.tareas[nombre][0](*self.argumentos(nombre)))
+                pendientes -= 1
+
+        else:
+            terminadas = Queue()
+            en_curso = 0
+
+            pool = self.pool if self.pool is not None else Pool(self.nprocesos)
+
+            try:
+                while listas[0] or listas[1] or en_curso:
+
+                    while listas[0]:
+                        k, nombre = heapq.heappop(listas[0])
+                        terminar(nombre, self.tareas[nombre][0](*self.argumentos(nombre)))
+                        pendientes -= 1
+
+                    # Se mantienen a lo sumo dos tareas por trabajador en el Pool, para que las tareas agregadas
+                    # primero conserven la prioridad
+                    while listas[1] and en_curso < 2 * self.nprocesos:
+                        k, nombre = heapq.heappop(listas[1])
+                        pool.apply_async(self.tareas[nombre][0], self.argumentos(nombre),
+                                         callback=lambda r, n=nombre: terminadas.put((n, r, None)),
+                                         error_callback=lambda e, n=nombre: terminadas.put((n, None, e)))
+                        en_curso += 1
+
+                    if en_curso == 0:
+                        continue
+
+                    nombre, resultado, error = terminadas.get()
+                    en_curso -= 1
+
+                    if error is not None:
+                        raise error
+
+                    terminar(nombre, resultado)
+                    pendientes -= 1
+
+            finally:
+                if self.pool is None:
+                    pool.terminate()
+
+        if pendientes:
+            raise ValueError("Las dependencias de las tareas forman un ciclo o no existen")
+
+        return self.resultados
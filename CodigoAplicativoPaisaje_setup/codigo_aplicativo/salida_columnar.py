@@ -0,0 +1,155 @@
+'''
+
+Contiene la salida columnar de los resultados (Arrow/Feather o Parquet), que se escribe además del excel y del .dat.
+Este módulo es invocado por paisaje.py
+
+La salida es una carpeta <ruta de salida>_columnar con dos tablas, cada una en su subcarpeta:
+
+-grabaciones: los descriptores de cada grabación buena, con las columnas Carpeta y Grabacion
+-promedios: los promedios diarios, con las columnas Carpeta y Dia
+
+Cada carpeta de grabaciones se agrega como un archivo nuevo de cada tabla en cuanto se calculan sus promedios diarios,
+sin esperar al final del procesamiento ni reescribir lo anterior; el archivo se escribe con otro nombre y se renombra al
+terminar, así que una ejecución interrumpida no deja archivos a medias. Los archivos Feather se escriben sin compresión
+para poder abrirlos como memoria mapeada (ver leer_columnar).
+
+Requiere pyarrow. Si no está instalado, el resto del programa funciona igual y solo la salida columnar no está
+disponible.
+'''
+
+import hashlib
+import os
+import shutil
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+FORMATOS_COLUMNARES = {"feather": ".feather", "parquet": ".parquet"}
+TABLAS_COLUMNARES = ("grabaciones", "promedios")
+
+def columnar_disponible():
+
+    '''
+
+    :return: True si pyarrow está instalado y se puede escribir la salida columnar
+    '''
+
+    return pa is not None
+
+def carpeta_columnar(ruta_salida):
+
+    '''
+
+    :param ruta_salida: recibe un str con la ruta absoluta de salida, sin extensión
+    :return: str con la carpeta de la salida columnar
+    '''
+
+    return ruta_salida + "_columnar"
+
+class SalidaColumnar:
+
+    '''
+
+    Escribe la salida columnar de un procesamiento, una carpeta de grabaciones a la vez
+    '''
+
+    def __init__(self, ruta_salida, formato="feather", reanudar=False):
+
+        '''
+
+        :param ruta_salida: recibe un str con la ruta absoluta de salida, sin extensión
+        :param formato: recibe un str con el formato de los archivos, "feather" o "parquet", valor por defecto "feather"
+        :param reanudar: recibe un bool que indica si se conservan los archivos de una ejecución anterior, para las
+                         carpetas que se toman de un punto de control. Valor por defecto False, se borran
+        '''
+
+        if pa is None:
+            raise ValueError("La salida columnar requiere pyarrow")
+
+        if formato not in FORMATOS_COLUMNARES:
+            raise ValueError("Formato de salida columnar no válido: " + str(formato))
+
+        self.carpeta = carpeta_columnar(ruta_salida)
+        self.formato = formato
+
+        if not reanudar:
+            shutil.rmtree(self.carpeta, ignore_errors=True)
+
+        for tabla in TABLAS_COLUMNARES:
+            os.makedirs(os.path.join(self.carpeta, tabla), exist_ok=True)
+
+    def agregar(self, carpeta, valores_df, prom_df):
+
+        '''
+
+        Agrega los resultados de una carpeta de grabaciones. El nombre de los archivos depende solo de la carpeta, de
+        modo que al procesarla de nuevo se reemplazan sus resultados anteriores
+
+        :param carpeta: recibe un str con la carpeta de grabaciones
+        :param valores_df: recibe el DataFrame de descriptores de las grabaciones buenas, con el nombre de la grabación
+                           como índice
+        :param prom_df: recibe el DataFrame de promedios diarios de la carpeta
+        :return: None
+        '''
+
+        nombre = hashlib.sha1(os.path.abspath(carpeta).encode("utf-8")).hexdigest()[:16]
+        nombre += FORMATOS_COLUMNARES[self.formato]
+        grabaciones_df = valores_df.rename_axis("Grabacion").reset_index()
+        promedios_df = prom_df.rename_axis("Dia").reset_index()
+
+        for tabla, df in zip(TABLAS_COLUMNARES, (grabaciones_df, promedios_df)):
+            df.insert(0, "Carpeta", carpeta)
+            self.escribir(df, os.path.join(self.carpeta, tabla, nombre))
+
+    def escribir(self, df, ruta):
+
+        '''
+
+        Escribe un DataFrame en un archivo del formato de la salida
+
+        :param df: recibe el DataFrame a escribir
+        :param ruta: recibe un str con la ruta del archivo
+        :return: None
+        '''
+
+        tabla = pa.Table.from_pandas(df, preserve_index=False)
+        temporal = ruta + ".tmp"
+
+        if self.formato == "feather":
+            feather.write_feather(tabla, temporal, compression="uncompressed")
+        else:
+            pq.write_table(tabla, temporal)
+
+        os.replace(temporal, ruta)
+
+def leer_columnar(ruta_salida, tabla="promedios"):
+
+    '''
+
+    Lee una tabla de la salida columnar de un procesamiento. Los archivos Feather se abren como memoria mapeada, así que
+    los valores no se copian hasta que se usan; con to_pandas() se obtiene un DataFrame
+
+    :param ruta_salida: recibe un str con la ruta absoluta de salida, sin extensión
+    :param tabla: recibe un str con la tabla a leer, "grabaciones" o "promedios", valor por defecto "promedios"
+    :return: un pyarrow.Table con las filas de todas las carpetas. Las columnas que no existen en alguna carpeta (por
+             ejemplo los descriptores PSD con otra frecuencia de muestreo) quedan nulas
+    '''
+
+    if pa is None:
+        raise ValueError("La salida columnar requiere pyarrow")
+
+    carpeta = os.path.join(carpeta_columnar(ruta_salida), tabla)
+    tablas = []
+
+    for nombre in sorted(os.listdir(carpeta)):
+        ruta = os.path.join(carpeta, nombre)
+        if nombre.endswith(FORMATOS_COLUMNARES["feather"]):
+            tablas.append(feather.read_table(ruta, memory_map=True))
+        elif nombre.endswith(FORMATOS_COLUMNARES["parquet"]):
+            tablas.append(pq.read_table(ruta, memory_map=True))
+
+    return pa.concat_tables(tablas, promote_options="default")
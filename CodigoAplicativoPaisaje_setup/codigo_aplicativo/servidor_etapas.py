@@ -0,0 +1,95 @@
+'''
+
+Contiene el proceso servidor que ejecuta los pasos del procesamiento para GUI_paisaje.py. El servidor se inicia una sola
+vez con la interfaz: importa paisaje.py (numpy, scipy, pandas, soundfile e Indices) y crea el Pool de procesos
+trabajadores, y los reutiliza en todos los pasos y en todas las ejecuciones. Así la interfaz no tiene que importar las
+librerías de cálculo para abrir la ventana, y cada paso no tiene que iniciar un proceso nuevo.
+
+Este módulo no importa librerías pesadas, para que pueda importarse desde la interfaz.
+'''
+
+import importlib
+import traceback
+from collections import namedtuple
+
+# Los Queue y Event solo se pueden compartir con el servidor al iniciarlo, así que en los argumentos de cada paso se
+# reemplazan por su nombre
+Compartido = namedtuple("Compartido", "nombre")
+
+def servidor_etapas(etapas, compartidos, nprocesos=1):
+
+    '''
+
+    Ejecuta los pasos del procesamiento que llegan por el Queue etapas, hasta recibir None. Cada paso es una tupla con
+    el nombre de una función de paisaje.py, sus argumentos y sus argumentos de palabra clave. Si un paso falla, se avisa
+    a la interfaz con el mensaje (-1, mensaje) en el Queue avance.
+
+    :param etapas: recibe un Queue con los pasos a ejecutar
+    :param compartidos: recibe un diccionario con los Queue y Event compartidos con la interfaz, por nombre
+    :param nprocesos: recibe un entero con el número de procesos trabajadores con que se inicia el Pool, valor por
+                      defecto 1
+    :return: None
+    '''
+
+    paisaje = importlib.import_module("paisaje")
+
+    if nprocesos > 1:
+        paisaje.obtener_pool(nprocesos)
+
+    while True:
+
+        etapa = etapas.get()
+
+        if etapa is None:
+            break
+
+        nombre, args, kwargs = etapa
+        args = [compartidos[a.nombre] if isinstance(a, Compartido) else a for a in args]
+
+        try:
+            getattr(paisaje, nombre)(*args, **kwargs)
+        except Exception as error:
+            traceback.print_exc()
+            paisaje.cerrar_pool()
+            paisaje.limpiar_intercambio()
+            compartidos["fin_proc"].set()
+            compartidos["avance"].put((-1, "Error en el procesamiento: " + str(error)))
+
+    paisaje.cerrar_pool()
+    paisaje.limpiar_intercambio()
+
+class Etapa:
+
+    '''
+
+    Paso del procesamiento que se ejecuta en el servidor. Se usa igual que un Process: se crea con la función y sus
+    argumentos, y se ejecuta con start.
+    '''
+
+    def __init__(self, etapas, compartidos, nombre, args=(), kwargs=None):
+
+        '''
+
+        :param etapas: Queue por el que se envían los pasos al servidor
+        :param compartidos: diccionario con los Queue y Event compartidos con el servidor, por nombre
+        :param nombre: nombre de la función de paisaje.py que ejecuta el paso (str)
+        :param args: argumentos de la función; los Queue y Event compartidos se envían por nombre (tuple)
+        :param kwargs: argumentos de palabra clave de la función, valor por defecto ninguno (dict)
+        '''
+
+        self.etapas = etapas
+        self.nombre = nombre
+        self.args = tuple(self.compartido(a, compartidos) for a in args)
+        self.kwargs = kwargs or {}
+
+    @staticmethod
+    def compartido(argumento, compartidos):
+
+        for nombre, objeto in compartidos.items():
+            if argumento is objeto:
+                return Compartido(nombre)
+
+        return argumento
+
+    def start(self):
+        self.etapas.put((self.nombre, self.args, self.kwargs))
@@ -0,0 +1,535 @@
+'''
+
+Contiene el modo de vigilancia: en lugar de procesar las carpetas de una vez, se revisan cada pocos segundos y cada
+grabación nueva se procesa en cuanto llega (PSD en la banda de lluvia y descriptores). Este módulo es invocado por
+CLI_paisaje.py
+
+Una grabación se toma cuando su tamaño y su fecha de modificación no cambian entre dos revisiones, para no leer
+archivos que aún se están copiando. Los resultados de cada día de cada grabadora se guardan a medida que llegan, y el
+día se publica en cuanto tiene grabxdia grabaciones, o cuando llega una grabación de un día posterior de la misma
+grabadora (el día quedó con menos grabaciones de las esperadas).
+
+Cada grabación se clasifica al llegar con el umbral de lluvia de su carpeta, estimado de forma incremental con las
+grabaciones recibidas hasta ese momento (ver UmbralIncremental en paisaje.py). Mientras la carpeta no tiene las
+grabaciones de calentamiento se usa el umbral previo del sitio, si se indica, o las grabaciones esperan sin clasificar.
+Como el umbral cambia a medida que llegan grabaciones, las grabaciones cercanas al umbral (dudosas) se clasifican de
+nuevo en la reconciliación, con el umbral final, y los días que cambian se publican otra vez. Cada día publicado se
+agrega como una línea JSON a <ruta de salida>_tiempo_real.jsonl, con sus promedios (si alcanza el mínimo diario), sus
+grabaciones rechazadas y la latencia desde que llegó su última grabación. Al iniciar de nuevo, los días de ese archivo
+no se publican otra vez; sus grabaciones solo cuentan para el umbral de lluvia.
+'''
+
+import glob
+import json
+import os
+import time
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from paisaje import (lluvia_y_descriptores_archivo, UmbralIncremental, tabla_nombres, buscar_carpetas, abrir_cache,
+                     abrir_estadisticas, obtener_pool, cerrar_pool)
+
+INTERVALO_VIGILANCIA = 2
+MARGEN_RECONCILIACION = 0.1
+
+def ruta_tiempo_real(ruta_salida):
+
+    '''
+
+    :param ruta_salida: recibe un str con la ruta absoluta de salida, sin extensión
+    :return: str con la ruta del archivo de días publicados
+    '''
+
+    return ruta_salida + "_tiempo_real.jsonl"
+
+def leer_umbrales_previos(valor):
+
+    '''
+
+    :param valor: recibe un str con un umbral previo para todas las carpetas, o con la ruta de un archivo _umbrales.json
+                  de una ejecución anterior (ver Vigilante.reconciliar), con el umbral de cada carpeta
+    :return: float o diccionario {carpeta: umbral}. Si el valor no es válido se lanza ValueError
+    '''
+
+    try:
+        umbral = float(valor)
+    except ValueError:
+        if not os.path.isfile(valor):
+            raise ValueError("El umbral previo debe ser un número o un archivo de umbrales: " + valor)
+        with open(valor, encoding="utf-8") as archivo:
+            return {carpeta: float(umbral) for carpeta, umbral in json.load(archivo).items()}
+
+    if umbral <= 0:
+        raise ValueError("El umbral previo debe ser mayor que cero")
+
+    return umbral
+
+class Vigilante:
+
+    '''
+
+    Procesa las grabaciones de las carpetas a medida que llegan y publica los promedios de cada día al completarse
+    '''
+
+    def __init__(self, carpeta_grabaciones, subcarpetas, parametros, ruta_salida, nprocesos=1, streaming=False,
+                 ruta_cache=None, precision="float64", ruta_estadisticas=None, calentamiento=None, umbral_previo=None,
+                 margen=MARGEN_RECONCILIACION):
+
+        '''
+
+        :param carpeta_grabaciones: recibe un str con la carpeta de grabaciones a vigilar
+        :param subcarpetas: recibe un bool que indica si también se vigilan las subcarpetas, incluidas las que se
+                            creen después de iniciar
+        :param parametros: recibe la tupla de parámetros que retorna validar_parametros
+        :param ruta_salida: recibe un str con la ruta absoluta de salida, sin extensión
+        :param nprocesos: recibe un entero con el número de procesos trabajadores, valor por defecto 1
+        :param streaming: recibe un bool que indica si las grabaciones se leen por bloques de un minuto, guardando solo
+                          el canal de interés (ver paisaje.leer_grabacion), valor por defecto False
+        :param ruta_cache: recibe un str con la ruta del caché de resultados por grabación, valor por defecto None. Con
+                           el caché, al iniciar de nuevo las grabaciones ya procesadas no se calculan otra vez
+        :param precision: recibe un str con la precisión del cálculo, "float64" o "float32", valor por defecto "float64"
+        :param ruta_estadisticas: recibe un str con la ruta del archivo de estadísticas incrementales al que se agregan
+                                  las grabaciones de cada día publicado, valor por defecto None
+        :param calentamiento: recibe un entero con el número de grabaciones de una carpeta necesarias para estimar su
+                              umbral de lluvia, valor por defecto None, las grabaciones de un día (grabxdia)
+        :param umbral_previo: recibe un float con el umbral de lluvia a usar durante el calentamiento, o un diccionario
+                              con el umbral de cada carpeta (ver leer_umbrales_previos). Valor por defecto None, sin
+                              umbral previo: las grabaciones esperan al calentamiento
+        :param margen: recibe un float con la distancia relativa al umbral con la que una grabación se considera dudosa
+                       y se revisa en la reconciliación, valor por defecto MARGEN_RECONCILIACION
+        '''
+
+        canal, indices, tipo_ventana, tamano_ventana, sobreposicion, nfft, fmin, fmax, grabxdia, extension = parametros
+        self.carpeta_grabaciones = carpeta_grabaciones
+        self.subcarpetas = subcarpetas
+        self.extension = extension
+        self.grabxdia = grabxdia
+        self.min_grab = (grabxdia * 5) // 6
+        self.ruta_publicados = ruta_tiempo_real(ruta_salida)
+        self.ruta_umbrales = ruta_salida + "_umbrales.json"
+        self.calentamiento = grabxdia if calentamiento is None else calentamiento
+        self.umbral_previo = umbral_previo
+        self.margen = margen
+        self.nprocesos = nprocesos
+        self.tarea = partial(lluvia_y_descriptores_archivo, canal=canal, indices=indices, tipo_ventana=tipo_ventana,
+                             tamano_ventana=tamano_ventana, sobreposicion=sobreposicion, nfft=nfft, fmin=fmin,
+                             fmax=fmax, streaming=streaming, precision=precision)
+        self.cache = abrir_cache(ruta_cache)
+        self.parametros_cache = ("lluvia_y_descriptores", canal, indices, tipo_ventana, tamano_ventana, sobreposicion,
+                                 nfft, fmin, fmax)
+
+        if precision != "float64":
+            self.parametros_cache += (precision,)
+
+        self.ruta_estadisticas = ruta_estadisticas
+        self.estadisticas = None
+
+        if ruta_estadisticas is not None:
+            self.estadisticas = abrir_estadisticas(ruta_estadisticas, parametros, precision)
+
+        # {ruta: (carpeta, tamaño, fecha de modificación)} de las grabaciones vistas en la última revisión, sin tomar
+        self.candidatas = {}
+        # Rutas de las grabaciones tomadas (calculadas, en cálculo o descartadas)
+        self.tomadas = set()
+        # {ruta: (carpeta, resultado asíncrono o None, clave del caché, hora de llegada)}
+        self.en_calculo = {}
+        # {carpeta: UmbralIncremental}
+        self.umbrales = {}
+        # {carpeta: [(clave del día, nombre, grabación)]} con las grabaciones que esperan el calentamiento
+        self.sin_clasificar = {}
+        # {(carpeta, código, día): {nombre: grabación}} de los días abiertos (ver recibir)
+        self.dias = {}
+        # Igual, para los días publicados con grabaciones dudosas
+        self.por_reconciliar = {}
+        # {carpeta: (umbral mínimo, umbral máximo)} con que se clasificaron los días publicados que no se conservan
+        self.umbrales_descartados = {}
+        self.publicados = set()
+
+        if os.path.exists(self.ruta_publicados):
+            with open(self.ruta_publicados, encoding="utf-8") as archivo:
+                for linea in archivo:
+                    if linea.strip():
+                        dia = json.loads(linea)
+                        self.publicados.add((dia["carpeta"], dia["codigo"], dia["dia"]))
+
+    def revisar(self):
+
+        '''
+
+        Busca las grabaciones nuevas de las carpetas y envía a calcular las que ya terminaron de copiarse
+
+        :return: entero con el número de grabaciones enviadas a calcular
+        '''
+
+        enviadas = 0
+        vistas = {}
+        pool = obtener_pool(self.nprocesos) if self.nprocesos > 1 else None
+
+        for carpeta in buscar_carpetas(self.carpeta_grabaciones, self.subcarpetas, self.extension):
+            for ruta in glob.glob(carpeta + '/*' + self.extension):
+
+                if ruta in self.tomadas:
+                    continue
+
+                try:
+                    estado = os.stat(ruta)
+                except OSError:
+                    continue
+
+                vistas[ruta] = (carpeta, estado.st_size, estado.st_mtime_ns)
+
+                if self.candidatas.get(ruta) != vistas[ruta]:
+                    continue
+
+                self.tomadas.add(ruta)
+                del vistas[ruta]
+                enviadas += 1
+                clave = None
+
+                if self.cache is not None:
+                    clave = self.cache.clave(ruta, self.parametros_cache)
+                    resultado = self.cache.leer(clave)
+                    if resultado is not None:
+                        self.recibir(carpeta, ruta, resultado, time.time())
+                        continue
+
+                if pool is None:
+                    self.en_calculo[ruta] = (carpeta, None, clave, time.time())
+                else:
+                    self.en_calculo[ruta] = (carpeta, pool.apply_async(self.tarea, (ruta,)), clave, time.time())
+
+        self.candidatas = vistas
+        return enviadas
+
+    def recoger(self, esperar=False):
+
+        '''
+
+        Recibe los resultados de las grabaciones que terminaron de calcularse. Sin Pool, las grabaciones se calculan
+        aquí
+
+        :param esperar: recibe un bool que indica si se espera a que terminen todas las grabaciones en cálculo, valor
+                        por defecto False
+        :return: None
+        '''
+
+        for ruta, (carpeta, asincrono, clave, llegada) in list(self.en_calculo.items()):
+
+            if asincrono is None:
+                resultado = self.tarea(ruta)
+            elif esperar or asincrono.ready():
+                resultado = asincrono.get()
+            else:
+                continue
+
+            del self.en_calculo[ruta]
+
+            if self.cache is not None:
+                self.cache.guardar(clave, resultado)
+
+            self.recibir(carpeta, ruta, resultado, llegada)
+
+    def recibir(self, carpeta, ruta, resultado, llegada):
+
+        '''
+
+        Agrega la PSD de una grabación al umbral de su carpeta, la clasifica y la guarda en su día. Durante el
+        calentamiento del umbral las grabaciones se guardan sin clasificar y se clasifican juntas al terminarlo
+
+        :param carpeta: recibe un str con la carpeta de la grabación
+        :param ruta: recibe un str con la ruta de la grabación
+        :param resultado: recibe el resultado de lluvia_y_descriptores_archivo para la grabación
+        :param llegada: recibe un float con la hora en que se tomó la grabación (time.time())
+        :return: None
+        '''
+
+        nombre = ruta.split('\\')[-1]
+        tabla = tabla_nombres([nombre])
+        clave = (carpeta, tabla["Codigo"][0], tabla["Dia"][0])
+        PSD, feats, titulos = resultado
+
+        if carpeta not in self.umbrales:
+            previo = self.umbral_previo.get(carpeta) if isinstance(self.umbral_previo, dict) else self.umbral_previo
+            self.umbrales[carpeta] = UmbralIncremental(self.calentamiento, previo)
+
+        self.umbrales[carpeta].agregar(PSD)
+
+        #Las grabaciones de días ya publicados (al iniciar de nuevo, o que llegaron tarde) solo cuentan para el umbral
+        if clave in self.publicados:
+            return
+
+        # [PSD media, descriptores, títulos, hora de llegada, ruido fuerte, umbral con el que se clasificó]
+        self.sin_clasificar.setdefault(carpeta, []).append((clave, nombre, [PSD, feats, titulos, llegada, None, None]))
+        umbral = self.umbrales[carpeta].umbral
+
+        if umbral is None:
+            return
+
+        for clave_grab, nombre_grab, grabacion in self.sin_clasificar.pop(carpeta):
+            if grabacion[0] is not None:
+                grabacion[4] = grabacion[0] >= umbral
+                grabacion[5] = umbral
+
+            grabaciones = self.dias.setdefault(clave_grab, {})
+            grabaciones[nombre_grab] = grabacion
+
+            if len(grabaciones) >= self.grabxdia:
+                self.publicar(clave_grab)
+
+    def dudosa(self, grabacion):
+
+        '''
+
+        :param grabacion: recibe la lista que se guarda de cada grabación en su día (ver recibir)
+        :return: True si la PSD de la grabación está a menos del margen de reconciliación del umbral con el que se
+                 clasificó, es decir si el umbral final podría cambiar su clasificación
+        '''
+
+        return grabacion[0] is not None and abs(grabacion[0] - grabacion[5]) <= self.margen * grabacion[5]
+
+    def cerrar_dias(self):
+
+        '''
+
+        Publica los días incompletos que ya no van a recibir grabaciones: los que tienen un día posterior de la misma
+        grabadora y no tienen grabaciones en cálculo, copiándose ni sin clasificar. Las grabaciones pueden llegar en
+        desorden, así que no basta con que llegue una grabación de un día posterior
+
+        :return: None
+        '''
+
+        pendientes = set(clave for grabaciones in self.sin_clasificar.values() for clave, *_ in grabaciones)
+
+        for ruta, datos in list(self.en_calculo.items()) + list(self.candidatas.items()):
+            tabla = tabla_nombres([ruta.split('\\')[-1]])
+            pendientes.add((datos[0], tabla["Codigo"][0], tabla["Dia"][0]))
+
+        ultimos = {}
+
+        for carpeta, codigo, dia in list(self.dias) + list(pendientes):
+            ultimos[(carpeta, codigo)] = max(dia, ultimos.get((carpeta, codigo), dia))
+
+        for clave in sorted(self.dias):
+            if clave[2] < ultimos[clave[:2]] and clave not in pendientes:
+                self.publicar(clave)
+
+    def resumir_dia(self, clave, grabaciones):
+
+        '''
+
+        Arma el registro de un día con la clasificación actual de sus grabaciones
+
+        :param clave: recibe una tupla (carpeta, código, día)
+        :param grabaciones: recibe el diccionario de grabaciones del día (ver recibir)
+        :return: una tupla con el diccionario del día y el DataFrame de descriptores de sus grabaciones buenas (None si
+                 el día no alcanza el mínimo diario)
+        '''
+
+        carpeta, codigo, dia = clave
+        buenas = []
+        titulos = None
+        rechazadas = []
+
+        for nombre, (PSD, feats, titulos_grab, llegada, ruido, umbral) in sorted(grabaciones.items()):
+            if PSD is None:
+                rechazadas.append({"grabacion": nombre, "motivo": "Archivo corrupto"})
+            elif ruido:
+                rechazadas.append({"grabacion": nombre, "motivo": "Ruido Fuerte"})
+            elif feats is None:
+                rechazadas.append({"grabacion": nombre, "motivo": "Archivo discontinuo"})
+            else:
+                buenas.append((nombre, feats))
+                titulos = titulos_grab
+
+        promedios = None
+        valores_df = None
+
+        if buenas and len(buenas) >= self.min_grab:
+            valores_df = pd.DataFrame(np.array([feats for nombre, feats in buenas], dtype=np.float64),
+                                      index=[nombre for nombre, feats in buenas], columns=titulos)
+            promedios = dict(zip(titulos, np.mean(valores_df.values, axis=0).tolist()))
+        else:
+            rechazadas += [{"grabacion": nombre, "motivo": "No alcanza el mínimo diario"} for nombre, feats in buenas]
+
+        umbrales = [grabacion[5] for grabacion in grabaciones.values() if grabacion[5] is not None]
+        registro = {"carpeta": carpeta, "codigo": codigo, "dia": dia, "grabaciones": len(grabaciones),
+                    "buenas": len(buenas), "umbral_lluvia": max(umbrales) if umbrales else None,
+                    "promedios": promedios, "rechazadas": rechazadas, "publicado": time.strftime("%Y-%m-%d %H:%M:%S")}
+        return registro, valores_df
+
+    def escribir_dia(self, registro):
+
+        '''
+
+        Agrega el registro de un día al archivo de días publicados
+
+        :param registro: recibe el diccionario del día (ver resumir_dia)
+        :return: None
+        '''
+
+        with open(self.ruta_publicados, 'a', encoding="utf-8") as archivo:
+            archivo.write(json.dumps(registro, ensure_ascii=False) + "\n")
+
+    def publicar(self, clave):
+
+        '''
+
+        Calcula los promedios de un día con la clasificación de sus grabaciones y los agrega al archivo de días
+        publicados. Si el día tiene grabaciones dudosas se conserva para la reconciliación
+
+        :param clave: recibe una tupla (carpeta, código, día)
+        :return: diccionario con el día publicado
+        '''
+
+        grabaciones = self.dias.pop(clave)
+        self.publicados.add(clave)
+        registro, valores_df = self.resumir_dia(clave, grabaciones)
+        registro["latencia"] = round(time.time() - max(grabacion[3] for grabacion in grabaciones.values()), 3)
+
+        if any(self.dudosa(grabacion) for grabacion in grabaciones.values()):
+            self.por_reconciliar[clave] = grabaciones
+        else:
+            self.registrar_descartado(clave[0], grabaciones)
+
+        if valores_df is not None and self.estadisticas is not None:
+            self.estadisticas.agregar(valores_df, tabla_nombres(valores_df.index.values))
+            self.estadisticas.guardar(self.ruta_estadisticas)
+
+        self.escribir_dia(registro)
+        print("Día " + clave[2] + " de " + clave[1] + " publicado: " + str(registro["buenas"]) +
+              " grabaciones buenas de " + str(registro["grabaciones"]))
+        return registro
+
+    def registrar_descartado(self, carpeta, grabaciones):
+
+        '''
+
+        Guarda el rango de umbrales con que se clasificaron las grabaciones de un día publicado que no se conserva para
+        la reconciliación
+
+        :param carpeta: recibe un str con la carpeta del día
+        :param grabaciones: recibe el diccionario de grabaciones del día (ver recibir)
+        :return: None
+        '''
+
+        umbrales = [grabacion[5] for grabacion in grabaciones.values() if grabacion[5] is not None]
+
+        if umbrales:
+            minimo, maximo = self.umbrales_descartados.get(carpeta, (min(umbrales), max(umbrales)))
+            self.umbrales_descartados[carpeta] = (min(minimo, *umbrales), max(maximo, *umbrales))
+
+    def reconciliar(self):
+
+        '''
+
+        Clasifica de nuevo con el umbral actual de cada carpeta (el final, si ya llegaron todas las grabaciones) las
+        grabaciones de los días abiertos y de los días publicados con grabaciones dudosas. Los días abiertos se
+        publicarán con la nueva clasificación; los días publicados que cambian se publican otra vez con "reconciliado" y
+        la lista de grabaciones que cambiaron, así que de cada día vale el último registro del archivo. Las estadísticas
+        incrementales no se corrigen. Además guarda el umbral de cada carpeta en <ruta de salida>_umbrales.json, que se
+        puede usar como umbral previo de una ejecución posterior.
+
+        Los días publicados sin grabaciones dudosas no se conservan: si el umbral de su carpeta se movió más que el
+        margen desde que se clasificaron, alguna de sus grabaciones podría cambiar y se muestra una advertencia
+
+        :return: entero con el número de grabaciones que cambiaron de clasificación
+        '''
+
+        cambios = 0
+        umbrales = {carpeta: umbral.umbral for carpeta, umbral in self.umbrales.items()}
+
+        for carpeta, (minimo, maximo) in self.umbrales_descartados.items():
+            if umbrales[carpeta] > maximo * (1 + self.margen) or umbrales[carpeta] < minimo * (1 - self.margen):
+                print("Advertencia: el umbral de lluvia de " + carpeta + " cambió más que el margen de reconciliación "
+                      "desde que se publicaron algunos días; sus grabaciones no se revisan")
+
+        for publicados, dias in ((False, self.dias), (True, self.por_reconciliar)):
+            for clave, grabaciones in list(dias.items()):
+
+                final = umbrales[clave[0]]
+                cambiadas = []
+
+                for nombre, grabacion in grabaciones.items():
+                    if grabacion[5] is None:
+                        continue
+                    if (grabacion[0] >= final) != grabacion[4]:
+                        grabacion[4] = grabacion[0] >= final
+                        cambiadas.append(nombre)
+                    grabacion[5] = final
+
+                cambios += len(cambiadas)
+
+                if publicados and cambiadas:
+                    registro, valores_df = self.resumir_dia(clave, grabaciones)
+                    registro["reconciliado"] = True
+                    registro["cambios"] = sorted(cambiadas)
+                    self.escribir_dia(registro)
+                    print("Día " + clave[2] + " de " + clave[1] + " reconciliado: " + str(len(cambiadas)) +
+                          " grabaciones cambiaron de clasificación")
+
+                if publicados and not any(self.dudosa(grabacion) for grabacion in grabaciones.values()):
+                    del self.por_reconciliar[clave]
+                    self.registrar_descartado(clave[0], grabaciones)
+
+        temporal = self.ruta_umbrales + ".tmp"
+
+        with open(temporal, 'w', encoding="utf-8") as archivo:
+            json.dump({carpeta: umbral for carpeta, umbral in umbrales.items() if umbral is not None}, archivo,
+                      ensure_ascii=False, indent=1)
+
+        os.replace(temporal, self.ruta_umbrales)
+        return cambios
+
+    def ciclo(self):
+
+        '''
+
+        Hace una revisión de las carpetas y recibe los resultados terminados
+
+        :return: entero con el número de grabaciones enviadas a calcular
+        '''
+
+        enviadas = self.revisar()
+        self.recoger()
+        self.cerrar_dias()
+
+        #Los resultados de la revisión se escriben en el caché juntos
+        if self.cache is not None:
+            self.cache.confirmar()
+
+        return enviadas
+
+    def vigilar(self, intervalo=INTERVALO_VIGILANCIA, ciclos=None):
+
+        '''
+
+        Revisa las carpetas cada intervalo segundos hasta que se interrumpa (Ctrl+C) o se cumpla el número de ciclos, y
+        al terminar hace la reconciliación (ver reconciliar). Los días sin completar no se publican al terminar: se
+        publican al iniciar de nuevo, cuando se completen. Al interrumpir no se esperan las grabaciones en cálculo (los
+        trabajadores también reciben Ctrl+C); se calculan de nuevo al iniciar
+
+        :param intervalo: recibe un número con los segundos entre revisiones, valor por defecto INTERVALO_VIGILANCIA
+        :param ciclos: recibe un entero opcional con el número de revisiones a hacer, valor por defecto None, sin
+                       límite
+        :return: None
+        '''
+
+        n = 0
+
+        try:
+            while ciclos is None or n < ciclos:
+                inicio = time.time()
+                self.ciclo()
+                n += 1
+                time.sleep(max(0, intervalo - (time.time() - inicio)))
+            self.recoger(esperar=True)
+        except KeyboardInterrupt:
+            print("Vigilancia detenida")
+        finally:
+            cerrar_pool()
+            if self.cache is not None:
+                self.cache.cerrar()
+
+        self.reconciliar()